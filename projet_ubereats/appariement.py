@@ -0,0 +1,113 @@
+# appariement.py
+# Appariement par lots : au lieu de donner chaque course au livreur le plus proche au moment où
+# elle arrive (glouton), on rassemble les courses d'une courte fenêtre et on cherche l'affectation
+# restaurant -> livreur qui minimise la distance d'approche TOTALE.
+#   - matrice_haversine : distances (m) entre n restaurants et m livreurs, vectorisée avec NumPy
+#   - hongrois          : affectation de coût minimal (Kuhn-Munkres, O(n²m)) ; scipy est utilisé
+#                         s'il est installé (linear_sum_assignment), sinon l'implémentation d'ici
+#   - glouton           : référence, chaque course dans l'ordre prend le plus proche encore libre
+# Au-delà de 'distance_max', un couple est interdit : la course reste sans livreur dans ce lot.
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError: # scipy est optionnel
+    linear_sum_assignment = None
+
+RAYON_TERRE_M = 6372797.560856 # Rayon utilisé par Redis pour GEODIST / GEOSEARCH
+DISTANCE_MAX_M = 10000 # Au-delà, une course attend le lot suivant plutôt qu'un livreur lointain
+INTERDIT = 1e12 # Coût des couples hors distance_max (fini : l'algorithme reste bien défini)
+
+
+def matrice_haversine(restaurants, livreurs):
+    """restaurants (n, 2) et livreurs (m, 2) en (lon, lat) degrés -> distances (n, m) en mètres."""
+    restaurants = np.radians(np.asarray(restaurants, dtype=float).reshape(-1, 2))
+    livreurs = np.radians(np.asarray(livreurs, dtype=float).reshape(-1, 2))
+    lon1, lat1 = restaurants[:, 0:1], restaurants[:, 1:2] # Colonnes : diffusion (n, 1) x (m,)
+    lon2, lat2 = livreurs[:, 0], livreurs[:, 1]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAYON_TERRE_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _hongrois_lignes(couts):
+    """Méthode hongroise avec potentiels pour n <= m : colonne choisie pour chaque ligne.
+    Chaque ligne est insérée par un plus court chemin augmentant ; la boucle sur les colonnes
+    est vectorisée (une passe NumPy par colonne ajoutée à l'arbre)."""
+    n, m = couts.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    ligne_de = np.zeros(m + 1, dtype=int) # Colonne j (1..m) -> ligne (1..n), 0 = libre
+    precedent = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        ligne_de[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        vue = np.zeros(m + 1, dtype=bool)
+        while True:
+            vue[j0] = True
+            i0 = ligne_de[j0]
+            libres = ~vue[1:]
+            reduit = couts[i0 - 1] - u[i0] - v[1:]
+            meilleur = libres & (reduit < minv[1:])
+            minv[1:][meilleur] = reduit[meilleur]
+            precedent[1:][meilleur] = j0
+            j1 = int(np.argmin(np.where(libres, minv[1:], np.inf))) + 1
+            delta = minv[j1]
+            vues = np.flatnonzero(vue)
+            u[ligne_de[vues]] += delta
+            v[vues] -= delta
+            minv[1:][libres] -= delta
+            j0 = j1
+            if ligne_de[j0] == 0:
+                break
+        while j0: # Remonte le chemin augmentant
+            j1 = precedent[j0]
+            ligne_de[j0] = ligne_de[j1]
+            j0 = j1
+    colonnes = np.full(n, -1, dtype=int)
+    assignees = np.flatnonzero(ligne_de[1:])
+    colonnes[ligne_de[assignees + 1] - 1] = assignees
+    return colonnes
+
+
+def hongrois(couts):
+    """Affectation de coût total minimal dans une matrice (n, m) quelconque :
+    [(ligne, colonne), ...], min(n, m) couples."""
+    couts = np.asarray(couts, dtype=float)
+    if couts.size == 0:
+        return []
+    if linear_sum_assignment is not None:
+        lignes, colonnes = linear_sum_assignment(couts)
+        return list(zip(lignes.tolist(), colonnes.tolist()))
+    if couts.shape[0] <= couts.shape[1]:
+        return list(enumerate(_hongrois_lignes(couts).tolist()))
+    # Plus de lignes que de colonnes : on affecte les colonnes aux lignes
+    return sorted((int(i), j) for j, i in enumerate(_hongrois_lignes(couts.T)))
+
+
+def glouton(couts):
+    """Référence : lignes dans l'ordre d'arrivée, chacune prend la colonne libre la moins chère."""
+    couts = np.array(couts, dtype=float)
+    couples = []
+    for i in range(couts.shape[0]):
+        if couts.shape[1] == 0:
+            break
+        j = int(np.argmin(couts[i]))
+        if couts[i, j] >= INTERDIT:
+            continue # Aucune colonne libre permise pour cette ligne
+        couples.append((i, j))
+        couts[:, j] = np.inf
+    return couples
+
+
+def apparier(restaurants, livreurs, distance_max=DISTANCE_MAX_M, methode=hongrois, exclus=()):
+    """Couples (course, livreur, distance_m) d'un lot ; les courses sans livreur à moins de
+    'distance_max' n'y figurent pas. 'exclus' : couples (course, livreur) interdits (refus)."""
+    if len(restaurants) == 0 or len(livreurs) == 0:
+        return []
+    distances = matrice_haversine(restaurants, livreurs)
+    couts = np.where(distances <= distance_max, distances, INTERDIT)
+    for i, j in exclus:
+        couts[i, j] = INTERDIT
+    return [(i, j, float(distances[i, j])) for i, j in methode(couts) if couts[i, j] < INTERDIT]
@@ -0,0 +1,103 @@
+# bench_appariement.py
+# Distance d'approche totale et débit d'affectation, pour un lot de n courses et m livreurs libres :
+#   - "glouton"  : chaque course, dans l'ordre d'arrivée, prend le livreur libre le plus proche
+#                  (ce que fait le dispatch actuel quand le plus proche accepte)
+#   - "hongrois" : appariement.py, affectation de coût minimal sur la matrice NumPy (+ sa construction)
+# Hors ligne par défaut. --redis / --mongo mesurent aussi le débit du glouton réel : GEOSEARCH (script
+# de recherche de manager_redis) ou $geoNear, puis retrait du livreur choisi, course après course,
+# sur une clé / collection dédiée.
+#   python bench_appariement.py --tailles 50 200 1000 --ratio 1.5 [--redis] [--mongo]
+import argparse, os, time
+
+import numpy as np
+
+import appariement
+
+CLE_BENCH = "bench:{couriers}:lots"
+COLLECTION_BENCH = "bench_lots_couriers"
+
+
+def points_aleatoires(nb):
+    return np.column_stack([np.random.uniform(2.25, 2.45, nb), np.random.uniform(48.80, 48.90, nb)])
+
+
+def mesurer_hors_ligne(methode, restaurants, livreurs):
+    debut = time.perf_counter()
+    couples = appariement.apparier(restaurants, livreurs, methode=methode)
+    return [d for _, _, d in couples], time.perf_counter() - debut
+
+
+def glouton_redis(restaurants, livreurs):
+    import manager_redis
+    r = manager_redis.r
+    r.delete(CLE_BENCH)
+    r.geoadd(CLE_BENCH, [x for i, (lon, lat) in enumerate(livreurs) for x in (lon, lat, f"bench_c{i}")])
+    distances = []
+    debut = time.perf_counter()
+    for lon, lat in restaurants:
+        candidats, _ = manager_redis.chercher_livreurs_proches(lon, lat, k=1, cle=CLE_BENCH,
+                                                               rayon_depart=appariement.DISTANCE_MAX_M / 1000)
+        for courier_id, distance_m in candidats.items():
+            if distance_m <= appariement.DISTANCE_MAX_M:
+                distances.append(distance_m)
+                r.zrem(CLE_BENCH, courier_id) # Le livreur n'est plus libre
+    duree = time.perf_counter() - debut
+    r.delete(CLE_BENCH)
+    return distances, duree
+
+
+def glouton_mongo(restaurants, livreurs):
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+    load_dotenv()
+    collection = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1')).UberEats[COLLECTION_BENCH]
+    collection.drop()
+    collection.insert_many([{"_id": f"bench_c{i}", "location": {"type": "Point", "coordinates": [lon, lat]}}
+                            for i, (lon, lat) in enumerate(livreurs)])
+    collection.create_index([("location", "2dsphere")])
+    distances = []
+    debut = time.perf_counter()
+    for lon, lat in restaurants:
+        proches = list(collection.aggregate([
+            {"$geoNear": {"near": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+                          "distanceField": "distance_m", "maxDistance": appariement.DISTANCE_MAX_M, "spherical": True}},
+            {"$limit": 1},
+        ]))
+        if proches:
+            distances.append(proches[0]["distance_m"])
+            collection.delete_one({"_id": proches[0]["_id"]})
+    duree = time.perf_counter() - debut
+    collection.drop()
+    return distances, duree
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Appariement par lots (hongrois) vs glouton course par course")
+    parser.add_argument("--tailles", type=int, nargs="+", default=[50, 200, 1000], help="Courses par lot")
+    parser.add_argument("--ratio", type=float, default=1.5, help="Livreurs libres par course")
+    parser.add_argument("--redis", action="store_true", help="Mesurer aussi le glouton GEOSEARCH réel")
+    parser.add_argument("--mongo", action="store_true", help="Mesurer aussi le glouton $geoNear réel")
+    args = parser.parse_args()
+
+    moteur = "scipy" if appariement.linear_sum_assignment else "numpy"
+    print(f"Hongrois : implémentation {moteur} | distance max {appariement.DISTANCE_MAX_M} m")
+    print(f"{'courses':>7} | {'livreurs':>8} | {'méthode':<17} | {'affectées':>9} | {'total km':>9} | "
+          f"{'moy m':>6} | {'ms/lot':>8} | {'affect./s':>9}")
+    print("-" * 95)
+    for taille in args.tailles:
+        restaurants = points_aleatoires(taille)
+        livreurs = points_aleatoires(int(taille * args.ratio))
+        methodes = [
+            ("glouton", lambda: mesurer_hors_ligne(appariement.glouton, restaurants, livreurs)),
+            ("hongrois", lambda: mesurer_hors_ligne(appariement.hongrois, restaurants, livreurs)),
+        ]
+        if args.redis:
+            methodes.append(("glouton geosearch", lambda: glouton_redis(restaurants, livreurs)))
+        if args.mongo:
+            methodes.append(("glouton $geoNear", lambda: glouton_mongo(restaurants, livreurs)))
+        for nom, mesure in methodes:
+            distances, duree = mesure()
+            total = sum(distances)
+            print(f"{taille:>7} | {len(livreurs):>8} | {nom:<17} | {len(distances):>9} | {total / 1000:>9.1f} | "
+                  f"{total / max(1, len(distances)):>6.0f} | {duree * 1000:>8.1f} | {len(distances) / duree:>9.0f}")
@@ -0,0 +1,79 @@
+# bench_codec.py
+# Octets par message et CPU d'encodage/décodage pour 1000 offres (k offres par job) :
+#   - "json_par_livreur" : ancien manager, json.dumps du message complet pour chaque candidat
+#   - "json_gabarit"     : JSON encodé une fois par job, distance ajoutée par livreur (codec json)
+#   - "compact"          : format positionnel de codec.py, encodé une fois par job
+# Hors ligne (pas de Redis) : python bench_codec.py --offres 100000 -k 5
+import argparse, json, random, time, uuid
+
+import codec
+
+
+def annonces_aleatoires(nb):
+    return [{
+        "job_id": str(uuid.uuid4()),
+        "restaurant": f"Restaurant {random.randint(1, 60000)}",
+        "menu_item": random.choice(["Cheeseburger Deluxe", "Pad Thai", "Poke bowl saumon", "Margherita"]),
+        "price": round(random.uniform(5, 30), 2),
+        "reward": round(5 + random.random() * 10, 2),
+        "estimated_time": f"{random.randint(10, 40)} min",
+    } for _ in range(nb)]
+
+
+def encoder_json_par_livreur(annonce, distances):
+    return [json.dumps({"type": "NEW_JOB_OFFER", "distance": d, "annonce": annonce}) for d in distances]
+
+
+def encodeur_gabarit(format_codec):
+    def encoder(annonce, distances):
+        gabarit = codec.gabarit_offre(annonce, format_codec)
+        return [codec.encoder_offre(gabarit, d) for d in distances]
+    return encoder
+
+
+def mesurer(encoder, decoder, annonces, k):
+    distances = [[round(random.uniform(50, 5000), 2) for _ in range(k)] for _ in annonces]
+    debut = time.perf_counter()
+    messages = [m for annonce, d in zip(annonces, distances) for m in encoder(annonce, d)]
+    encodage = time.perf_counter() - debut
+    debut = time.perf_counter()
+    for message in messages:
+        decoder(message)
+    decodage = time.perf_counter() - debut
+    par_mille = 1000 / len(messages) * 1000 # s -> ms pour 1000 offres
+    return {
+        "octets": sum(len(m.encode("utf-8")) for m in messages) / len(messages),
+        "encodage_ms": encodage * par_mille,
+        "decodage_ms": decodage * par_mille,
+    }
+
+
+def octets_autres(format_codec):
+    job_id = str(uuid.uuid4())
+    return {
+        "assignation": len(codec.encoder_assignation(job_id, format_codec)),
+        "perte": len(codec.encoder_perte(job_id, format_codec)),
+        "reponse": len(codec.encoder_reponse("c42", job_id, 1234.56, True, format_codec)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Codec des messages : octets et CPU pour 1000 offres")
+    parser.add_argument("--offres", type=int, default=100000, help="Nombre total d'offres encodées")
+    parser.add_argument("-k", type=int, default=5, help="Offres par job (candidats)")
+    args = parser.parse_args()
+
+    annonces = annonces_aleatoires(max(1, args.offres // args.k))
+    scenarios = {
+        "json_par_livreur": (encoder_json_par_livreur, json.loads, codec.JSON),
+        "json_gabarit": (encodeur_gabarit(codec.JSON), codec.decoder, codec.JSON),
+        "compact": (encodeur_gabarit(codec.COMPACT), codec.decoder, codec.COMPACT),
+    }
+    print(f"{'scénario':<17} | {'offre o':>7} | {'enc. ms/1k':>10} | {'déc. ms/1k':>10} | "
+          f"{'ASSIGNED o':>10} | {'JOB_LOST o':>10} | {'réponse o':>9}")
+    print("-" * 91)
+    for nom, (encoder, decoder, format_codec) in scenarios.items():
+        res = mesurer(encoder, decoder, annonces, args.k)
+        autres = octets_autres(format_codec)
+        print(f"{nom:<17} | {res['octets']:>7.0f} | {res['encodage_ms']:>10.2f} | {res['decodage_ms']:>10.2f} | "
+              f"{autres['assignation']:>10} | {autres['perte']:>10} | {autres['reponse']:>9}")
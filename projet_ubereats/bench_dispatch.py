@@ -0,0 +1,297 @@
+# bench_dispatch.py
+# Banc d'essai Redis (GEO + Pub/Sub) vs MongoDB ($geoNear + change streams) sur le cycle
+# complet d'une course : le manager (fonctions de manager_*.py, une course par thread) et
+# une flotte simulée (flotte.py) tournent dans le même processus, sur la même horloge.
+# Mesures par point de balayage :
+#   - offre : création de la course -> réception de l'offre par le livreur
+#   - acceptation -> assignation : envoi de l'acceptation -> réception de ASSIGNED
+#   - courses/s terminées, CPU (%) et mémoire résidente du serveur
+# Prérequis : redis-server et un mongod en replica set mono-nœud locaux, catalogue chargé
+# (chargement_catalogue.py). Utiliser des serveurs dédiés : les livreurs "bench*" y sont créés.
+#   python bench_dispatch.py --livreurs 100 1000 --taux 5 20 -k 3 5 --duree 30
+import os, io, sys, json, time, uuid, random, asyncio, argparse, itertools, contextlib
+from datetime import datetime
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+
+from politiques import PREMIER_ACCEPTE, POLITIQUES
+from transport_redis import PUBSUB
+from zones import retirer_livreurs
+
+URI_MONGO_DEFAUT = "mongodb://localhost:27017/?replicaSet=rs0"
+
+
+class Mesures:
+    """Horodatages (time.perf_counter) relevés par le manager et par la flotte."""
+
+    def __init__(self):
+        self.creations = {} # job_id -> début de la création de la course
+        self.receptions = [] # (job_id, instant de réception de l'offre)
+        self.acceptations = {} # (job_id, courier_id) -> envoi de l'acceptation
+        self.assignations = [] # (job_id, courier_id, réception de ASSIGNED)
+        self.issues = {"assignee": 0, "expiree": 0, "sans_livreur": 0, "erreur": 0}
+
+    def latences_offre(self):
+        return [t - self.creations[job_id] for job_id, t in self.receptions if job_id in self.creations]
+
+    def latences_assignation(self):
+        return [t - self.acceptations[(job_id, courier_id)] for job_id, courier_id, t in self.assignations
+                if (job_id, courier_id) in self.acceptations]
+
+
+def _job_id(offre):
+    # Redis : {"type": "NEW_JOB_OFFER", "annonce": {...}} ; Mongo : le document 'bids'
+    return offre["job_id"] if "job_id" in offre else offre["annonce"]["job_id"]
+
+
+def flotte_instrumentee(classe, mesures):
+    class FlotteInstrumentee(classe):
+        async def traiter_offre(self, livreur, offre):
+            mesures.receptions.append((_job_id(offre), time.perf_counter()))
+            await super().traiter_offre(livreur, offre)
+
+        async def repondre(self, livreur, offre, accepte):
+            if accepte:
+                mesures.acceptations[(_job_id(offre), livreur.id)] = time.perf_counter()
+            return await super().repondre(livreur, offre, accepte)
+
+        async def traiter_assignation(self, livreur, job_id):
+            mesures.assignations.append((job_id, livreur.id, time.perf_counter()))
+            await super().traiter_assignation(livreur, job_id)
+
+    return FlotteInstrumentee
+
+
+# --- Un cycle de course complet, comme le main de chaque manager ---
+def course_redis(mr, mesures, fenetre, politique):
+    job_id = str(uuid.uuid4())
+    mesures.creations[job_id] = time.perf_counter()
+    # La flotte simulée écoute en Pub/Sub (une souscription par motif pour tous les livreurs)
+    job_id, candidats = mr.publier_annonce_geo(job_id, transport=PUBSUB)
+    if not candidats:
+        return "sans_livreur"
+    gagnant = mr.attendre_acceptation(job_id, candidats, duree=fenetre, politique=politique, transport=PUBSUB)
+    gagnant = mr.notifier_selection(job_id, gagnant, candidats.keys(), transport=PUBSUB)
+    return "assignee" if gagnant else "expiree"
+
+
+def course_mongo(mm, mesures, fenetre, politique):
+    debut = time.perf_counter()
+    restaurant, menu = mm.choisir_restaurant_et_menu()
+    job_id, offres_ids, cibles = mm.offrir_course_aux_livreurs_proches(restaurant, menu)
+    if not job_id:
+        return "sans_livreur"
+    # job_id n'est connu qu'ici : l'offre peut déjà être reçue, d'où l'appariement à la fin
+    mesures.creations[job_id] = debut
+    gagnant = mm.attendre_acceptations(job_id, offres_ids, cibles, duree=fenetre, politique=politique)
+    if gagnant:
+        mm.notifier_selection(job_id, gagnant["courier_id"], cibles)
+    else:
+        mm.notifier_selection(job_id, None, cibles, status_echec="EXPIRED")
+    return "assignee" if gagnant else "expiree"
+
+
+# --- Sonde CPU / mémoire du serveur ---
+def _cpu_proc(pid):
+    """Temps CPU (s) d'un processus local via /proc, None s'il n'est pas visible."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            champs = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return (int(champs[11]) + int(champs[12])) / os.sysconf("SC_CLK_TCK") # utime + stime
+
+
+def lecteur_redis(client):
+    def lire():
+        info = client.info()
+        return info["used_cpu_sys"] + info["used_cpu_user"], info["used_memory_rss"]
+    return lire
+
+
+def lecteur_mongo(db):
+    def lire():
+        status = db.command("serverStatus")
+        cpu = _cpu_proc(status["pid"])
+        extra = status.get("extra_info", {})
+        if cpu is None and "user_time_us" in extra:
+            cpu = (extra["user_time_us"] + extra["system_time_us"]) / 1e6
+        return cpu, status["mem"]["resident"] * 1024 * 1024
+    return lire
+
+
+class SondeServeur:
+    """Échantillonne le serveur pendant un point : CPU moyen (%) et RSS max."""
+
+    def __init__(self, lire, periode=0.5):
+        self.lire = lire
+        self.periode = periode
+        self.fin = Event()
+        self.rss_max = 0
+        self.cpu_debut = self.cpu_fin = None
+        self.debut = self.duree = 0.0
+        self.thread = Thread(target=self._boucle, daemon=True)
+
+    def _boucle(self):
+        while not self.fin.wait(self.periode):
+            self.rss_max = max(self.rss_max, self.lire()[1])
+
+    def demarrer(self):
+        self.cpu_debut, self.rss_max = self.lire()
+        self.debut = time.perf_counter()
+        self.thread.start()
+
+    def arreter(self):
+        self.fin.set()
+        self.thread.join()
+        self.cpu_fin, rss = self.lire()
+        self.duree = time.perf_counter() - self.debut
+        self.rss_max = max(self.rss_max, rss)
+
+    def resultat(self):
+        cpu = None
+        if self.cpu_debut is not None and self.cpu_fin is not None:
+            cpu = 100 * (self.cpu_fin - self.cpu_debut) / self.duree
+        return {"cpu_pct": cpu, "rss_max_mo": self.rss_max / 1024 / 1024}
+
+
+def percentiles(valeurs):
+    """Latences en s -> {n, p50, p95, p99, max} en ms."""
+    if not valeurs:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    valeurs = sorted(valeurs)
+    rang = lambda p: valeurs[int(p * (len(valeurs) - 1))] * 1000
+    return {"n": len(valeurs), "p50": rang(0.50), "p95": rang(0.95), "p99": rang(0.99), "max": valeurs[-1] * 1000}
+
+
+# --- Un point de balayage ---
+async def mesurer_point(backend, nb_livreurs, taux, k, args):
+    import flotte
+    mesures = Mesures()
+    if backend == "redis":
+        import manager_redis as manager
+        classe, course, lire = flotte.FlotteRedis, course_redis, lecteur_redis(manager.r)
+        manager.duree_fenetre = args.fenetre # Annoncée aux livreurs dans chaque offre
+    else:
+        import manager_mongo as manager
+        classe, course, lire = flotte.FlotteMongo, course_mongo, lecteur_mongo(manager.db)
+    manager.NB_CANDIDATS = k
+    if backend == "mongo":
+        from schema_mongo import creer_index, exiger_plans_indexes
+        # Base neuve : sans l'index (status, location) du $geoNear, toutes les courses échoueraient
+        await asyncio.get_running_loop().run_in_executor(None, creer_index, manager.db)
+        await asyncio.get_running_loop().run_in_executor(None, exiger_plans_indexes, manager.db)
+        # Flux d'acceptations ouvert AVANT la première course (sinon ouvert à la première attente,
+        # et les acceptations arrivées avant le watch seraient perdues)
+        await asyncio.get_running_loop().run_in_executor(None, manager._flux)
+
+    livreurs = flotte_instrumentee(classe, mesures)(
+        nb_livreurs, prefixe="bench", p_accept=args.p_accept, p_refus=args.p_refus,
+        reflexion=args.reflexion, livraison=args.livraison)
+    tache_flotte = asyncio.create_task(livreurs.executer())
+    while not livreurs.taches: # La flotte lance ses boucles une fois les positions écrites
+        if tache_flotte.done():
+            tache_flotte.result() # Remonte l'erreur de démarrage
+        await asyncio.sleep(0.05)
+
+    loop = asyncio.get_running_loop()
+    archiveur = None
+    if backend == "redis": # Comme les managers : les jobs terminés partent à l'archivage
+        from cycle_jobs import Archiveur
+        archiveur = Archiveur(manager.r).demarrer()
+    sonde = SondeServeur(lire)
+    await loop.run_in_executor(None, sonde.demarrer)
+    executor = ThreadPoolExecutor(max_workers=args.threads)
+    courses = []
+    debut = time.perf_counter()
+    while time.perf_counter() - debut < args.duree:
+        courses.append(loop.run_in_executor(executor, course, manager, mesures, args.fenetre, args.politique))
+        await asyncio.sleep(random.expovariate(taux)) # Arrivées de Poisson
+    for issue in await asyncio.gather(*courses, return_exceptions=True):
+        mesures.issues[issue if isinstance(issue, str) else "erreur"] += 1
+    ecoule = time.perf_counter() - debut
+    await loop.run_in_executor(None, sonde.arreter)
+    executor.shutdown()
+    if archiveur:
+        await loop.run_in_executor(None, archiveur.arreter)
+
+    await asyncio.sleep(0.5) # Dernières assignations en vol
+    tache_flotte.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await tache_flotte
+
+    # Les livreurs du banc ne doivent pas rester candidats pour le point suivant
+    ids = list(livreurs.livreurs)
+    if backend == "redis":
+        retirer_livreurs(manager.r, ids) # Index global et index des zones
+    else:
+        manager.couriers_coll.delete_many({"_id": {"$in": ids}})
+
+    terminees = mesures.issues["assignee"] + mesures.issues["expiree"]
+    return {
+        "backend": backend, "livreurs": nb_livreurs, "taux": taux, "k": k,
+        "courses": len(courses), **mesures.issues,
+        "courses_s": terminees / ecoule,
+        "offre_ms": percentiles(mesures.latences_offre()),
+        "assignation_ms": percentiles(mesures.latences_assignation()),
+        "serveur": sonde.resultat(),
+    }
+
+
+def _ms(valeur):
+    return f"{valeur:.1f}" if valeur is not None else "-"
+
+
+def afficher_tableau(resultats):
+    entete = (f"{'backend':<7} | {'livr.':>5} | {'taux':>5} | {'k':>2} | {'crs/s':>6} | "
+              f"{'offre p50/p95/p99 ms':>22} | {'accept->assign p50/p95/p99':>26} | {'CPU %':>6} | {'RSS Mo':>7}")
+    print(entete)
+    print("-" * len(entete))
+    for res in resultats:
+        o, a, s = res["offre_ms"], res["assignation_ms"], res["serveur"]
+        print(f"{res['backend']:<7} | {res['livreurs']:>5} | {res['taux']:>5g} | {res['k']:>2} | {res['courses_s']:>6.2f} | "
+              f"{_ms(o['p50']) + '/' + _ms(o['p95']) + '/' + _ms(o['p99']):>22} | "
+              f"{_ms(a['p50']) + '/' + _ms(a['p95']) + '/' + _ms(a['p99']):>26} | "
+              f"{_ms(s['cpu_pct']):>6} | {s['rss_max_mo']:>7.1f}")
+
+
+async def balayer(args):
+    resultats = []
+    for backend, nb_livreurs, taux, k in itertools.product(args.backends, args.livreurs, args.taux, args.k):
+        print(f"[Bench] {backend} : {nb_livreurs} livreurs, {taux:g} courses/s, k={k}, {args.duree:g}s...")
+        journal = sys.stdout if args.verbeux else io.StringIO()
+        with contextlib.redirect_stdout(journal): # Les managers et la flotte sont bavards
+            resultats.append(await mesurer_point(backend, nb_livreurs, taux, k, args))
+    return resultats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc d'essai du dispatch Redis vs MongoDB")
+    parser.add_argument("--backends", nargs="+", choices=["redis", "mongo"], default=["redis", "mongo"])
+    parser.add_argument("--livreurs", type=int, nargs="+", default=[500], help="Tailles de flotte à balayer")
+    parser.add_argument("--taux", type=float, nargs="+", default=[5.0], help="Arrivées de courses par seconde")
+    parser.add_argument("-k", type=int, nargs="+", default=[5], help="Nombres de candidats par course")
+    parser.add_argument("--duree", type=float, default=30, help="Durée d'arrivée des courses par point (s)")
+    parser.add_argument("--politique", choices=POLITIQUES, default=PREMIER_ACCEPTE,
+                        help="'premier' par défaut : la latence d'assignation ne dépend que du transport")
+    parser.add_argument("--fenetre", type=float, default=5, help="Fenêtre d'acceptation (s)")
+    parser.add_argument("--p-accept", type=float, default=0.9)
+    parser.add_argument("--p-refus", type=float, default=0.05)
+    parser.add_argument("--reflexion", type=float, nargs=2, default=(0.2, 0.5), metavar=("MIN", "MAX"))
+    parser.add_argument("--livraison", type=float, nargs=2, default=(2, 5), metavar=("MIN", "MAX"))
+    parser.add_argument("--threads", type=int, default=64, help="Courses traitées en parallèle au maximum")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGODB_URI_BENCH", URI_MONGO_DEFAUT))
+    parser.add_argument("--json", default="bench_dispatch.json", help="Fichier de résultats")
+    parser.add_argument("--verbeux", action="store_true", help="Garder les logs des managers et de la flotte")
+    args = parser.parse_args()
+
+    # manager_mongo et livreur_mongo se connectent à l'import (load_dotenv n'écrase pas cette valeur)
+    os.environ["MONGODB_URI"] = args.mongo_uri
+
+    resultats = asyncio.run(balayer(args))
+    print()
+    afficher_tableau(resultats)
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump({"date": datetime.now().isoformat(timespec="seconds"), "parametres": vars(args),
+                   "resultats": resultats}, f, indent=2)
+    print(f"\n[Bench] Résultats écrits dans {args.json}")
@@ -0,0 +1,91 @@
+# bench_geosearch.py
+# Micro-benchmark : GEORADIUS 1000 km (ancien appel) vs recherche adaptative GEOSEARCH
+# sur 1k, 10k et 100k livreurs. Utilise une clé dédiée pour ne pas toucher aux vrais livreurs.
+import argparse, random, statistics, time
+
+import manager_redis
+from manager_redis import r
+
+CLE_BENCH = "bench:{couriers}:locations" # Même slot que {couriers}:heartbeat et :status (recherche Lua)
+
+
+def peupler(cle, nb_livreurs):
+    r.delete(cle)
+    lot = []
+    for i in range(nb_livreurs):
+        lot += [round(random.uniform(2.25, 2.45), 6), round(random.uniform(48.80, 48.90), 6), f"bench_c{i}"]
+        if len(lot) >= 3 * 10000:
+            r.geoadd(cle, lot)
+            lot = []
+    if lot:
+        r.geoadd(cle, lot)
+
+
+def restaurants_aleatoires(nb):
+    return [(random.uniform(2.25, 2.45), random.uniform(48.80, 48.90)) for _ in range(nb)]
+
+
+def stats_serveur(commande):
+    """Temps moyen côté serveur (µs) et nombre d'appels, d'après INFO commandstats."""
+    info = r.info("commandstats").get(f"cmdstat_{commande}", {})
+    return info.get("usec_per_call", 0.0), info.get("calls", 0)
+
+
+def mesurer(fonction, points):
+    latences = []
+    for lon, lat in points:
+        debut = time.perf_counter()
+        fonction(lon, lat)
+        latences.append((time.perf_counter() - debut) * 1e6)
+    latences.sort()
+    return {
+        "moy_us": statistics.mean(latences),
+        "p99_us": latences[int(0.99 * (len(latences) - 1))],
+        "ops_s": len(latences) / (sum(latences) / 1e6),
+    }
+
+
+def georadius_actuel(cle):
+    def appel(lon, lat):
+        return r.georadius(cle, lon, lat, 1000, unit="km", withdist=True, sort="ASC", count=manager_redis.NB_CANDIDATS)
+    return appel
+
+
+def geosearch_adaptatif(cle, memoire):
+    def appel(lon, lat):
+        depart = manager_redis.rayon_initial(lon, lat) if memoire else manager_redis.RAYON_MIN_KM
+        candidats, rayon = manager_redis.chercher_livreurs_proches(lon, lat, depart, cle=cle)
+        if memoire:
+            manager_redis.memoriser_rayon(lon, lat, depart, rayon)
+        return candidats
+    return appel
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GEORADIUS 1000 km vs GEOSEARCH adaptatif")
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requetes", type=int, default=2000)
+    parser.add_argument("--cle", default=CLE_BENCH, help="Clé GEO utilisée (vidée à chaque taille !)")
+    args = parser.parse_args()
+
+    print(f"{'livreurs':>9} | {'méthode':<22} | {'moy µs':>8} | {'p99 µs':>8} | {'ops/s':>8} | {'serveur µs':>10} | {'GEO/req':>7}")
+    print("-" * 92)
+    for taille in args.tailles:
+        peupler(args.cle, taille)
+        points = restaurants_aleatoires(args.requetes)
+        manager_redis.rayons_par_zone.clear()
+
+        methodes = [
+            ("georadius 1000 km", georadius_actuel(args.cle), "georadius"),
+            ("geosearch (froid)", geosearch_adaptatif(args.cle, memoire=False), "geosearch"),
+            ("geosearch (mémoire)", geosearch_adaptatif(args.cle, memoire=True), "geosearch"),
+        ]
+        for nom, fonction, commande in methodes:
+            fonction(*points[0]) # Chauffe (chargement du script, connexion)
+            r.config_resetstat()
+            res = mesurer(fonction, points)
+            usec, appels = stats_serveur(commande)
+            print(f"{taille:>9} | {nom:<22} | {res['moy_us']:>8.0f} | {res['p99_us']:>8.0f} | "
+                  f"{res['ops_s']:>8.0f} | {usec:>10.1f} | {appels / len(points):>7.2f}")
+
+    r.delete(args.cle)
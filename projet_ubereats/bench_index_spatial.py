@@ -0,0 +1,152 @@
+# bench_index_spatial.py
+# Index spatial en mémoire (index_spatial.py) face aux requêtes serveur, pour un lot de restaurants :
+#   - cohérence : mêmes k plus proches (ids) et mêmes distances que la référence ;
+#   - débit     : requêtes/s d'UN appel k_plus_proches sur tout le lot, contre une requête serveur
+#                 par course (script de recherche de manager_redis, ou $geoNear).
+# Hors ligne, la référence est le calcul exhaustif NumPy. --redis / --mongo chargent l'index depuis
+# une clé / collection dédiée (sources de index_spatial.py) et comparent au serveur.
+#   python bench_index_spatial.py --livreurs 1000 10000 100000 --requetes 2000 [--redis] [--mongo]
+import argparse, os, time
+
+import numpy as np
+
+from appariement import matrice_haversine
+from index_spatial import IndexSpatial, SourceRedis, SourceMongo, NB_VOISINS
+
+CLE_BENCH = "bench:{couriers}:index"
+CLE_BENCH_BATTEMENTS = "bench:{couriers}:index:heartbeat"
+COLLECTION_BENCH = "bench_index_couriers"
+TOLERANCE_M = 1.0 # Arrondis (Redis : cm ; Mongo : rayon terrestre légèrement différent, cf. comparer)
+
+
+def points_aleatoires(nb):
+    return np.column_stack([np.random.uniform(2.25, 2.45, nb), np.random.uniform(48.80, 48.90, nb)])
+
+
+def comparer(index_res, reference, tolerance_relative=0.0):
+    """Proportion de requêtes dont les k plus proches sont identiques, et écart de distance max (m).
+    Deux livreurs à égale distance peuvent être rangés différemment : on compare les distances
+    rang par rang, puis les ids quand les distances ne sont pas à égalité."""
+    identiques, ecart_max = 0, 0.0
+    for obtenus, attendus in zip(index_res, reference):
+        if len(obtenus) != len(attendus):
+            continue
+        ecarts = [abs(a[1] - b[1]) for a, b in zip(obtenus, attendus)]
+        ecart_max = max([ecart_max, *ecarts])
+        tolerance = [TOLERANCE_M + tolerance_relative * b[1] for b in attendus]
+        if all(e <= t for e, t in zip(ecarts, tolerance)) and \
+                ({c for c, _ in obtenus} == {c for c, _ in attendus} or len(set(d for _, d in attendus)) < len(attendus)):
+            identiques += 1
+    return identiques / max(1, len(reference)), ecart_max
+
+
+def reference_numpy(livreurs, restaurants, k, taille_bloc=100):
+    """Calcul exhaustif, par blocs de restaurants (une matrice 2000 x 100k ne tient pas en mémoire)."""
+    reference = []
+    for debut in range(0, len(restaurants), taille_bloc):
+        distances = matrice_haversine(restaurants[debut:debut + taille_bloc], livreurs)
+        proches = np.argsort(distances, axis=1)[:, :k]
+        reference += [[(f"bench_c{j}", round(float(distances[i, j]), 2)) for j in ligne] for i, ligne in enumerate(proches)]
+    return reference
+
+
+def index_hors_ligne(livreurs):
+    index = IndexSpatial()
+    maintenant = time.time()
+    for i, (lon, lat) in enumerate(livreurs):
+        index.maj(f"bench_c{i}", lon, lat, maintenant)
+    return index
+
+
+def index_redis(livreurs):
+    import manager_redis
+    r = manager_redis.r
+    r.delete(CLE_BENCH, CLE_BENCH_BATTEMENTS)
+    maintenant = r.time()[0]
+    for debut in range(0, len(livreurs), 10000):
+        lot = range(debut, min(debut + 10000, len(livreurs)))
+        r.geoadd(CLE_BENCH, [x for i in lot for x in (*livreurs[i], f"bench_c{i}")])
+        r.zadd(CLE_BENCH_BATTEMENTS, {f"bench_c{i}": maintenant for i in lot})
+    index = IndexSpatial(SourceRedis(r, cle=CLE_BENCH, cle_battements=CLE_BENCH_BATTEMENTS))
+    index.source.charger(index) # Chargement seul : les positions du banc ne bougent pas
+
+    def requete(lon, lat, k):
+        candidats, _ = manager_redis.chercher_livreurs_proches(lon, lat, k=k, cle=CLE_BENCH)
+        return sorted(candidats.items(), key=lambda c: c[1])
+
+    def nettoyer():
+        r.delete(CLE_BENCH, CLE_BENCH_BATTEMENTS)
+    return index, requete, nettoyer
+
+
+def index_mongo(livreurs):
+    from datetime import datetime
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+    load_dotenv()
+    collection = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1')).UberEats[COLLECTION_BENCH]
+    collection.drop()
+    maintenant = datetime.utcnow()
+    collection.insert_many([{"_id": f"bench_c{i}", "status": "available", "updatedAt": maintenant,
+                             "location": {"type": "Point", "coordinates": [float(lon), float(lat)]}}
+                            for i, (lon, lat) in enumerate(livreurs)])
+    collection.create_index([("location", "2dsphere")])
+    index = IndexSpatial(SourceMongo(collection))
+    index.source.charger(index)
+
+    def requete(lon, lat, k):
+        return [(doc["_id"], round(doc["distance_m"], 2)) for doc in collection.aggregate([
+            {"$geoNear": {"near": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+                          "distanceField": "distance_m", "query": {"status": "available"}, "spherical": True}},
+            {"$limit": k},
+            {"$project": {"distance_m": 1}},
+        ])]
+
+    return index, requete, collection.drop
+
+
+def mesurer(nom, taille, index, restaurants, k, reference, duree_reference, tolerance_relative=0.0):
+    index.k_plus_proches(restaurants[:1], k) # Grille construite hors mesure (comme en régime établi)
+    debut = time.perf_counter()
+    resultats = index.k_plus_proches(restaurants, k)
+    duree = time.perf_counter() - debut
+    identiques, ecart = comparer(resultats, reference, tolerance_relative)
+    print(f"{taille:>9} | {nom:<8} | {len(restaurants) / duree_reference:>10.0f} | {len(restaurants) / duree:>10.0f} | "
+          f"{duree_reference / duree:>6.1f}x | {identiques * 100:>9.1f}% | {ecart:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index spatial en mémoire vs requêtes serveur")
+    parser.add_argument("--livreurs", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--requetes", type=int, default=2000, help="Restaurants du lot")
+    parser.add_argument("-k", type=int, default=NB_VOISINS)
+    parser.add_argument("--redis", action="store_true", help="Comparer au script GEOSEARCH de manager_redis")
+    parser.add_argument("--mongo", action="store_true", help="Comparer à $geoNear")
+    args = parser.parse_args()
+
+    print(f"{'livreurs':>9} | {'référence':<8} | {'réf. req/s':>10} | {'index req/s':>10} | {'gain':>7} | "
+          f"{'identiques':>10} | {'écart m':>8}")
+    print("-" * 82)
+    for taille in args.livreurs:
+        livreurs = points_aleatoires(taille)
+        restaurants = points_aleatoires(args.requetes)
+
+        debut = time.perf_counter()
+        reference = reference_numpy(livreurs, restaurants, args.k)
+        mesurer("numpy", taille, index_hors_ligne(livreurs), restaurants, args.k, reference,
+                time.perf_counter() - debut)
+
+        serveurs = [("redis", index_redis, 0.0)] if args.redis else []
+        if args.mongo:
+            serveurs.append(("mongo", index_mongo, 0.002)) # Rayon terrestre de Mongo : ~0,1 % d'écart
+        for nom, preparer, tolerance_relative in serveurs:
+            index, requete, nettoyer = preparer(livreurs)
+            try:
+                requete(*restaurants[0], args.k) # Chauffe (chargement du script, connexion)
+                debut = time.perf_counter()
+                reference = [requete(lon, lat, args.k) for lon, lat in restaurants]
+                mesurer(nom, taille, index, restaurants, args.k, reference, time.perf_counter() - debut,
+                        tolerance_relative)
+            finally:
+                nettoyer()
@@ -0,0 +1,91 @@
+# bench_mongo_ecritures.py
+# Latence des écritures d'une course, avant/après le passage en lots :
+#   - "sequentiel"  : insert_one(job) + k x insert_one(bid), puis update_one + 2 x update_many
+#   - "lots"        : insert_one(job) + insert_many(bids), puis update_one + 1 bulk_write ordonné
+#   - "transaction" : "lots" dans une transaction (replica set requis)
+# À lancer contre un replica set local, ex. : mongod --replSet rs0 puis rs.initiate()
+import argparse, os, statistics, time, uuid
+from datetime import datetime
+from pymongo import MongoClient, UpdateMany
+from schema_mongo import creer_index
+
+URI_DEFAUT = "mongodb://localhost:27017/?replicaSet=rs0"
+
+
+def nouvelle_course(k):
+    job_id = str(uuid.uuid4())
+    job = {"_id": job_id, "pickup": "Restaurant bench", "dropoff": "Client bench", "reward": 10.0,
+           "status": "PENDING", "selectedCourier": None, "createdAt": datetime.utcnow()}
+    offres = [{"_id": str(uuid.uuid4()), "job_id": job_id, "targetCourier": f"c{i}", "status": "OFFERED",
+               "distance_m": 100.0 * i, "ts_offer": datetime.utcnow()} for i in range(k)]
+    return job, offres
+
+
+def sequentiel(db, job, offres):
+    db.jobs.insert_one(job)
+    for offre in offres:
+        db.bids.insert_one(offre)
+    ids = [o["targetCourier"] for o in offres]
+    gagnant = ids[0]
+    db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "ASSIGNED", "selectedCourier": gagnant}})
+    db.bids.update_many({"job_id": job["_id"], "targetCourier": gagnant}, {"$set": {"status": "WON"}})
+    db.bids.update_many({"job_id": job["_id"], "targetCourier": {"$in": ids, "$ne": gagnant}}, {"$set": {"status": "LOST"}})
+
+
+def creer_en_lot(db, job, offres, session=None):
+    db.jobs.insert_one(job, session=session)
+    db.bids.insert_many(offres, ordered=False, session=session)
+
+
+def resoudre_en_lot(db, job, offres, session=None):
+    ids = [o["targetCourier"] for o in offres]
+    gagnant = ids[0]
+    db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "ASSIGNED", "selectedCourier": gagnant}}, session=session)
+    db.bids.bulk_write([
+        UpdateMany({"job_id": job["_id"], "targetCourier": gagnant}, {"$set": {"status": "WON"}}),
+        UpdateMany({"job_id": job["_id"], "targetCourier": {"$in": ids, "$ne": gagnant}}, {"$set": {"status": "LOST"}}),
+    ], ordered=True, session=session)
+
+
+def mesurer(client, db, scenario, nb, k):
+    latences = []
+    for _ in range(nb):
+        job, offres = nouvelle_course(k)
+        debut = time.perf_counter()
+        if scenario == "sequentiel":
+            sequentiel(db, job, offres)
+        elif scenario == "lots":
+            creer_en_lot(db, job, offres)
+            resoudre_en_lot(db, job, offres)
+        else:
+            # Comme manager_mongo : création et résolution sont deux transactions distinctes
+            with client.start_session() as session:
+                session.with_transaction(lambda s: creer_en_lot(db, job, offres, s))
+                session.with_transaction(lambda s: resoudre_en_lot(db, job, offres, s))
+        latences.append((time.perf_counter() - debut) * 1000)
+    latences.sort()
+    return {
+        "p50_ms": statistics.median(latences),
+        "p95_ms": latences[int(0.95 * (len(latences) - 1))],
+        "moy_ms": statistics.mean(latences),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence des écritures Mongo par course")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI_BENCH", URI_DEFAUT))
+    parser.add_argument("--courses", type=int, default=500)
+    parser.add_argument("-k", type=int, default=5, help="Nombre d'offres par course")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client.UberEatsBench # Base dédiée, supprimée à la fin
+    creer_index(db, ["bids"])
+
+    print(f"{'scénario':<12} | {'moy ms':>7} | {'p50 ms':>7} | {'p95 ms':>7}")
+    print("-" * 44)
+    for scenario in ("sequentiel", "lots", "transaction"):
+        res = mesurer(client, db, scenario, args.courses, args.k)
+        print(f"{scenario:<12} | {res['moy_ms']:>7.2f} | {res['p50_ms']:>7.2f} | {res['p95_ms']:>7.2f}")
+
+    client.drop_database("UberEatsBench")
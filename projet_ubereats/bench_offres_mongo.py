@@ -0,0 +1,110 @@
+# bench_offres_mongo.py
+# Taille des événements reçus par un livreur et latence réception -> acceptation, avant/après
+# le résumé du job dans les offres et les $project des change streams :
+#   - "avant" : offre sans résumé, flux non projetés ; le livreur relit 'jobs' pour chaque offre
+#   - "apres" : offre avec résumé (manager_mongo.resume_job), flux projetés (passerelle_mongo)
+# Tailles = BSON des événements tels que reçus (offre, résultat LOST, assignation).
+# À lancer contre un replica set local, ex. : mongod --replSet rs0 puis rs.initiate()
+import argparse, os, statistics, time, uuid
+from datetime import datetime
+import bson
+from pymongo import MongoClient
+
+from manager_mongo import resume_job
+from passerelle_mongo import CHAMPS_OFFRE, CHAMPS_RESULTAT, CHAMPS_ASSIGNATION, projection
+
+URI_DEFAUT = "mongodb://localhost:27017/?replicaSet=rs0"
+COURIER = "bench_offres"
+
+
+def nouvelle_course(avec_resume):
+    job_id = str(uuid.uuid4())
+    job = {"_id": job_id, "pickup": "Restaurant bench (12 rue de Rivoli)", "dropoff": "Client bench",
+           "reward": 10.0, "restaurant_id": "r_bench", "restaurant_location": [2.35, 48.85],
+           "menu_item": "Menu bench", "menu_id": "m_bench", "status": "PENDING",
+           "selectedCourier": None, "createdAt": datetime.utcnow()}
+    offre = {"_id": str(uuid.uuid4()), "job_id": job_id, "targetCourier": COURIER, "status": "OFFERED",
+             "distance_m": 123.45, "ts_offer": datetime.utcnow()}
+    if avec_resume:
+        offre["job"] = resume_job(job)
+    return job, offre
+
+
+def ouvrir_flux(db, projete):
+    """Les 3 flux de livreur_mongo.py, avec ou sans $project."""
+    def pipeline(match, champs):
+        return [{"$match": match}] + ([projection(champs)] if projete else [])
+    offres = db.bids.watch(pipeline({"operationType": "insert", "fullDocument.targetCourier": COURIER},
+                                    CHAMPS_OFFRE))
+    resultats = db.bids.watch(pipeline({"operationType": "update", "fullDocument.targetCourier": COURIER,
+                                        "fullDocument.status": "LOST"}, CHAMPS_RESULTAT),
+                              full_document="updateLookup")
+    assignations = db.jobs.watch(pipeline({"operationType": "update", "fullDocument.selectedCourier": COURIER},
+                                          CHAMPS_ASSIGNATION), full_document="updateLookup")
+    return offres, resultats, assignations
+
+
+def mesurer(db, scenario, nb):
+    apres = scenario == "apres"
+    flux_offres, flux_resultats, flux_assignations = ouvrir_flux(db, projete=apres)
+    tailles = {"offre": [], "resultat": [], "assignation": []}
+    acheminement, reception_acceptation = [], []
+    try:
+        for _ in range(nb):
+            job, offre = nouvelle_course(avec_resume=apres)
+            db.jobs.insert_one(job)
+            envoi = time.perf_counter()
+            db.bids.insert_one(offre)
+
+            # Côté livreur : comme livreur_mongo.traiter_offre, sans la réflexion simulée
+            change = next(flux_offres)
+            recu = time.perf_counter()
+            doc = change["fullDocument"]
+            details = doc.get("job") or db.jobs.find_one({"_id": doc["job_id"]})
+            assert details["pickup"]
+            db.bids.update_one({"_id": doc["_id"]}, {"$set": {"status": "ACCEPTED", "ts": datetime.utcnow()}})
+            accepte = time.perf_counter()
+            acheminement.append((recu - envoi) * 1000)
+            reception_acceptation.append((accepte - recu) * 1000)
+            tailles["offre"].append(len(bson.encode(change)))
+
+            # Événements suivants de la course : seule leur taille nous intéresse
+            db.bids.update_one({"_id": offre["_id"]}, {"$set": {"status": "LOST"}})
+            tailles["resultat"].append(len(bson.encode(next(flux_resultats))))
+            db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "ASSIGNED", "selectedCourier": COURIER}})
+            tailles["assignation"].append(len(bson.encode(next(flux_assignations))))
+    finally:
+        for flux in (flux_offres, flux_resultats, flux_assignations):
+            flux.close()
+
+    def p(valeurs, rang):
+        valeurs = sorted(valeurs)
+        return valeurs[int(rang * (len(valeurs) - 1))]
+    return {
+        "octets": {evt: statistics.mean(v) for evt, v in tailles.items()},
+        "acheminement_p50_ms": p(acheminement, 0.50),
+        "acceptation_p50_ms": p(reception_acceptation, 0.50),
+        "acceptation_p95_ms": p(reception_acceptation, 0.95),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offres Mongo : taille des événements et latence d'acceptation")
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI_BENCH", URI_DEFAUT))
+    parser.add_argument("--courses", type=int, default=500)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client.UberEatsBench # Base dédiée, supprimée à la fin
+
+    print(f"{'scénario':<8} | {'offre o':>7} | {'résultat o':>10} | {'assign. o':>9} | "
+          f"{'insert->reçu p50':>16} | {'reçu->accepté p50/p95 ms':>24}")
+    print("-" * 92)
+    for scenario in ("avant", "apres"):
+        res = mesurer(db, scenario, args.courses)
+        o = res["octets"]
+        print(f"{scenario:<8} | {o['offre']:>7.0f} | {o['resultat']:>10.0f} | {o['assignation']:>9.0f} | "
+              f"{res['acheminement_p50_ms']:>16.2f} | "
+              f"{res['acceptation_p50_ms']:>11.2f}/{res['acceptation_p95_ms']:<12.2f}")
+
+    client.drop_database("UberEatsBench")
@@ -0,0 +1,110 @@
+# bench_transport_redis.py
+# Comparaison des deux transports de transport_redis.py sur un serveur Redis local :
+#   - aller : envoi de l'offre -> réception par le livreur,
+#   - aller-retour : ouverture de l'attente côté manager (abonnement Pub/Sub ou rien en Streams)
+#     -> acceptation lue, fermeture comprise, comme dans manager_redis.attendre_acceptation,
+#   - reconnexion : messages envoyés pendant que le livreur est déconnecté, puis livrés.
+#   python bench_transport_redis.py --messages 2000
+import json, time, uuid, argparse
+from threading import Thread, Event
+import redis
+
+from transport_redis import TRANSPORTS, boite_livreur, envoyer, repondre, ecouter_livreur, ouvrir_acceptations
+from livreur_redis import reponse_offre
+
+
+def nouveau_client():
+    return redis.Redis(host="localhost", port=6379, decode_responses=True)
+
+
+def livreur_echo(courier_id, transport, recus, pret):
+    """Répond immédiatement à chaque offre en notant l'instant de réception."""
+    client = nouveau_client()
+    for data in ecouter_livreur(client, courier_id, transport, block_ms=100):
+        if data["type"] == "PING":
+            pret.set()
+        elif data["type"] == "STOP":
+            return
+        elif data["type"] == "NEW_JOB_OFFER":
+            recus[data["annonce"]["job_id"]] = time.perf_counter()
+            repondre(client, *reponse_offre(courier_id, data), transport)
+
+
+def percentiles_ms(valeurs):
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return "-"
+    rang = lambda p: valeurs[int(p * (len(valeurs) - 1))] * 1000
+    return f"{rang(0.50):.2f}/{rang(0.95):.2f}/{rang(0.99):.2f}"
+
+
+def mesurer_latences(client, transport, nb):
+    courier_id = f"bench_transport_{transport}"
+    client.delete(boite_livreur(courier_id))
+    recus, pret = {}, Event()
+    thread = Thread(target=livreur_echo, args=(courier_id, transport, recus, pret), daemon=True)
+    thread.start()
+    while not pret.is_set(): # En Pub/Sub, les PING envoyés avant l'abonnement sont perdus
+        envoyer(client, courier_id, json.dumps({"type": "PING"}), transport)
+        pret.wait(0.05)
+
+    allers, allers_retours, perdus = [], [], 0
+    for _ in range(nb):
+        job_id = str(uuid.uuid4())
+        debut = time.perf_counter()
+        acceptations = ouvrir_acceptations(client, job_id, transport)
+        envoi = time.perf_counter()
+        offre = {"type": "NEW_JOB_OFFER", "distance": 0.0, "annonce": {"job_id": job_id}}
+        envoyer(client, courier_id, json.dumps(offre), transport)
+        reponse = None
+        while reponse is None and time.perf_counter() - debut < 2:
+            reponse = acceptations.lire(timeout=0.5)
+        acceptations.fermer()
+        if reponse is None:
+            perdus += 1
+            continue
+        allers_retours.append(time.perf_counter() - debut)
+        allers.append(recus[job_id] - envoi)
+
+    envoyer(client, courier_id, json.dumps({"type": "STOP"}), transport)
+    thread.join()
+    client.delete(boite_livreur(courier_id))
+    return allers, allers_retours, perdus
+
+
+def mesurer_reconnexion(client, transport, nb):
+    """Nombre de messages reçus par un livreur qui se connecte APRÈS leur envoi."""
+    courier_id = f"bench_reconnexion_{transport}"
+    client.delete(boite_livreur(courier_id))
+    for i in range(nb):
+        envoyer(client, courier_id, json.dumps({"type": "JOB_LOST", "job_id": str(i)}), transport)
+
+    recus = []
+    def livreur():
+        for data in ecouter_livreur(nouveau_client(), courier_id, transport, block_ms=100):
+            if data["type"] == "STOP":
+                return
+            recus.append(data)
+    thread = Thread(target=livreur, daemon=True)
+    thread.start()
+    time.sleep(1)
+    envoyer(client, courier_id, json.dumps({"type": "STOP"}), transport)
+    thread.join()
+    client.delete(boite_livreur(courier_id))
+    return len(recus)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence Pub/Sub vs Streams (transport_redis.py)")
+    parser.add_argument("--messages", type=int, default=1000, help="Allers-retours mesurés par transport")
+    parser.add_argument("--reconnexion", type=int, default=50, help="Messages envoyés pendant la déconnexion")
+    args = parser.parse_args()
+
+    client = nouveau_client()
+    print(f"{'transport':<9} | {'aller p50/p95/p99 ms':>22} | {'aller-retour p50/p95/p99 ms':>28} | {'perdus':>6} | {'reconnexion':>11}")
+    print("-" * 89)
+    for transport in TRANSPORTS:
+        allers, allers_retours, perdus = mesurer_latences(client, transport, args.messages)
+        livres = mesurer_reconnexion(client, transport, args.reconnexion)
+        print(f"{transport:<9} | {percentiles_ms(allers):>22} | {percentiles_ms(allers_retours):>28} | "
+              f"{perdus:>6} | {f'{livres}/{args.reconnexion}':>11}")
@@ -0,0 +1,281 @@
+# catalogue.py
+# Cache en mémoire du catalogue (restaurants + menus) pour la génération des courses :
+# chargé une fois, puis tenu à jour en continu (change stream Mongo, ou côté Redis les messages
+# d'invalidation publiés par le chargeur). Le tirage d'un restaurant et d'un menu se fait en
+# O(1), sans I/O.
+import json, random, time
+from threading import Thread, Lock
+
+MAX_MENUS = 1_000_000 # Plafond mémoire : au-delà, un nouveau menu remplace un menu pris au hasard
+CANAL_INVALIDATION = "catalogue:invalidations" # Redis : ids de restaurants modifiés, ou TOUT
+TOUT = "*" # Chargement en masse terminé : rechargement complet
+
+
+class CatalogueVide(Exception):
+    """Aucun restaurant avec menu à tirer (données pas encore chargées)."""
+
+
+def publier_invalidation(client, restaurant_ids):
+    """À appeler par tout écrivain du catalogue Redis (client ou pipeline) : restaurants dont le hash
+    ou les menus ont changé, relus en entier ; TOUT une fois un chargement en masse terminé."""
+    client.publish(CANAL_INVALIDATION, restaurant_ids if restaurant_ids == TOUT else json.dumps(list(restaurant_ids)))
+
+
+class Catalogue:
+    """Tuples compacts en mémoire ; seuls les restaurants ayant au moins un menu sont tirés.
+
+    'garder' (lon, lat -> bool) restreint le tirage à une partie de la ville (zones d'un worker).
+    """
+
+    def __init__(self, source, max_menus=MAX_MENUS, garder=None):
+        self.source = source
+        self.max_menus = max_menus
+        self.garder = garder
+        self.infos = {} # restaurant_id -> (nom, lon, lat)
+        self.menus = {} # restaurant_id -> [(menu_id, item, price), ...]
+        self.restaurant_du_menu = {} # menu_id -> restaurant_id
+        self.tirables = [] # restaurant_ids ayant des infos ET au moins un menu
+        self.rang = {} # restaurant_id -> position dans self.tirables
+        self.verrou = Lock()
+        self.stats = {"menus_ignores": 0, "menus_remplaces": 0, "mises_a_jour": 0}
+
+    # --- Ensemble des restaurants tirables (ajout/retrait en O(1)) ---
+    def _dans_perimetre(self, rid):
+        if self.garder is None:
+            return True
+        _, lon, lat = self.infos[rid]
+        return self.garder(lon, lat)
+
+    def _rendre_tirable(self, rid):
+        if rid not in self.rang and rid in self.infos and self.menus.get(rid) and self._dans_perimetre(rid):
+            self.rang[rid] = len(self.tirables)
+            self.tirables.append(rid)
+
+    def _retirer_tirable(self, rid):
+        position = self.rang.pop(rid, None)
+        if position is None:
+            return
+        dernier = self.tirables.pop()
+        if dernier != rid: # On bouche le trou avec le dernier élément
+            self.tirables[position] = dernier
+            self.rang[dernier] = position
+
+    # --- Mises à jour (chargement initial et flux incrémental) ---
+    def ajouter_restaurant(self, rid, nom, lon, lat):
+        with self.verrou:
+            self.infos[rid] = (nom, float(lon), float(lat))
+            if not self._dans_perimetre(rid): # Restaurant déplacé hors de nos zones
+                self._retirer_tirable(rid)
+            self._rendre_tirable(rid)
+
+    def supprimer_restaurant(self, rid):
+        with self.verrou:
+            self.infos.pop(rid, None)
+            self._retirer_tirable(rid)
+
+    def ajouter_menu(self, menu_id, rid, item, price):
+        menu = (menu_id, item, float(price or 0.0))
+        with self.verrou:
+            ancien_rid = self.restaurant_du_menu.get(menu_id)
+            if ancien_rid is not None and ancien_rid != rid:
+                self._supprimer_menu(menu_id) # Menu déplacé vers un autre restaurant
+                ancien_rid = None
+            liste = self.menus.get(rid)
+            if ancien_rid is not None:
+                liste[:] = [menu if m[0] == menu_id else m for m in liste]
+                return
+            if len(self.restaurant_du_menu) >= self.max_menus:
+                # Un menu d'un restaurant tirable pris au hasard cède sa place : un restaurant pas
+                # encore en cache peut ainsi le devenir
+                if not self.tirables:
+                    self.stats["menus_ignores"] += 1
+                    return
+                self._supprimer_menu(random.choice(self.menus[random.choice(self.tirables)])[0])
+                self.stats["menus_remplaces"] += 1
+            self.menus.setdefault(rid, []).append(menu)
+            self.restaurant_du_menu[menu_id] = rid
+            self._rendre_tirable(rid)
+
+    def _supprimer_menu(self, menu_id):
+        rid = self.restaurant_du_menu.pop(menu_id, None)
+        if rid is None:
+            return
+        liste = self.menus.get(rid, [])
+        liste[:] = [m for m in liste if m[0] != menu_id]
+        if not liste:
+            self.menus.pop(rid, None)
+            self._retirer_tirable(rid)
+
+    def supprimer_menu(self, menu_id):
+        with self.verrou:
+            self._supprimer_menu(menu_id)
+
+    def menus_de(self, rid):
+        with self.verrou:
+            return [menu[0] for menu in self.menus.get(rid, [])]
+
+    def vider(self, menus_seulement=False):
+        with self.verrou:
+            self.menus.clear()
+            self.restaurant_du_menu.clear()
+            self.tirables.clear()
+            self.rang.clear()
+            if not menus_seulement:
+                self.infos.clear()
+
+    # --- Tirage ---
+    def choisir(self):
+        """(restaurant, menu) au format attendu par le manager du backend, en O(1)."""
+        with self.verrou:
+            if not self.tirables:
+                raise CatalogueVide("⚠️ Aucun restaurant avec menu dans le catalogue. Chargez d'abord les données")
+            rid = random.choice(self.tirables)
+            menu = random.choice(self.menus[rid])
+            infos = self.infos[rid]
+        return self.source.formater(rid, infos, menu)
+
+    def demarrer(self):
+        """Abonnement aux changements AVANT le chargement : rien n'est perdu entre les deux."""
+        self.source.abonner()
+        self.source.charger(self)
+        Thread(target=self.source.suivre, args=(self,), daemon=True).start()
+        print(f"[Catalogue] {len(self.tirables)} restaurants avec menu, {len(self.restaurant_du_menu)} menus en cache.")
+        return self
+
+
+class SourceRedis:
+    """Chargement par pipelines, puis relecture des restaurants annoncés sur CANAL_INVALIDATION.
+
+    Pas de notifications keyspace : elles toucheraient la configuration du serveur et tous les
+    hashes écrits (jobs, statuts) pour un simple cache. populate_redis.py publie TOUT en fin de
+    chargement, pas un message par lot.
+    """
+
+    def __init__(self, client, taille_lot=1000):
+        self.client = client
+        self.taille_lot = taille_lot
+        self.pubsub = None
+
+    def formater(self, rid, infos, menu):
+        nom, lon, lat = infos
+        menu_id, item, price = menu
+        return ({"id": rid, "name": nom, "lon": lon, "lat": lat},
+                {"id": menu_id, "restaurant_id": rid, "item": item, "price": price})
+
+    def abonner(self):
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(CANAL_INVALIDATION)
+
+    def _lots(self, cles):
+        for i in range(0, len(cles), self.taille_lot):
+            yield cles[i:i + self.taille_lot]
+
+    def charger(self, catalogue):
+        self._lire_restaurants(catalogue, list(self.client.smembers("restaurants:index")))
+
+    def _lire_restaurants(self, catalogue, cles_restaurants, relecture=False):
+        """Restaurants et leurs menus, par pipelines. 'relecture' : retire aussi du cache ce qui a
+        disparu côté Redis (restaurant supprimé, menus retirés de restaurant:{id}:menus)."""
+        cles_menus = []
+        for lot in self._lots(cles_restaurants):
+            with self.client.pipeline(transaction=False) as pipe:
+                for cle in lot:
+                    pipe.hmget(cle, "name", "lon", "lat")
+                    pipe.smembers(f"{cle}:menus")
+                resultats = pipe.execute()
+            for cle, (nom, lon, lat), menus in zip(lot, resultats[0::2], resultats[1::2]):
+                rid = cle.split(":", 1)[1]
+                if lon is not None and lat is not None:
+                    catalogue.ajouter_restaurant(rid, nom, lon, lat)
+                elif relecture:
+                    catalogue.supprimer_restaurant(rid)
+                if relecture:
+                    presents = {menu.split(":", 1)[1] for menu in menus}
+                    for menu_id in catalogue.menus_de(rid):
+                        if menu_id not in presents:
+                            catalogue.supprimer_menu(menu_id)
+                cles_menus.extend(menus)
+        for lot in self._lots(cles_menus):
+            with self.client.pipeline(transaction=False) as pipe:
+                for cle in lot:
+                    pipe.hmget(cle, "restaurant_id", "item", "price")
+                resultats = pipe.execute()
+            for cle, (rid, item, price) in zip(lot, resultats):
+                if rid is not None:
+                    catalogue.ajouter_menu(cle.split(":", 1)[1], rid, item, price)
+
+    def suivre(self, catalogue):
+        for msg in self.pubsub.listen():
+            if msg["type"] != "message":
+                continue
+            if msg["data"] == TOUT:
+                catalogue.vider()
+                self.charger(catalogue)
+            else:
+                self._lire_restaurants(catalogue, [f"restaurant:{rid}" for rid in json.loads(msg["data"])],
+                                       relecture=True)
+            catalogue.stats["mises_a_jour"] += 1
+
+
+class SourceMongo:
+    """Chargement par curseurs projetés, puis UN change stream sur la base (restaurants + menus)."""
+
+    PIPELINE = [{"$match": {"ns.coll": {"$in": ["restaurants", "menus"]}}}]
+
+    def __init__(self, db):
+        self.db = db
+        self.stream = None
+
+    def formater(self, rid, infos, menu):
+        nom, lon, lat = infos
+        menu_id, item, price = menu
+        return ({"_id": rid, "name": nom, "location": {"type": "Point", "coordinates": [lon, lat]}},
+                {"_id": menu_id, "restaurant_id": rid, "item": item, "price": price})
+
+    def abonner(self):
+        self.stream = self.db.watch(self.PIPELINE, full_document="updateLookup")
+
+    def _ajouter_restaurant(self, catalogue, doc):
+        coordonnees = (doc.get("location") or {}).get("coordinates")
+        if coordonnees:
+            catalogue.ajouter_restaurant(doc["_id"], doc.get("name"), *coordonnees)
+
+    def charger(self, catalogue):
+        for doc in self.db.restaurants.find({}, {"name": 1, "location": 1}):
+            self._ajouter_restaurant(catalogue, doc)
+        for doc in self.db.menus.find({}, {"restaurant_id": 1, "item": 1, "price": 1}):
+            catalogue.ajouter_menu(doc["_id"], doc["restaurant_id"], doc.get("item"), doc.get("price"))
+
+    def _appliquer(self, catalogue, change):
+        operation, collection = change["operationType"], change["ns"]["coll"]
+        if operation == "dropDatabase":
+            catalogue.vider()
+        elif operation == "drop": # populate_mongo.py recharge les collections
+            catalogue.vider(menus_seulement=collection == "menus")
+        elif operation == "delete":
+            if collection == "menus":
+                catalogue.supprimer_menu(change["documentKey"]["_id"])
+            else:
+                catalogue.supprimer_restaurant(change["documentKey"]["_id"])
+        elif change.get("fullDocument") is not None: # insert, update, replace
+            doc = change["fullDocument"]
+            if collection == "menus":
+                catalogue.ajouter_menu(doc["_id"], doc["restaurant_id"], doc.get("item"), doc.get("price"))
+            else:
+                self._ajouter_restaurant(catalogue, doc)
+
+    def suivre(self, catalogue):
+        from pymongo.errors import PyMongoError
+        jeton = None
+        while True:
+            try:
+                with self.stream:
+                    for change in self.stream:
+                        self._appliquer(catalogue, change)
+                        catalogue.stats["mises_a_jour"] += 1
+                        jeton = self.stream.resume_token
+                jeton = None # Flux invalidé (base supprimée) : on repart de maintenant
+            except PyMongoError as e:
+                print(f"[Catalogue] ⚠️ Flux interrompu ({e}), reprise dans 1s...")
+                time.sleep(1)
+            self.stream = self.db.watch(self.PIPELINE, full_document="updateLookup", resume_after=jeton)
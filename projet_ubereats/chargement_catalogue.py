@@ -0,0 +1,158 @@
+# chargement_catalogue.py
+# Chargement en continu du CSV Kaggle, par lots, dans Redis ET MongoDB en parallèle.
+# Le CSV n'est lu qu'une fois : les deux bases reçoivent les mêmes restaurants (mêmes
+# coordonnées) et les mêmes menus (mêmes ids).
+#   python chargement_catalogue.py                  # les deux bases, tout le fichier
+#   python chargement_catalogue.py --backends redis --limit 10000
+import os, csv, uuid, re, random, time, argparse
+from itertools import islice
+from queue import Queue, Full
+from threading import Thread
+
+CSV_FILE = "data/ubereats.csv"
+TAILLE_LOT = 5000
+
+
+def nettoyer_prix(raw):
+    """Transforme '15.99 USD' -> 15.99"""
+    if not raw:
+        return 0.0
+    s = str(raw)
+    match = re.findall(r"[0-9]+(?:[.,][0-9]+)?", s)
+    if not match:
+        return 0.0
+    return float(match[0].replace(",", "."))
+
+
+def lire_lots(csv_file=CSV_FILE, taille_lot=TAILLE_LOT, limit=None):
+    """Génère des lots {"restaurants": [...], "menus": [...]} sans charger tout le fichier.
+
+    Un restaurant n'apparaît que dans le premier lot où il est rencontré.
+    """
+    vus = set()
+    total = 0
+    with open(csv_file, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        while True:
+            lignes = list(islice(reader, taille_lot))
+            if not lignes:
+                return
+            lot = {"restaurants": [], "menus": []}
+            for row in lignes:
+                if limit and total >= limit:
+                    break
+                rid = row.get("restaurant_id")
+                if not rid:
+                    continue
+                if rid not in vus:
+                    vus.add(rid)
+                    lot["restaurants"].append({
+                        "id": rid,
+                        "cuisine": row.get("category", "General"),
+                        # Coordonnées aléatoires autour de Paris (le CSV n'en fournit pas)
+                        "lat": round(random.uniform(48.80, 48.90), 6),
+                        "lon": round(random.uniform(2.25, 2.45), 6),
+                    })
+                lot["menus"].append({
+                    "id": str(uuid.uuid4()),
+                    "restaurant_id": rid,
+                    "item": row.get("name", "Unknown"),
+                    "category": row.get("category", "General"),
+                    "description": row.get("description", ""),
+                    "price": nettoyer_prix(row.get("price")),
+                })
+                total += 1
+            if lot["menus"]:
+                yield lot
+            if limit and total >= limit:
+                return
+
+
+class Chargeur:
+    """Écrit les lots d'un backend dans son propre thread (file bornée = pas d'emballement mémoire)."""
+
+    def __init__(self, nom, preparer, ecrire_lot, finaliser):
+        self.nom = nom
+        self.preparer = preparer
+        self.ecrire_lot = ecrire_lot
+        self.finaliser = finaliser
+        self.file = Queue(maxsize=4)
+        self.restaurants = 0
+        self.menus = 0
+        self.duree = 0.0
+        self.erreur = None # Exception de l'écrivain : plus personne ne vide la file
+        self.thread = Thread(target=self._boucle, daemon=True)
+
+    def _boucle(self):
+        debut = time.perf_counter()
+        try:
+            for lot in iter(self.file.get, None):
+                self.ecrire_lot(lot)
+                self.restaurants += len(lot["restaurants"])
+                self.menus += len(lot["menus"])
+                print(f"[{self.nom}] ... {self.menus} menus ({self.menus / (time.perf_counter() - debut):.0f} lignes/s)")
+            print(f"[{self.nom}] Construction des index après chargement...")
+            self.finaliser()
+        except Exception as e:
+            print(f"[{self.nom}] ❌ Écriture interrompue : {e!r}")
+            self.erreur = e
+        self.duree = time.perf_counter() - debut
+
+    def deposer(self, lot):
+        """Met un lot (ou None, fin du fichier) en file ; relève l'erreur de l'écrivain s'il s'est arrêté."""
+        while self.erreur is None:
+            try:
+                self.file.put(lot, timeout=0.5)
+                return
+            except Full:
+                pass
+        raise self.erreur
+
+    def terminer(self):
+        self.deposer(None)
+        self.thread.join()
+        if self.erreur is not None:
+            raise self.erreur # Échec de finaliser()
+
+
+def charger(backends=("redis", "mongo"), csv_file=CSV_FILE, taille_lot=TAILLE_LOT, limit=None):
+    if not os.path.exists(csv_file):
+        raise FileNotFoundError(f"{csv_file} introuvable")
+
+    chargeurs = []
+    if "redis" in backends:
+        import populate_redis
+        chargeurs.append(Chargeur("Redis", populate_redis.preparer, populate_redis.ecrire_lot, populate_redis.finaliser))
+    if "mongo" in backends:
+        import populate_mongo
+        db = populate_mongo.connecter()
+        chargeurs.append(Chargeur("Mongo", lambda: populate_mongo.preparer(db),
+                                  lambda lot: populate_mongo.ecrire_lot(db, lot),
+                                  lambda: populate_mongo.finaliser(db)))
+
+    for chargeur in chargeurs:
+        chargeur.preparer()
+        chargeur.thread.start()
+
+    debut = time.perf_counter()
+    for lot in lire_lots(csv_file, taille_lot, limit):
+        for chargeur in chargeurs:
+            chargeur.deposer(lot)
+    for chargeur in chargeurs:
+        chargeur.terminer()
+    total = time.perf_counter() - debut
+
+    for chargeur in chargeurs:
+        print(f"✅ {chargeur.nom} : {chargeur.restaurants} restaurants et {chargeur.menus} menus "
+              f"en {chargeur.duree:.1f}s ({chargeur.menus / max(chargeur.duree, 1e-9):.0f} lignes/s)")
+    print(f"⏱️ Chargement total en {total:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chargement du catalogue par lots dans Redis et MongoDB")
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--backends", nargs="+", choices=["redis", "mongo"], default=["redis", "mongo"])
+    parser.add_argument("--lot", type=int, default=TAILLE_LOT, help="Lignes CSV par lot")
+    parser.add_argument("--limit", type=int, default=None, help="Nombre max de menus (tout le fichier par défaut)")
+    args = parser.parse_args()
+    charger(args.backends, args.csv, args.lot, args.limit)
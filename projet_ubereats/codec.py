@@ -0,0 +1,105 @@
+# codec.py
+# Format des messages manager <-> livreur (Redis) : NEW_JOB_OFFER, ASSIGNED, JOB_LOST et les
+# réponses aux offres. Format "compact" versionné : champs positionnels d'un schéma fixe, séparés
+# par SEP, sans noms de clés. Il reste du texte UTF-8 (les clients Redis sont en
+# decode_responses=True). Le corps d'une offre est encodé UNE fois par job ; seule la distance,
+# propre à chaque livreur, est ajoutée au moment de l'envoi (en Python ou dans les scripts Lua).
+# Le décodage accepte aussi le JSON d'avant (messages commençant par "{") : MESSAGES_CODEC=json
+# côté manager pour une flotte qui mélange anciens et nouveaux livreurs.
+# Une offre peut se terminer par la fenêtre d'acceptation du manager (s, champ "fenetre") : champ
+# final optionnel, ignoré par les livreurs d'avant, absent des offres des managers d'avant.
+import os, json
+
+COMPACT = "compact"
+JSON = "json"
+CODECS = (COMPACT, JSON)
+CODEC_DEFAUT = os.getenv("MESSAGES_CODEC", COMPACT)
+
+VERSION = "1"
+SEP = "\x1f" # Séparateur d'unités ASCII : absent des données en pratique, sinon repli JSON
+
+# Schémas fixes : code du type -> champs dans l'ordre d'encodage
+OFFRE, ASSIGNATION, PERTE, REPONSE = "O", "A", "L", "R"
+CHAMPS_ANNONCE = ("job_id", "restaurant", "menu_item", "price", "reward", "estimated_time")
+TYPES = {OFFRE: "NEW_JOB_OFFER", ASSIGNATION: "ASSIGNED", PERTE: "JOB_LOST"}
+# Nombres de champs admis après version et type (offre : annonce, distance, [fenêtre])
+NB_CHAMPS = {OFFRE: (len(CHAMPS_ANNONCE) + 1, len(CHAMPS_ANNONCE) + 2), ASSIGNATION: (1,), PERTE: (1,), REPONSE: (4,)}
+
+
+def _compactable(valeurs):
+    return all(SEP not in str(v) for v in valeurs)
+
+
+def _assembler(code, valeurs):
+    return SEP.join((VERSION, code, *map(str, valeurs)))
+
+
+# --- Encodage ---
+def gabarit_offre(annonce, codec=CODEC_DEFAUT, fenetre=None):
+    """(avant, apres) : un message d'offre = avant + distance + apres, pour tous les candidats.
+    'fenetre' : durée (s) pendant laquelle le manager attend les acceptations."""
+    valeurs = [annonce[champ] for champ in CHAMPS_ANNONCE]
+    if codec == COMPACT and _compactable(valeurs):
+        return _assembler(OFFRE, valeurs) + SEP, "" if fenetre is None else f"{SEP}{fenetre}"
+    fin = "" if fenetre is None else f',"fenetre":{fenetre}'
+    return '{"type":"NEW_JOB_OFFER","distance":', fin + ',"annonce":' + json.dumps(annonce) + "}"
+
+
+def encoder_offre(gabarit, distance):
+    avant, apres = gabarit
+    return f"{avant}{distance}{apres}"
+
+
+def encoder_assignation(job_id, codec=CODEC_DEFAUT):
+    if codec == COMPACT and _compactable([job_id]):
+        return _assembler(ASSIGNATION, [job_id])
+    return json.dumps({"type": "ASSIGNED", "job_id": job_id})
+
+
+def encoder_perte(job_id, codec=CODEC_DEFAUT):
+    if codec == COMPACT and _compactable([job_id]):
+        return _assembler(PERTE, [job_id])
+    return json.dumps({"type": "JOB_LOST", "job_id": job_id})
+
+
+def encoder_reponse(courier_id, job_id, distance, accepte=True, codec=CODEC_DEFAUT):
+    """Acceptation (ou refus, DECLINED) d'une offre, envoyée sur jobs:{job_id}:accepts."""
+    if codec == COMPACT and _compactable([courier_id, job_id]):
+        return _assembler(REPONSE, [courier_id, job_id, distance, "" if accepte else "DECLINED"])
+    message = {"courier_id": courier_id, "job_id": job_id, "distance": distance}
+    if not accepte:
+        message["status"] = "DECLINED"
+    return json.dumps(message)
+
+
+# --- Décodage (mêmes dict que l'ancien JSON) ---
+def decoder(message):
+    """Tout message mal formé lève ValueError : l'appelant l'ignore et passe au suivant."""
+    if message[:1] == "{":
+        donnees = json.loads(message) # JSONDecodeError est une ValueError
+        if not isinstance(donnees, dict):
+            raise ValueError(f"Message JSON inattendu : {message!r}")
+        return donnees
+    champs = message.split(SEP)
+    if champs[0] != VERSION:
+        raise ValueError(f"Version de message inconnue : {champs[0]!r}")
+    code = champs[1] if len(champs) > 1 else None
+    if code not in NB_CHAMPS:
+        raise ValueError(f"Type de message inconnu : {code!r}")
+    if len(champs) - 2 not in NB_CHAMPS[code]:
+        attendus = " ou ".join(map(str, NB_CHAMPS[code]))
+        raise ValueError(f"Message {code!r} à {len(champs) - 2} champs, {attendus} attendus")
+    if code == OFFRE:
+        annonce = dict(zip(CHAMPS_ANNONCE, champs[2:8]))
+        annonce["price"] = float(annonce["price"])
+        annonce["reward"] = float(annonce["reward"])
+        offre = {"type": "NEW_JOB_OFFER", "distance": float(champs[8]), "annonce": annonce}
+        if len(champs) > 9:
+            offre["fenetre"] = float(champs[9])
+        return offre
+    if code in (ASSIGNATION, PERTE):
+        return {"type": TYPES[code], "job_id": champs[2]}
+    reponse = {"courier_id": champs[2], "job_id": champs[3], "distance": float(champs[4])}
+    if champs[5]:
+        reponse["status"] = champs[5]
+    return reponse
@@ -0,0 +1,152 @@
+# cycle_jobs.py
+# Cycle de vie des hashes job:{id} côté Redis :
+#   - TTL long dès la création (filet de sécurité si le manager s'arrête en pleine course),
+#   - TTL court une fois la course ASSIGNED / EXPIRED, et job_id poussé dans 'jobs:termines',
+#   - un archiveur (thread) vide cette file par lots vers un fichier gzip en ajout seul,
+#     avant l'expiration, et mesure la mémoire Redis occupée par job vivant.
+# Les jobs vivants sont suivis dans le sorted set 'jobs:vivants' (score = expiration prévue du
+# hash, mise à jour avec son TTL) : le rapport les compte sans parcourir le keyspace.
+#   python cycle_jobs.py            # archiveur seul, avec rapport mémoire périodique
+import os, json, gzip, time
+from collections import deque
+from threading import Thread, Event
+
+TTL_EN_COURS = 3600 # s, posé à la création du job (enregistrer_job)
+TTL_TERMINE = 600 # s, délai de grâce après la fin (relectures tardives, archivage)
+FILE_TERMINES = "jobs:termines"
+CLE_VIVANTS = "jobs:vivants" # job_id -> instant d'expiration prévu du hash job:{id}
+FICHIER_ARCHIVE = "archives/jobs.jsonl.gz"
+
+
+def enregistrer_job(pipe, job_id):
+    """Ajoute au pipeline le TTL de sécurité du job qui vient d'être écrit, et son suivi."""
+    pipe.expire(f"job:{job_id}", TTL_EN_COURS)
+    pipe.zadd(CLE_VIVANTS, {job_id: time.time() + TTL_EN_COURS})
+
+
+def terminer_job(pipe, job_id, status, selected_courier=None):
+    """Ajoute au pipeline la fin de vie du job : statut final, TTL court, file d'archivage."""
+    champs = {"status": status, "ended_at": round(time.time(), 3)}
+    if selected_courier:
+        champs["selected_courier"] = selected_courier
+    cle = f"job:{job_id}"
+    pipe.hset(cle, mapping=champs)
+    pipe.expire(cle, TTL_TERMINE)
+    pipe.zadd(CLE_VIVANTS, {job_id: time.time() + TTL_TERMINE})
+    pipe.rpush(FILE_TERMINES, job_id)
+
+
+def lire_archive(fichier=FICHIER_ARCHIVE):
+    """Relit l'archive (un document JSON par job) pour analyse."""
+    with gzip.open(fichier, "rt", encoding="utf-8") as f:
+        for ligne in f:
+            yield json.loads(ligne)
+
+
+class Archiveur:
+    def __init__(self, client, fichier=FICHIER_ARCHIVE, taille_lot=500, periode=1.0):
+        self.client = client
+        self.fichier = fichier
+        self.taille_lot = taille_lot
+        self.periode = periode
+        self.fin = Event()
+        self.thread = None
+        self.octets_par_job = deque(maxlen=1000) # MEMORY USAGE des derniers jobs archivés
+        self.stats = {"archives": 0, "perdus": 0, "lots": 0, "erreurs": 0}
+
+    def archiver_lot(self):
+        """Archive jusqu'à 'taille_lot' jobs terminés ; retourne le nombre de jobs traités."""
+        job_ids = self.client.lpop(FILE_TERMINES, self.taille_lot)
+        if not job_ids:
+            return 0
+        with self.client.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hgetall(f"job:{job_id}")
+                pipe.memory_usage(f"job:{job_id}")
+            resultats = pipe.execute()
+
+        lignes = []
+        for job_id, job, octets in zip(job_ids, resultats[0::2], resultats[1::2]):
+            if not job: # Expiré avant archivage (archiveur arrêté plus de TTL_TERMINE)
+                self.stats["perdus"] += 1
+                continue
+            job["job_id"] = job_id
+            lignes.append(json.dumps(job, separators=(",", ":"), ensure_ascii=False))
+            if octets:
+                self.octets_par_job.append(octets)
+        try:
+            if lignes:
+                os.makedirs(os.path.dirname(self.fichier) or ".", exist_ok=True)
+                # Un membre gzip complet par lot : le fichier reste lisible même après un arrêt brutal
+                with gzip.open(self.fichier, "at", encoding="utf-8") as f:
+                    f.write("\n".join(lignes) + "\n")
+        except OSError as e:
+            self.stats["erreurs"] += 1
+            print(f"[Archiveur] ⚠️ Écriture impossible ({e}), {len(job_ids)} job(s) remis en file.")
+            self.client.lpush(FILE_TERMINES, *reversed(job_ids))
+            return 0
+        self.stats["archives"] += len(lignes)
+        self.stats["lots"] += 1
+        return len(job_ids)
+
+    def _boucle(self):
+        while not self.fin.is_set():
+            try:
+                plein = self.archiver_lot() == self.taille_lot
+            except Exception as e:
+                self.stats["erreurs"] += 1
+                print(f"[Archiveur] ⚠️ {e}")
+                plein = False
+            if not plein: # File vide ou presque : on attend le prochain lot
+                self.fin.wait(self.periode)
+
+    def demarrer(self):
+        self.thread = Thread(target=self._boucle, daemon=True)
+        self.thread.start()
+        return self
+
+    def arreter(self):
+        self.fin.set()
+        if self.thread:
+            self.thread.join()
+        while self.archiver_lot(): # Ce qui reste en file
+            pass
+
+    def rapport_memoire(self):
+        """Mémoire Redis et part occupée par les jobs vivants (comptés dans CLE_VIVANTS, après
+        retrait des jobs dont le TTL est écoulé)."""
+        memoire = self.client.info("memory")["used_memory"]
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(CLE_VIVANTS, "-inf", time.time())
+            pipe.zcard(CLE_VIVANTS)
+            _, jobs_vivants = pipe.execute()
+        octets = sum(self.octets_par_job) / len(self.octets_par_job) if self.octets_par_job else None
+        return {
+            "used_memory": memoire,
+            "jobs_vivants": jobs_vivants,
+            "octets_par_job": octets,
+            "octets_jobs": octets * jobs_vivants if octets else None,
+            "en_attente_archivage": self.client.llen(FILE_TERMINES),
+        }
+
+    def afficher_rapport(self):
+        r = self.rapport_memoire()
+        par_job = f"{r['octets_par_job']:.0f} o/job" if r["octets_par_job"] else "? o/job"
+        total_jobs = f"{r['octets_jobs'] / 1024 / 1024:.1f} Mo" if r["octets_jobs"] else "?"
+        print(f"[Archiveur] Redis {r['used_memory'] / 1024 / 1024:.1f} Mo | {r['jobs_vivants']} jobs vivants x "
+              f"{par_job} = {total_jobs} | en attente: {r['en_attente_archivage']} | {self.stats}")
+
+
+if __name__ == "__main__":
+    import redis
+    client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    archiveur = Archiveur(client).demarrer()
+    print(f"[Archiveur] Archivage de '{FILE_TERMINES}' vers {FICHIER_ARCHIVE}...")
+    try:
+        while True:
+            time.sleep(10)
+            archiveur.afficher_rapport()
+    except KeyboardInterrupt:
+        archiveur.arreter()
+        archiveur.afficher_rapport()
+        print("\n[Archiveur] Arrêt manuel.")
@@ -0,0 +1,305 @@
+# dispatch_async_redis.py
+# Dispatcher asynchrone : garde des centaines de courses "en vol" en même temps
+# au lieu d'en traiter une seule toutes les ~12 s comme manager_redis.py.
+# Publication, réservation et notifications passent par redis.asyncio (mêmes scripts Lua et mêmes
+# commandes en pipeline que manager_redis) : aucune I/O réseau ne bloque la boucle. Le pool de
+# threads ne sert plus qu'aux calculs longs (mode lots) et aux replis synchrones (sans Lua).
+import asyncio, argparse, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+import manager_redis
+from catalogue import Catalogue, SourceRedis
+from cycle_jobs import Archiveur
+from vivacite import BalayeurRedis
+from transport_redis import PUBSUB # Le routeur d'acceptations est en Pub/Sub
+from zones import CLE_STATUTS
+from codec import decoder
+import metriques
+from politiques import ResolutionAcceptation, POLITIQUE_DEFAUT, POLITIQUES, afficher_metriques
+
+# Une SEULE souscription par motif pour toutes les courses
+MOTIF_ACCEPTATIONS = "jobs:*:accepts"
+
+
+class RouteurAcceptations:
+    """Reçoit toutes les acceptations et les route vers l'attente de chaque job."""
+
+    def __init__(self, client, motif=MOTIF_ACCEPTATIONS):
+        self.client = client
+        self.motif = motif
+        self.attentes = {}  # job_id -> asyncio.Queue
+        self.pubsub = None
+        self.tache = None
+        self.reconnexions = 0
+
+    async def _souscrire(self):
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.psubscribe(self.motif)
+        # On attend la confirmation avant d'envoyer la moindre offre,
+        # sinon les premières acceptations pourraient être perdues
+        while True:
+            msg = await self.pubsub.get_message(timeout=1.0)
+            if msg and msg["type"] == "psubscribe":
+                break
+
+    async def demarrer(self):
+        await self._souscrire()
+        self.tache = asyncio.create_task(self._boucle())
+        print(f"[Dispatcher] 📡 Souscription unique à '{self.motif}' active.")
+
+    async def arreter(self):
+        if self.tache:
+            self.tache.cancel()
+        if self.pubsub:
+            await self.pubsub.aclose()
+
+    def inscrire(self, job_id):
+        file = asyncio.Queue()
+        self.attentes[job_id] = file
+        return file
+
+    def desinscrire(self, job_id):
+        self.attentes.pop(job_id, None)
+
+    async def _router(self):
+        async for msg in self.pubsub.listen():
+            if msg["type"] != "pmessage":
+                continue
+            # Canal de la forme jobs:{job_id}:accepts
+            job_id = msg["channel"][len("jobs:"):-len(":accepts")]
+            file = self.attentes.get(job_id)
+            if file is None:
+                continue  # Course déjà clôturée : acceptation tardive ignorée
+            # Un message mal formé ne doit pas arrêter le routeur : les autres courses en dépendent
+            try:
+                reponse = decoder(msg["data"])
+            except ValueError as e: # codec.decoder : toute trame mal formée
+                print(f"[Dispatcher] ⚠️ Message illisible sur {msg['channel']} ({e!r}). Ignoré.")
+                continue
+            file.put_nowait(reponse)
+
+    async def _boucle(self):
+        """Connexion perdue : on se réabonne (les acceptations publiées pendant la coupure sont
+        perdues, Pub/Sub oblige ; les fenêtres concernées expirent normalement)."""
+        while True:
+            try:
+                await self._router()
+                print(f"[Dispatcher] ⚠️ Souscription '{self.motif}' fermée par le serveur.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Dispatcher] ⚠️ Souscription '{self.motif}' interrompue ({e!r}).")
+            try:
+                await self.pubsub.aclose()
+            except Exception:
+                pass
+            while True:
+                await asyncio.sleep(1)
+                try:
+                    await self._souscrire()
+                    break
+                except Exception as e:
+                    print(f"[Dispatcher] ⚠️ Réabonnement impossible ({e!r}), nouvel essai dans 1s...")
+            self.reconnexions += 1
+            print(f"[Dispatcher] 📡 Souscription à '{self.motif}' rétablie.")
+
+
+async def attendre_acceptation_async(file, job_id, candidats_potentiels, duree=10, politique=POLITIQUE_DEFAUT):
+    """Équivalent asynchrone de manager_redis.attendre_acceptation (mêmes politiques)."""
+    resolution = ResolutionAcceptation(candidats_potentiels, politique, duree)
+
+    while not resolution.decide:
+        restant = resolution.temps_restant()
+        if restant <= 0:
+            break
+        try:
+            data = await asyncio.wait_for(file.get(), timeout=restant)
+        except asyncio.TimeoutError:
+            break
+
+        courier_id = data.get("courier_id")
+        if courier_id not in candidats_potentiels:
+            print(f"[Dispatcher] ⚠️ {courier_id} a répondu pour {job_id}, mais n'était pas ciblé. Ignoré.")
+        elif data.get("status") == "DECLINED":
+            resolution.refuser(courier_id)
+        else:
+            resolution.accepter(courier_id)
+
+    return resolution.cloturer()
+
+
+class Dispatcher:
+    """'prefixe' préfixe les job_id : un worker de dispatch_zones.py ne reçoit que ses acceptations.
+    'principal' : ce processus fait aussi tourner l'archiveur et le balayeur de livreurs morts."""
+
+    def __init__(self, max_en_vol=200, duree=10, politique=POLITIQUE_DEFAUT, nb_threads=4, prefixe="", principal=True):
+        self.client = aioredis.Redis(host="localhost", port=6379, decode_responses=True)
+        self.prefixe = prefixe
+        self.principal = principal
+        self.routeur = RouteurAcceptations(self.client, f"jobs:{prefixe}*:accepts")
+        self.script_publier = self.client.register_script(manager_redis.LUA_PUBLIER)
+        self.script_reserver = self.client.register_script(manager_redis.LUA_RESERVER)
+        # Calculs longs et replis synchrones seulement (cf. en-tête)
+        self.executor = ThreadPoolExecutor(max_workers=nb_threads)
+        self.semaphore = asyncio.Semaphore(max_en_vol)
+        self.duree = duree
+        manager_redis.duree_fenetre = duree # Annoncée dans les offres des replis synchrones
+        self.politique = politique
+        self.en_vol = 0
+        self.stats = {"attribuees": 0, "expirees": 0, "sans_livreur": 0, "deja_reserves": 0}
+        self.distances = [] # Distance d'approche (m) du livreur retenu, par course attribuée
+
+    async def _etape(self, fonction, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fonction, *args)
+
+    async def publier_annonce(self, job_id):
+        """manager_redis.publier_annonce_geo (Pub/Sub) sur redis.asyncio : écriture du job, recherche
+        et offres en un pipeline. Retourne {courier_id: distance_m}."""
+        if not manager_redis.lua_disponible:
+            return (await self._etape(manager_redis.publier_annonce_geo, job_id, PUBSUB))[1]
+        metriques.compter("courses")
+        tirage = manager_redis.creer_annonce(job_id) # Catalogue en mémoire : pas d'I/O
+        if tirage is None:
+            return {}
+        annonce, lon, lat = tirage
+        rayon_depart = manager_redis.rayon_initial(lon, lat)
+        keys, couverture = manager_redis.cles_recherche(lon, lat)
+        try:
+            with metriques.etape("publication_lua"):
+                async with self.client.pipeline(transaction=False) as pipe:
+                    manager_redis.ecrire_job(pipe, job_id, annonce)
+                    await self.script_publier(keys=keys, args=[lon, lat, rayon_depart, manager_redis.RAYON_MAX_KM,
+                                                               manager_redis.NB_CANDIDATS,
+                                                               *manager_redis.gabarit_offre(annonce, fenetre=self.duree), couverture],
+                                              client=pipe)
+                    candidats, rayon = manager_redis._lire_resultat((await pipe.execute())[-1])
+        except ResponseError as e:
+            print(f"[Dispatcher] ⚠️ Script Lua indisponible ({e}), repli sur pipeline.")
+            manager_redis.lua_disponible = False
+            candidats, rayon = await self._etape(manager_redis._publier_pipeline, job_id, lon, lat, annonce,
+                                                 rayon_depart, PUBSUB)
+        manager_redis.memoriser_rayon(lon, lat, rayon_depart, rayon)
+        if candidats:
+            metriques.compter("offres", len(candidats))
+        else:
+            metriques.compter("sans_livreur")
+        return candidats
+
+    async def publier_offres_ciblees(self, job_id, annonce, candidats):
+        """manager_redis.publier_offres_ciblees sur redis.asyncio (mode lots)."""
+        with metriques.etape("offres"):
+            async with self.client.pipeline(transaction=False) as pipe:
+                manager_redis.preparer_offres_ciblees(pipe, job_id, annonce, candidats, PUBSUB)
+                await pipe.execute()
+        metriques.compter("offres", len(candidats))
+
+    async def reserver_livreur(self, courier_id):
+        """manager_redis.reserver_livreur sur redis.asyncio (repli WATCH/MULTI synchrone sans Lua)."""
+        if manager_redis.lua_disponible:
+            try:
+                return await self.script_reserver(keys=[CLE_STATUTS], args=[courier_id]) == 1
+            except ResponseError as e:
+                print(f"[Dispatcher] ⚠️ Script Lua indisponible ({e}), réservation en transaction.")
+        return await self._etape(manager_redis.reserver_livreur, courier_id)
+
+    async def notifier_selection(self, job_id, courier_id, candidats_ids):
+        """manager_redis.notifier_selection sur redis.asyncio ; courier_id None : job EXPIRED.
+        Retourne le livreur assigné, ou None s'il était déjà réservé par une autre course."""
+        with metriques.etape("notification"):
+            if courier_id and not await self.reserver_livreur(courier_id):
+                metriques.compter("reservations_refusees")
+                courier_id = None
+            async with self.client.pipeline(transaction=False) as pipe:
+                manager_redis.preparer_selection(pipe, job_id, courier_id, candidats_ids, PUBSUB)
+                await pipe.execute()
+        return courier_id
+
+    async def traiter_course(self):
+        async with self.semaphore:
+            job_id = f"{self.prefixe}{uuid.uuid4()}"
+            file = self.routeur.inscrire(job_id)  # Inscription AVANT la publication
+            self.en_vol += 1
+            try:
+                candidats_potentiels = await self.publier_annonce(job_id)
+                if not candidats_potentiels:
+                    self.stats["sans_livreur"] += 1
+                    return
+
+                with metriques.etape("attente_acceptation"):
+                    courier = await attendre_acceptation_async(file, job_id, candidats_potentiels, self.duree, self.politique)
+                candidats_ids = list(candidats_potentiels)
+                if courier:
+                    # None si le gagnant a été réservé entre-temps par une autre course (job EXPIRED)
+                    if await self.notifier_selection(job_id, courier, candidats_ids):
+                        self.distances.append(candidats_potentiels[courier])
+                        metriques.compter("attribuees")
+                        self.stats["attribuees"] += 1
+                    else:
+                        self.stats["deja_reserves"] += 1
+                else:
+                    await self.notifier_selection(job_id, None, candidats_ids)
+                    metriques.compter("sans_acceptation")
+                    self.stats["expirees"] += 1
+            except Exception as e:
+                print(f"[Dispatcher] ❌ Erreur sur la course {job_id}: {e}")
+            finally:
+                self.en_vol -= 1
+                self.routeur.desinscrire(job_id)
+
+    async def executer(self, nb_courses, intervalle=0.0, port_metriques=metriques.PORT_DEFAUT):
+        if manager_redis.catalogue is None: # Chargement initial bloquant : une fois, hors de la boucle
+            manager_redis.catalogue = await self._etape(Catalogue(SourceRedis(manager_redis.r)).demarrer)
+        await self.routeur.demarrer()
+        metriques.demarrer(port_metriques, nom_processus=f"Dispatcher {self.prefixe}".strip())
+        archiveur = Archiveur(manager_redis.r).demarrer() if self.principal else None
+        balayeur = BalayeurRedis(manager_redis.r).demarrer() if self.principal else None
+        debut = time.monotonic()
+        taches = []
+        try:
+            for _ in range(nb_courses):
+                taches.append(asyncio.create_task(self.traiter_course()))
+                await asyncio.sleep(intervalle)
+            await asyncio.gather(*taches)
+        finally:
+            await self.routeur.arreter()
+            await self.client.aclose()
+            self.executor.shutdown(wait=False)
+            if balayeur:
+                balayeur.arreter()
+            if archiveur:
+                archiveur.arreter()
+
+        duree_totale = time.monotonic() - debut
+        print(f"\n[Dispatcher] ✅ {nb_courses} courses traitées en {duree_totale:.1f}s "
+              f"({nb_courses / duree_totale * 60:.0f} courses/min)")
+        print(f"[Dispatcher] Attribuées: {self.stats['attribuees']} | Expirées: {self.stats['expirees']} "
+              f"| Sans livreur: {self.stats['sans_livreur']} | Gagnant déjà réservé: {self.stats['deja_reserves']} "
+              f"| Réabonnements: {self.routeur.reconnexions}")
+        if self.distances:
+            print(f"[Dispatcher] Distance d'approche : {sum(self.distances) / 1000:.1f} km au total, "
+                  f"{sum(self.distances) / len(self.distances):.0f} m en moyenne")
+        if archiveur:
+            archiveur.afficher_rapport()
+        afficher_metriques()
+        if metriques.ACTIF:
+            metriques.afficher_resume(f"Dispatcher {self.prefixe}".strip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dispatcher asynchrone Redis (Pub/Sub)")
+    parser.add_argument("--courses", type=int, default=100, help="Nombre de courses à lancer")
+    parser.add_argument("--en-vol", type=int, default=200, help="Nombre max de courses simultanées")
+    parser.add_argument("--intervalle", type=float, default=0.05, help="Secondes entre deux créations de course")
+    parser.add_argument("--duree", type=float, default=10, help="Fenêtre d'acceptation (s)")
+    parser.add_argument("--politique", choices=POLITIQUES, default=POLITIQUE_DEFAUT, help="Règle de clôture de la fenêtre")
+    args = parser.parse_args()
+
+    dispatcher = Dispatcher(max_en_vol=args.en_vol, duree=args.duree, politique=args.politique)
+    try:
+        asyncio.run(dispatcher.executer(args.courses, args.intervalle))
+    except KeyboardInterrupt:
+        print("\n[Dispatcher] Arrêt manuel.")
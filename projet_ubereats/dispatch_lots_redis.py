@@ -0,0 +1,178 @@
+# dispatch_lots_redis.py
+# Mode lots du dispatcher asynchrone : les courses créées pendant FENETRE_LOT s sont appariées
+# ensemble (appariement.py) au lieu d'envoyer chacune aux 5 livreurs les plus proches.
+#   1. chaque course tire son restaurant et attend le prochain lot ;
+#   2. un pipeline GEOSEARCH ... WITHCOORD ramène les livreurs vivants proches de chaque restaurant,
+#      sauf ceux qui ont déjà une offre en cours dans ce dispatcher ;
+#   3. matrice de distances NumPy + affectation de coût minimal : un livreur par course ;
+#   4. chaque course envoie UNE offre ciblée. Refus ou silence : elle repart dans le lot suivant
+#      sans ce livreur (TENTATIVES fois au plus), puis passe en EXPIRED.
+# --index : l'étape 2 interroge l'index spatial en mémoire (index_spatial.py) au lieu de Redis.
+#   python dispatch_lots_redis.py --courses 1000 --fenetre 0.5 [--index]
+import asyncio, argparse, uuid
+
+import numpy as np
+
+import manager_redis
+from appariement import apparier, DISTANCE_MAX_M
+from index_spatial import IndexSpatial, SourceRedis
+from dispatch_async_redis import Dispatcher, attendre_acceptation_async
+from zones import CLE_GLOBALE
+import metriques
+from metriques import etape
+from politiques import POLITIQUE_DEFAUT, POLITIQUES
+
+FENETRE_LOT = 0.5 # s d'accumulation des courses avant un appariement
+TAILLE_MAX_LOT = 500 # Courses par matrice : au-delà, le reste part dans un second appariement
+CANDIDATS_PAR_COURSE = 10 # Livreurs proches de chaque restaurant ajoutés aux colonnes de la matrice
+TENTATIVES = 3 # Offres ciblées successives par course avant EXPIRED
+
+
+def livreurs_du_lot(points, k=CANDIDATS_PAR_COURSE, rayon_km=DISTANCE_MAX_M / 1000, index=None):
+    """Livreurs vivants parmi les k plus proches de chaque restaurant : {courier_id: (lon, lat)}."""
+    if index is not None:
+        return index.positions_de({courier_id for proches in index.k_plus_proches(points, k, rayon_km * 1000)
+                                   for courier_id, _ in proches})
+    with manager_redis.r.pipeline(transaction=False) as pipe:
+        for lon, lat in points:
+            pipe.geosearch(CLE_GLOBALE, longitude=lon, latitude=lat, radius=rayon_km, unit="km",
+                           sort="ASC", count=k, withcoord=True)
+        resultats = pipe.execute()
+    positions = {}
+    for proches in resultats:
+        for courier_id, coord in proches:
+            positions[courier_id] = coord
+    return dict(manager_redis.filtrer_vivants(list(positions.items())))
+
+
+def resoudre_lot(lot, reserves, index=None):
+    """lot : [(lon, lat, exclus), ...] -> pour chaque course (courier_id, distance_m) ou None."""
+    points = [(lon, lat) for lon, lat, _ in lot]
+    with etape("geo"):
+        positions = livreurs_du_lot(points, index=index)
+    ids = [courier_id for courier_id in positions if courier_id not in reserves]
+    colonne = {courier_id: j for j, courier_id in enumerate(ids)}
+    exclus = [(i, colonne[c]) for i, (_, _, refus) in enumerate(lot) for c in refus if c in colonne]
+    with etape("appariement"):
+        couples = apparier(np.array(points), np.array([positions[c] for c in ids]).reshape(-1, 2), exclus=exclus)
+    affectations = [None] * len(lot)
+    for i, j, distance_m in couples:
+        affectations[i] = (ids[j], round(distance_m, 2))
+    return affectations
+
+
+class DispatcherLots(Dispatcher):
+    """Même cycle de vie que Dispatcher (routeur, archiveur, balayeur, métriques) ;
+    seul le choix des livreurs change."""
+
+    def __init__(self, fenetre=FENETRE_LOT, taille_max=TAILLE_MAX_LOT, tentatives=TENTATIVES, index=False, **kwargs):
+        super().__init__(**kwargs)
+        self.index = IndexSpatial(SourceRedis(manager_redis.r)).demarrer() if index else None
+        self.fenetre = fenetre
+        self.taille_max = taille_max
+        self.tentatives = tentatives
+        self.lot = [] # (lon, lat, livreurs déjà contactés, futur)
+        self.reserves = set() # Livreurs qui ont une offre ciblée en cours
+        self.nb_lots = 0
+
+    async def _boucle_lots(self):
+        while True:
+            await asyncio.sleep(self.fenetre)
+            while self.lot:
+                lot, self.lot = self.lot[:self.taille_max], self.lot[self.taille_max:]
+                try:
+                    affectations = await self._etape(resoudre_lot, [(lon, lat, refus) for lon, lat, refus, _ in lot],
+                                                     set(self.reserves), self.index)
+                except Exception as e:
+                    print(f"[Dispatcher lots] ❌ Erreur d'appariement : {e}")
+                    affectations = [None] * len(lot)
+                self.nb_lots += 1
+                metriques.compter("lots")
+                for (_, _, _, futur), affectation in zip(lot, affectations):
+                    if affectation:
+                        self.reserves.add(affectation[0]) # Avant le lot suivant
+                    if not futur.done():
+                        futur.set_result(affectation)
+
+    async def _placer(self, lon, lat, contactes):
+        futur = asyncio.get_running_loop().create_future()
+        self.lot.append((lon, lat, set(contactes), futur))
+        return await futur
+
+    async def traiter_course(self):
+        async with self.semaphore:
+            job_id = f"{self.prefixe}{uuid.uuid4()}"
+            file = self.routeur.inscrire(job_id)
+            self.en_vol += 1
+            contactes = []
+            try:
+                metriques.compter("courses")
+                tirage = manager_redis.creer_annonce(job_id) # Catalogue en mémoire : pas d'I/O
+                if tirage is None:
+                    return
+                annonce, lon, lat = tirage
+                courier = None
+                for _ in range(self.tentatives):
+                    affectation = await self._placer(lon, lat, contactes)
+                    if affectation is None:
+                        break # Aucun livreur libre à moins de DISTANCE_MAX_M
+                    candidat, distance_m = affectation
+                    contactes.append(candidat)
+                    try:
+                        await self.publier_offres_ciblees(job_id, annonce, {candidat: distance_m})
+                        with metriques.etape("attente_acceptation"):
+                            courier = await attendre_acceptation_async(file, job_id, {candidat: distance_m},
+                                                                       self.duree, self.politique)
+                    finally:
+                        self.reserves.discard(candidat)
+                    if courier:
+                        self.distances.append(distance_m)
+                        break
+
+                if courier:
+                    # None si le gagnant a été réservé entre-temps par un autre manager (job EXPIRED)
+                    if await self.notifier_selection(job_id, courier, contactes):
+                        metriques.compter("attribuees")
+                        self.stats["attribuees"] += 1
+                    else:
+                        self.stats["deja_reserves"] += 1
+                elif contactes:
+                    await self.notifier_selection(job_id, None, contactes)
+                    metriques.compter("sans_acceptation")
+                    self.stats["expirees"] += 1
+                else:
+                    metriques.compter("sans_livreur")
+                    self.stats["sans_livreur"] += 1
+            except Exception as e:
+                print(f"[Dispatcher lots] ❌ Erreur sur la course {job_id}: {e}")
+            finally:
+                self.en_vol -= 1
+                self.routeur.desinscrire(job_id)
+
+    async def executer(self, *args, **kwargs):
+        tache = asyncio.create_task(self._boucle_lots())
+        try:
+            await super().executer(*args, **kwargs)
+        finally:
+            tache.cancel()
+        print(f"[Dispatcher lots] {self.nb_lots} lot(s) de {self.fenetre}s appariés.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dispatcher Redis en mode lots (appariement de coût minimal)")
+    parser.add_argument("--courses", type=int, default=100, help="Nombre de courses à lancer")
+    parser.add_argument("--en-vol", type=int, default=200, help="Nombre max de courses simultanées")
+    parser.add_argument("--intervalle", type=float, default=0.05, help="Secondes entre deux créations de course")
+    parser.add_argument("--duree", type=float, default=10, help="Fenêtre d'acceptation d'une offre ciblée (s)")
+    parser.add_argument("--fenetre", type=float, default=FENETRE_LOT, help="Secondes d'accumulation d'un lot")
+    parser.add_argument("--tentatives", type=int, default=TENTATIVES, help="Offres ciblées max par course")
+    parser.add_argument("--politique", choices=POLITIQUES, default=POLITIQUE_DEFAUT, help="Règle de clôture de la fenêtre")
+    parser.add_argument("--index", action="store_true", help="Livreurs candidats lus dans l'index spatial en mémoire")
+    args = parser.parse_args()
+
+    dispatcher = DispatcherLots(fenetre=args.fenetre, tentatives=args.tentatives, index=args.index, max_en_vol=args.en_vol,
+                                duree=args.duree, politique=args.politique)
+    try:
+        asyncio.run(dispatcher.executer(args.courses, args.intervalle))
+    except KeyboardInterrupt:
+        print("\n[Dispatcher lots] Arrêt manuel.")
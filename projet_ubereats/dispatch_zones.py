@@ -0,0 +1,101 @@
+# dispatch_zones.py
+# Dispatch réparti sur plusieurs processus : la ville est découpée en zones (zones.py) et chaque
+# worker possède un groupe de zones. Un worker ne crée que des courses dont le restaurant est dans
+# ses zones, cherche les livreurs dans les index de zone voisins (index global en dernier recours)
+# et ne reçoit que ses propres acceptations (job_id préfixé, souscription jobs:{prefixe}*:accepts).
+# Chaque worker a sa boucle asyncio, son pool de threads et ses connexions Redis : le débit suit
+# le nombre de cœurs au lieu d'être borné par une seule boucle Python.
+#   python dispatch_zones.py --workers 4 --courses 2000
+import os, time, asyncio, argparse
+from collections import Counter
+from multiprocessing import Pool
+
+import redis
+
+from catalogue import Catalogue, SourceRedis
+from cycle_jobs import Archiveur
+from vivacite import BalayeurRedis
+from politiques import POLITIQUE_DEFAUT, POLITIQUES
+from zones import zone_de
+import metriques
+
+
+def zones_des_restaurants(client):
+    """Nombre de restaurants tirables (avec menu) par zone, d'après le catalogue Redis."""
+    catalogue = Catalogue(SourceRedis(client))
+    catalogue.source.charger(catalogue) # Chargement seul : pas de suivi des changements ici
+    return Counter(zone_de(catalogue.infos[rid][1], catalogue.infos[rid][2]) for rid in catalogue.tirables)
+
+
+def repartir_zones(charge_par_zone, nb_workers):
+    """Zones les plus chargées d'abord, chacune au worker le moins chargé (glouton)."""
+    groupes = [[] for _ in range(nb_workers)]
+    charges = [0] * nb_workers
+    for zone, charge in sorted(charge_par_zone.items(), key=lambda zc: -zc[1]):
+        i = charges.index(min(charges))
+        groupes[i].append(zone)
+        charges[i] += charge
+    return groupes, charges
+
+
+def executer_worker(numero, zones, nb_courses, intervalle, en_vol, duree, politique):
+    """Corps d'un processus worker : catalogue restreint à ses zones, puis le dispatcher asynchrone."""
+    import manager_redis
+    from dispatch_async_redis import Dispatcher
+    mes_zones = set(zones)
+    # Modules importés dans le processus : client Redis, scripts et catalogue propres au worker
+    manager_redis.catalogue = Catalogue(SourceRedis(manager_redis.r),
+                                        garder=lambda lon, lat: zone_de(lon, lat) in mes_zones).demarrer()
+    dispatcher = Dispatcher(max_en_vol=en_vol, duree=duree, politique=politique,
+                            prefixe=f"w{numero}-", principal=False)
+    print(f"[Worker {numero}] {len(zones)} zone(s), {nb_courses} course(s).")
+    # Un port de métriques par worker (METRIQUES=1) : 9109, 9110...
+    asyncio.run(dispatcher.executer(nb_courses, intervalle, port_metriques=metriques.PORT_DEFAUT + 1 + numero))
+    return dispatcher.stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dispatch Redis réparti par zones sur plusieurs processus")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Nombre de processus workers")
+    parser.add_argument("--courses", type=int, default=1000, help="Nombre total de courses")
+    parser.add_argument("--en-vol", type=int, default=200, help="Courses simultanées max par worker")
+    parser.add_argument("--intervalle", type=float, default=0.01, help="Secondes entre deux créations (par worker)")
+    parser.add_argument("--duree", type=float, default=10, help="Fenêtre d'acceptation (s)")
+    parser.add_argument("--politique", choices=POLITIQUES, default=POLITIQUE_DEFAUT)
+    args = parser.parse_args()
+
+    client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    charge_par_zone = zones_des_restaurants(client)
+    if not charge_par_zone:
+        print("[Zones] ❌ Aucun restaurant avec menu. Exécute d'abord populate_redis.py")
+        raise SystemExit(1)
+    nb_workers = max(1, min(args.workers, len(charge_par_zone)))
+    groupes, charges = repartir_zones(charge_par_zone, nb_workers)
+    total = sum(charges)
+    # Courses réparties au prorata des restaurants de chaque worker
+    parts = [args.courses * charge // total for charge in charges]
+    parts[0] += args.courses - sum(parts)
+    print(f"[Zones] {len(charge_par_zone)} zones, {total} restaurants, {nb_workers} worker(s) : "
+          f"{', '.join(f'w{i}={n}' for i, n in enumerate(parts))} courses")
+
+    archiveur = Archiveur(client).demarrer() # Un seul archiveur et un seul balayeur pour tous les workers
+    balayeur = BalayeurRedis(client).demarrer()
+    debut = time.monotonic()
+    try:
+        with Pool(nb_workers) as pool:
+            stats = pool.starmap(executer_worker, [
+                (i, groupes[i], parts[i], args.intervalle, args.en_vol, args.duree, args.politique)
+                for i in range(nb_workers)
+            ])
+    except KeyboardInterrupt:
+        print("\n[Zones] Arrêt manuel.")
+        stats = []
+    duree_totale = time.monotonic() - debut
+    balayeur.arreter()
+    archiveur.arreter()
+
+    bilan = sum((Counter(s) for s in stats), Counter())
+    print(f"\n[Zones] ✅ {sum(bilan.values())} courses en {duree_totale:.1f}s avec {nb_workers} worker(s) "
+          f"({sum(bilan.values()) / duree_totale * 60:.0f} courses/min)")
+    print(f"[Zones] Attribuées: {bilan['attribuees']} | Expirées: {bilan['expirees']} | Sans livreur: {bilan['sans_livreur']}")
+    archiveur.afficher_rapport()
@@ -0,0 +1,350 @@
+# flotte.py
+# Simulateur de flotte : des milliers de livreurs simulés dans UN SEUL processus asyncio,
+# pour l'un ou l'autre backend, avec des connexions partagées entre tous les livreurs.
+#   python flotte.py redis --livreurs 2000
+#   python flotte.py mongo --livreurs 500 --p-accept 0.7 --p-refus 0.2
+import asyncio, argparse, random
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from ingestion_positions import TamponPositions, ecrivain_redis, ecrivain_mongo
+from zones import LUA_POSITIONS, CLES_POSITIONS, CLE_STATUTS, args_positions, changer_statut
+from codec import decoder
+from offres_livreur import FENETRE_OFFRE
+
+
+class LivreurSimule:
+    def __init__(self, courier_id):
+        self.id = courier_id
+        # Position de départ aléatoire (autour de Paris), comme livreur_*.py
+        self.lon = round(random.uniform(2.25, 2.45), 6)
+        self.lat = round(random.uniform(48.80, 48.90), 6)
+        self.occupe = False
+
+    def deplacer(self, pas):
+        self.lon += random.uniform(-pas, pas)
+        self.lat += random.uniform(-pas, pas)
+
+
+class Flotte(ABC):
+    """Partie commune aux deux backends : décisions, livraisons, déplacements, statistiques."""
+
+    def __init__(self, nb_livreurs, prefixe="sim", p_accept=0.9, p_refus=0.05, p_mouvement=1.0,
+                 pas=0.001, intervalle_gps=10, reflexion=(0.5, 2.0), livraison=(8, 15), tampon=(1000, 0.5)):
+        self.prefixe = prefixe
+        self.livreurs = {}
+        for i in range(nb_livreurs):
+            livreur = LivreurSimule(f"{prefixe}{i}")
+            self.livreurs[livreur.id] = livreur
+        self.p_accept = p_accept
+        self.p_refus = p_refus
+        self.p_mouvement = p_mouvement
+        self.pas = pas
+        self.intervalle_gps = intervalle_gps
+        self.reflexion = reflexion
+        self.livraison = livraison
+        self.config_tampon = tampon # (taille_max, intervalle) ou None pour une écriture par livreur
+        self.tampon = None
+        self.stats = Counter()
+        self.taches = set() # Références fortes : asyncio ne garde que des références faibles
+        self.reflexions = {} # (courier_id, job_id) -> tâche traiter_offre, annulée si le résultat arrive avant
+
+    # --- À fournir par chaque backend ---
+    @abstractmethod
+    async def demarrer(self):
+        """Connexions partagées et abonnements aux messages des livreurs."""
+
+    @abstractmethod
+    async def ecouter(self):
+        """Reçoit offres et résultats et les route vers les livreurs simulés."""
+
+    @abstractmethod
+    async def repondre(self, livreur, offre, accepte):
+        """Acceptation ou refus d'une offre."""
+
+    @abstractmethod
+    async def changer_statut(self, livreur, status):
+        """Statut du livreur côté serveur."""
+
+    @abstractmethod
+    async def publier_positions(self, livreurs):
+        """Écriture directe : une écriture par livreur, comme livreur_*.py."""
+
+    @abstractmethod
+    def creer_ecrivain(self):
+        """Fonction d'écriture par lots utilisée par le tampon d'ingestion."""
+
+    async def arreter(self):
+        pass
+
+    # --- Logique commune ---
+    def lancer(self, coro):
+        tache = asyncio.create_task(coro)
+        self.taches.add(tache)
+        tache.add_done_callback(self.taches.discard)
+        return tache
+
+    def decision(self, livreur):
+        """'accepte', 'refuse' ou None (le livreur laisse expirer l'offre)."""
+        if livreur.occupe:
+            return "refuse" # Déjà en livraison
+        tirage = random.random()
+        if tirage < self.p_accept:
+            return "accepte"
+        if tirage < self.p_accept + self.p_refus:
+            return "refuse"
+        return None
+
+    def reflechir(self, livreur, job_id, offre):
+        """Lance traiter_offre ; traiter_resultat l'annule si la course se clôt pendant la réflexion."""
+        cle = (livreur.id, job_id)
+        tache = self.lancer(self.traiter_offre(livreur, offre))
+        self.reflexions[cle] = tache
+        tache.add_done_callback(lambda _: self.reflexions.pop(cle, None))
+
+    async def traiter_offre(self, livreur, offre):
+        self.stats["offres"] += 1
+        loop = asyncio.get_running_loop()
+        recue = loop.time()
+        await asyncio.sleep(random.uniform(*self.reflexion)) # Simule une réflexion
+        decision = self.decision(livreur)
+        if decision is None:
+            self.stats["ignorees"] += 1
+            return
+        # Boucle surchargée : le manager a déjà clos la fenêtre (annoncée dans l'offre Redis)
+        if loop.time() - recue > offre.get("fenetre", FENETRE_OFFRE):
+            self.stats["abandonnees"] += 1
+            return
+        self.stats["acceptations" if decision == "accepte" else "refus"] += 1
+        if await self.repondre(livreur, offre, decision == "accepte") is False:
+            self.stats["gaspillees"] += 1 # Refusée par le serveur : offre déjà close
+
+    async def traiter_assignation(self, livreur, job_id):
+        self.stats["assignations"] += 1
+        livreur.occupe = True
+        await self.changer_statut(livreur, "on_delivery")
+        await asyncio.sleep(random.uniform(*self.livraison)) # Simule la livraison
+        livreur.occupe = False
+        self.stats["livraisons"] += 1
+        await self.changer_statut(livreur, "available")
+
+    def traiter_resultat(self, livreur, job_id, status):
+        self.stats["perdues" if status == "LOST" else "expirees"] += 1
+        tache = self.reflexions.pop((livreur.id, job_id), None)
+        if tache:
+            tache.cancel()
+            self.stats["annulees"] += 1
+
+    async def diffuser_positions(self, livreurs):
+        if self.tampon is None:
+            await self.publier_positions(livreurs)
+            return
+        for livreur in livreurs:
+            self.tampon.ajouter(livreur.id, livreur.lon, livreur.lat)
+
+    async def _boucle_deplacement(self):
+        while True:
+            await asyncio.sleep(self.intervalle_gps)
+            for livreur in self.livreurs.values():
+                if random.random() < self.p_mouvement:
+                    livreur.deplacer(self.pas)
+            # Les livreurs immobiles renvoient aussi leur position : c'est leur signe de vie (vivacite.py)
+            await self.diffuser_positions(list(self.livreurs.values()))
+
+    async def _boucle_stats(self, periode=5):
+        while True:
+            await asyncio.sleep(periode)
+            en_livraison = sum(1 for l in self.livreurs.values() if l.occupe)
+            print(f"[Flotte] {len(self.livreurs)} livreurs | en livraison: {en_livraison} | {dict(self.stats)}")
+            if self.tampon:
+                self.tampon.afficher_rapport()
+
+    async def executer(self, duree=0):
+        await self.demarrer()
+        if self.config_tampon:
+            taille_max, intervalle = self.config_tampon
+            self.tampon = TamponPositions(self.creer_ecrivain(), taille_max, intervalle, nom=type(self).__name__)
+            self.tampon.demarrer()
+        await self.diffuser_positions(list(self.livreurs.values())) # Positions initiales
+        if self.tampon:
+            await asyncio.get_running_loop().run_in_executor(None, self.tampon.vider)
+        print(f"[Flotte] 🚲 {len(self.livreurs)} livreurs simulés en ligne.")
+        self.lancer(self.ecouter())
+        self.lancer(self._boucle_deplacement())
+        self.lancer(self._boucle_stats())
+        try:
+            if duree:
+                await asyncio.sleep(duree)
+            else:
+                await asyncio.Event().wait() # Jusqu'à Ctrl+C
+        finally:
+            for tache in list(self.taches):
+                tache.cancel()
+            if self.tampon:
+                self.tampon.arreter()
+                self.tampon.afficher_rapport()
+            await self.arreter()
+            print(f"[Flotte] Bilan : {dict(self.stats)}")
+
+
+class FlotteRedis(Flotte):
+    """Une souscription par motif pour toute la flotte, un seul pool de connexions."""
+
+    async def demarrer(self):
+        import redis.asyncio as aioredis
+        import livreur_redis
+        self.reponse_offre = livreur_redis.reponse_offre # Même message que livreur_redis.ecouter
+        self.client = aioredis.Redis(host="localhost", port=6379, decode_responses=True)
+        self.script_positions = self.client.register_script(LUA_POSITIONS)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.psubscribe(f"courier:{self.prefixe}*:notify")
+        # Les livreurs d'une simulation précédente repartent disponibles (HDEL sans champ : erreur)
+        if self.livreurs:
+            await self.client.hdel(CLE_STATUTS, *self.livreurs)
+
+    async def ecouter(self):
+        async for msg in self.pubsub.listen():
+            if msg["type"] != "pmessage":
+                continue
+            livreur = self.livreurs.get(msg["channel"].split(":")[1])
+            if livreur is None:
+                continue
+            try:
+                data = decoder(msg["data"])
+            except ValueError as e: # Trame mal formée : ignorée, l'écoute de la flotte continue
+                print(f"[Flotte] ⚠️ Message illisible sur {msg['channel']} ({e}). Ignoré.")
+                continue
+            if data.get("type") == "NEW_JOB_OFFER":
+                self.reflechir(livreur, data["annonce"]["job_id"], data)
+            elif data.get("type") == "ASSIGNED":
+                self.lancer(self.traiter_assignation(livreur, data["job_id"]))
+            elif data.get("type") == "JOB_LOST":
+                self.traiter_resultat(livreur, data.get("job_id"), "LOST")
+
+    async def repondre(self, livreur, offre, accepte):
+        await self.client.publish(*self.reponse_offre(livreur.id, offre, accepte))
+
+    async def changer_statut(self, livreur, status):
+        await changer_statut(self.client, livreur.id, status) # {couriers}:status (zones.py)
+
+    async def publier_positions(self, livreurs):
+        # Même écriture que livreur_redis.simuler_deplacement : un appel du script par livreur
+        async with self.client.pipeline(transaction=False) as pipe:
+            for livreur in livreurs:
+                await self.script_positions(keys=CLES_POSITIONS,
+                                            args=args_positions([(livreur.id, livreur.lon, livreur.lat)]), client=pipe)
+            await pipe.execute()
+
+    def creer_ecrivain(self):
+        import redis
+        # Client synchrone : le tampon écrit depuis son propre thread
+        return ecrivain_redis(redis.Redis(host="localhost", port=6379, decode_responses=True))
+
+    async def arreter(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class PontAsync:
+    """File compatible Passerelle.abonner() qui renvoie les événements vers la boucle asyncio."""
+
+    def __init__(self, loop, file, courier_id):
+        self.loop = loop
+        self.file = file
+        self.courier_id = courier_id
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.file.put_nowait, (self.courier_id, item))
+
+
+class FlotteMongo(Flotte):
+    """Les change streams passent par la passerelle partagée (2 curseurs pour toute la flotte)."""
+
+    def __init__(self, *args, nb_threads=32, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nb_threads = nb_threads
+
+    async def demarrer(self):
+        import livreur_mongo
+        from schema_mongo import creer_index
+        from passerelle_mongo import Passerelle
+        self.lm = livreur_mongo # Client Mongo partagé + écritures de livreur_mongo
+        self.executor = ThreadPoolExecutor(max_workers=self.nb_threads)
+        self.evenements = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        await self._executer(creer_index, livreur_mongo.db) # Sans effet si les index existent
+
+        self.passerelle = Passerelle(livreur_mongo.db, fichier_jetons=None)
+        for courier_id in self.livreurs:
+            self.passerelle.abonner(courier_id, PontAsync(loop, self.evenements, courier_id))
+        self.passerelle.demarrer()
+
+        # Les livreurs d'une simulation précédente repartent disponibles
+        await self._executer(livreur_mongo.couriers_coll.update_many,
+                             {"_id": {"$in": list(self.livreurs)}}, {"$set": {"status": "available"}})
+
+    async def _executer(self, fonction, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fonction, *args)
+
+    async def ecouter(self):
+        while True:
+            courier_id, (type_evt, doc) = await self.evenements.get()
+            livreur = self.livreurs[courier_id]
+            if type_evt == "offre":
+                self.reflechir(livreur, doc["job_id"], doc)
+            elif type_evt == "assignation":
+                self.lancer(self.traiter_assignation(livreur, doc["_id"]))
+            elif type_evt == "resultat":
+                self.traiter_resultat(livreur, doc["job_id"], doc["status"])
+
+    async def repondre(self, livreur, offre, accepte):
+        return await self._executer(self.lm.repondre_offre, offre, accepte)
+
+    async def changer_statut(self, livreur, status):
+        await self._executer(self.lm.changer_statut, livreur.id, status)
+
+    async def publier_positions(self, livreurs):
+        # Même écriture que livreur_mongo.simuler_deplacement : un upsert par livreur
+        await asyncio.gather(*(
+            self._executer(self.lm.publier_position, l.id, {"type": "Point", "coordinates": [l.lon, l.lat]})
+            for l in livreurs
+        ))
+
+    def creer_ecrivain(self):
+        return ecrivain_mongo(self.lm.couriers_coll)
+
+    async def arreter(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.passerelle.arreter)
+        self.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulateur de flotte de livreurs (un seul processus)")
+    parser.add_argument("backend", choices=["redis", "mongo"])
+    parser.add_argument("--livreurs", type=int, default=1000)
+    parser.add_argument("--prefixe", default="sim", help="Préfixe des ids (sim0, sim1, ...)")
+    parser.add_argument("--p-accept", type=float, default=0.9, help="Probabilité d'accepter une offre")
+    parser.add_argument("--p-refus", type=float, default=0.05, help="Probabilité de refuser explicitement (sinon : pas de réponse)")
+    parser.add_argument("--p-mouvement", type=float, default=1.0, help="Probabilité qu'un livreur bouge à chaque tick GPS")
+    parser.add_argument("--pas", type=float, default=0.001, help="Déplacement max par tick (degrés)")
+    parser.add_argument("--intervalle-gps", type=float, default=10, help="Secondes entre deux ticks GPS")
+    parser.add_argument("--reflexion", type=float, nargs=2, default=None, metavar=("MIN", "MAX"))
+    parser.add_argument("--livraison", type=float, nargs=2, default=(8, 15), metavar=("MIN", "MAX"))
+    parser.add_argument("--duree", type=float, default=0, help="Durée de la simulation en s (0 = infini)")
+    parser.add_argument("--ecriture-directe", action="store_true", help="Une écriture GPS par livreur (sans tampon)")
+    parser.add_argument("--tampon-taille", type=int, default=1000, help="Vidage du tampon GPS dès N positions")
+    parser.add_argument("--tampon-intervalle", type=float, default=0.5, help="Vidage du tampon GPS toutes les N s")
+    args = parser.parse_args()
+
+    # Même temps de réflexion par défaut que livreur_redis.py (0.5-2 s) / livreur_mongo.py (1-3 s)
+    reflexion = args.reflexion or ((0.5, 2.0) if args.backend == "redis" else (1.0, 3.0))
+    classe = FlotteRedis if args.backend == "redis" else FlotteMongo
+    flotte = classe(args.livreurs, prefixe=args.prefixe, p_accept=args.p_accept, p_refus=args.p_refus,
+                    p_mouvement=args.p_mouvement, pas=args.pas, intervalle_gps=args.intervalle_gps,
+                    reflexion=reflexion, livraison=args.livraison,
+                    tampon=None if args.ecriture_directe else (args.tampon_taille, args.tampon_intervalle))
+    try:
+        asyncio.run(flotte.executer(args.duree))
+    except KeyboardInterrupt:
+        print("\n[Flotte] Arrêt manuel.")
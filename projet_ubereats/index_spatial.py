@@ -0,0 +1,354 @@
+# index_spatial.py
+# Index spatial des livreurs côté manager : positions dans des tableaux NumPy, rangées par cellule
+# d'une grille uniforme (TAILLE_CELLULE degrés). Les k plus proches livreurs disponibles d'un LOT de
+# restaurants sont calculés en un appel, sans aller-retour serveur par course.
+# Comme le catalogue (catalogue.py), l'index est chargé une fois puis tenu à jour par sa source :
+#   - SourceRedis : battements récents ({couriers}:heartbeat) relus toutes les PERIODE_SYNC s, GEOPOS des
+#                   livreurs concernés, et livreurs pris ({couriers}:status) ; relecture complète toutes
+#                   les PERIODE_RESYNC s (départs) ;
+#   - SourceMongo : change stream projeté sur 'couriers' (position, statut, updatedAt).
+# Un livreur sans position depuis TTL_VIVANT s est ignoré, comme dans les recherches des managers.
+#   python bench_index_spatial.py   # cohérence et débit face aux requêtes serveur
+import math, time
+from datetime import timezone
+from threading import Thread, Lock
+
+import numpy as np
+
+from appariement import matrice_haversine
+from zones import CLE_GLOBALE, CLE_BATTEMENTS, CLE_STATUTS, DISPONIBLE, TTL_VIVANT, KM_PAR_DEGRE, MARGE
+
+TAILLE_CELLULE = 0.01 # degrés : ~1,1 km nord-sud, ~0,7 km est-ouest à Paris
+CAPACITE_INITIALE = 1024 # Emplacements ; doublée au besoin
+PERIODE_SYNC = 1.0 # s entre deux relectures des battements récents (Redis)
+PERIODE_RESYNC = 60.0 # s entre deux relectures complètes (Redis)
+NB_VOISINS = 5
+
+# Clé entière d'une cellule : les cellules d'une même colonne (cx) sont contiguës dans l'ordre des clés
+_DECALAGE = 1 << 20
+_LARGEUR = 1 << 21
+
+
+def _cle(cx, cy):
+    return (cx + _DECALAGE) * _LARGEUR + (cy + _DECALAGE)
+
+
+class IndexSpatial:
+    """Emplacements réutilisés (comme les restaurants tirables du catalogue) ; la grille triée est
+    reconstruite à la première requête qui suit une mise à jour, puis partagée tant que rien ne change."""
+
+    def __init__(self, source=None, taille_cellule=TAILLE_CELLULE, ttl=TTL_VIVANT):
+        self.source = source
+        self.taille = taille_cellule
+        self.ttl = ttl
+        self.positions = np.zeros((CAPACITE_INITIALE, 2)) # (lon, lat)
+        self.vu = np.zeros(CAPACITE_INITIALE) # Dernière position (s depuis l'epoch, horloge de la source)
+        self.disponible = np.zeros(CAPACITE_INITIALE, dtype=bool) # Faux aussi pour un emplacement libre
+        self.ids = np.empty(CAPACITE_INITIALE, dtype=object)
+        self.emplacements = {} # courier_id -> indice dans les tableaux
+        self.libres = list(range(CAPACITE_INITIALE - 1, -1, -1))
+        self.verrou = Lock()
+        self.version = 0
+        self.grille = None
+        self.version_grille = -1
+        self.stats = {"mises_a_jour": 0, "reconstructions": 0, "requetes": 0}
+
+    # --- Mises à jour (chargement initial et flux incrémental) ---
+    def _agrandir(self):
+        ancienne = len(self.ids)
+        self.positions = np.concatenate([self.positions, np.zeros((ancienne, 2))])
+        self.vu = np.concatenate([self.vu, np.zeros(ancienne)])
+        self.disponible = np.concatenate([self.disponible, np.zeros(ancienne, dtype=bool)])
+        self.ids = np.concatenate([self.ids, np.empty(ancienne, dtype=object)])
+        self.libres.extend(range(2 * ancienne - 1, ancienne - 1, -1))
+
+    def maj(self, courier_id, lon, lat, vu, disponible=True):
+        with self.verrou:
+            i = self.emplacements.get(courier_id)
+            if i is None:
+                if not self.libres:
+                    self._agrandir()
+                i = self.libres.pop()
+                self.emplacements[courier_id] = i
+                self.ids[i] = courier_id
+            self.positions[i] = (float(lon), float(lat))
+            self.vu[i] = vu
+            self.disponible[i] = disponible
+            self.version += 1
+            self.stats["mises_a_jour"] += 1
+
+    def marquer(self, courier_id, disponible):
+        """Change la disponibilité d'un livreur déjà connu, sans toucher à sa position."""
+        with self.verrou:
+            i = self.emplacements.get(courier_id)
+            if i is None or self.disponible[i] == disponible:
+                return
+            self.disponible[i] = disponible
+            self.version += 1
+
+    def retirer(self, courier_id):
+        with self.verrou:
+            i = self.emplacements.pop(courier_id, None)
+            if i is None:
+                return
+            self.ids[i] = None
+            self.disponible[i] = False
+            self.libres.append(i)
+            self.version += 1
+
+    def identifiants(self):
+        with self.verrou:
+            return set(self.emplacements)
+
+    def vider(self):
+        for courier_id in self.identifiants():
+            self.retirer(courier_id)
+
+    def __len__(self):
+        return len(self.emplacements)
+
+    # --- Grille : livreurs disponibles triés par cellule ---
+    def _grille(self):
+        with self.verrou:
+            if self.version_grille == self.version:
+                return self.grille
+            version = self.version
+            valides = np.flatnonzero(self.disponible)
+            positions, vu, ids = self.positions[valides], self.vu[valides], self.ids[valides] # Copies
+        cellules = np.floor(positions / self.taille).astype(np.int64)
+        cles = _cle(cellules[:, 0], cellules[:, 1])
+        ordre = np.argsort(cles, kind="stable")
+        bornes = (cellules.min(axis=0), cellules.max(axis=0)) if len(valides) else None
+        grille = (cles[ordre], positions[ordre], vu[ordre], ids[ordre], bornes)
+        with self.verrou:
+            if version >= self.version_grille:
+                self.grille, self.version_grille = grille, version
+                self.stats["reconstructions"] += 1
+        return grille
+
+    def _couverture(self, points, cx, cy, anneau):
+        """Distance (m) de chaque point au bord du bloc de cellules : aucun livreur hors du bloc n'est plus près."""
+        ouest, est = (cx - anneau) * self.taille, (cx + anneau + 1) * self.taille
+        sud, nord = (cy - anneau) * self.taille, (cy + anneau + 1) * self.taille
+        m_lat = KM_PAR_DEGRE * 1000
+        m_lon = m_lat * math.cos(math.radians(min(89.0, max(abs(sud), abs(nord)))))
+        lon, lat = points[:, 0], points[:, 1]
+        return MARGE * np.minimum.reduce([(lon - ouest) * m_lon, (est - lon) * m_lon,
+                                          (lat - sud) * m_lat, (nord - lat) * m_lat])
+
+    @staticmethod
+    def _candidats(cles, bornes, cx, cy, anneau):
+        """Indices (dans la grille) des livreurs des cellules [cx ± anneau] x [cy ± anneau]."""
+        (x_min, y_min), (x_max, y_max) = bornes
+        colonnes = np.arange(max(cx - anneau, x_min), min(cx + anneau, x_max) + 1)
+        if not len(colonnes):
+            return np.empty(0, dtype=np.int64)
+        debuts = np.searchsorted(cles, _cle(colonnes, max(cy - anneau, y_min)), "left")
+        fins = np.searchsorted(cles, _cle(colonnes, min(cy + anneau, y_max)), "right")
+        return np.concatenate([np.arange(d, f) for d, f in zip(debuts, fins)])
+
+    # --- Requêtes ---
+    def k_plus_proches(self, points, k=NB_VOISINS, distance_max=None):
+        """points (q, 2) en (lon, lat) -> pour chaque point [(courier_id, distance_m), ...] des k plus
+        proches livreurs disponibles et vivants, du plus proche au plus lointain.
+
+        Les restaurants d'une même cellule sont traités ensemble : une matrice de distances avec les
+        livreurs du bloc de cellules voisin, élargi (anneau doublé) tant que le k-ième plus proche
+        pourrait se trouver hors du bloc."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        resultats = [[] for _ in range(len(points))]
+        cles, positions, vu, ids, bornes = self._grille()
+        self.stats["requetes"] += len(points)
+        if bornes is None or not len(points):
+            return resultats
+        maintenant = self.source.maintenant() if self.source else time.time()
+        vivants = vu >= maintenant - self.ttl
+        limite = float("inf") if distance_max is None else distance_max
+        cellules = np.floor(points / self.taille).astype(np.int64)
+        uniques, inverse, comptes = np.unique(cellules, axis=0, return_inverse=True, return_counts=True)
+        groupes = np.split(np.argsort(inverse.ravel(), kind="stable"), np.cumsum(comptes)[:-1])
+
+        for (cx, cy), restants in zip(uniques.tolist(), groupes):
+            anneau = 1
+            while len(restants):
+                tout = (cx - anneau <= bornes[0][0] and cx + anneau >= bornes[1][0]
+                        and cy - anneau <= bornes[0][1] and cy + anneau >= bornes[1][1])
+                candidats = self._candidats(cles, bornes, cx, cy, anneau)
+                candidats = candidats[vivants[candidats]]
+                couverture = self._couverture(points[restants], cx, cy, anneau)
+                kk = min(k, len(candidats))
+                if kk:
+                    distances = matrice_haversine(points[restants], positions[candidats])
+                    proches = np.argpartition(distances, kk - 1, axis=1)[:, :kk]
+                    d_proches = np.take_along_axis(distances, proches, axis=1)
+                    rangs = np.argsort(d_proches, axis=1)
+                    proches = np.take_along_axis(proches, rangs, axis=1)
+                    d_proches = np.take_along_axis(d_proches, rangs, axis=1)
+                    kieme = d_proches[:, -1] if kk == k else np.full(len(restants), np.inf)
+                else:
+                    kieme = np.full(len(restants), np.inf)
+                fini = tout | (kieme <= couverture) | (couverture >= limite)
+                for r in np.flatnonzero(fini):
+                    resultats[restants[r]] = [(ids[candidats[j]], round(float(d), 2))
+                                              for j, d in zip(proches[r], d_proches[r]) if d <= limite] if kk else []
+                restants = restants[~fini]
+                anneau *= 2
+        return resultats
+
+    def positions_de(self, courier_ids):
+        """{courier_id: (lon, lat)} pour ceux de ces livreurs encore dans l'index."""
+        with self.verrou:
+            return {c: tuple(self.positions[self.emplacements[c]]) for c in courier_ids if c in self.emplacements}
+
+    def demarrer(self):
+        """Abonnement aux changements AVANT le chargement : rien n'est perdu entre les deux."""
+        self.source.abonner()
+        self.source.charger(self)
+        Thread(target=self.source.suivre, args=(self,), daemon=True).start()
+        print(f"[Index spatial] {len(self)} livreurs en mémoire.")
+        return self
+
+
+class SourceRedis:
+    """Battements relus par score croissant depuis le dernier passage, puis GEOPOS par lots.
+    Les scores sont à la seconde : les livreurs de la dernière seconde sont relus (sans effet).
+    Le hash des statuts ne contient que les livreurs pris : il est relu en entier à chaque passage."""
+
+    def __init__(self, client, cle=CLE_GLOBALE, cle_battements=CLE_BATTEMENTS, cle_statuts=CLE_STATUTS,
+                 taille_lot=1000, periode=PERIODE_SYNC, periode_complete=PERIODE_RESYNC):
+        self.client = client
+        self.cle = cle
+        self.cle_battements = cle_battements
+        self.cle_statuts = cle_statuts
+        self.occupes = set() # Livreurs réservés ou en livraison au dernier passage
+        self.taille_lot = taille_lot
+        self.periode = periode
+        self.periode_complete = periode_complete
+        self.depuis = 0.0
+        self.decalage = 0.0 # Horloge Redis - horloge locale
+
+    def maintenant(self):
+        return time.time() + self.decalage
+
+    def _horloge(self):
+        secondes, micro = self.client.time()
+        self.decalage = secondes + micro / 1e6 - time.time()
+
+    def abonner(self):
+        pass # Pas d'abonnement : suivre() relit les battements depuis self.depuis
+
+    def _statuts(self, index):
+        """Relit {couriers}:status et bascule les livreurs dont la disponibilité a changé."""
+        occupes = {courier_id for courier_id, statut in self.client.hgetall(self.cle_statuts).items()
+                   if statut != DISPONIBLE}
+        for courier_id in occupes ^ self.occupes:
+            index.marquer(courier_id, courier_id not in occupes)
+        self.occupes = occupes
+
+    def _appliquer(self, index, battements):
+        for i in range(0, len(battements), self.taille_lot):
+            lot = battements[i:i + self.taille_lot]
+            positions = self.client.geopos(self.cle, *[courier_id for courier_id, _ in lot])
+            for (courier_id, vu), position in zip(lot, positions):
+                if position is None: # Désinscrit entre les deux lectures
+                    index.retirer(courier_id)
+                else:
+                    index.maj(courier_id, position[0], position[1], vu, courier_id not in self.occupes)
+        if battements:
+            self.depuis = max(self.depuis, battements[-1][1])
+
+    def charger(self, index):
+        self._horloge()
+        self._statuts(index)
+        battements = self.client.zrange(self.cle_battements, 0, -1, withscores=True)
+        self._appliquer(index, battements)
+        for courier_id in index.identifiants() - {courier_id for courier_id, _ in battements}:
+            index.retirer(courier_id) # Désinscrit ou balayé (vivacite.py)
+
+    def suivre(self, index):
+        import redis
+        derniere_complete = time.monotonic()
+        while True:
+            time.sleep(self.periode)
+            try:
+                if time.monotonic() - derniere_complete >= self.periode_complete:
+                    self.charger(index)
+                    derniere_complete = time.monotonic()
+                    continue
+                self._horloge()
+                self._statuts(index)
+                self._appliquer(index, self.client.zrangebyscore(self.cle_battements, self.depuis, "+inf",
+                                                                 withscores=True))
+            except redis.exceptions.RedisError as e:
+                print(f"[Index spatial] ⚠️ Synchronisation Redis impossible ({e}), nouvel essai dans {self.periode}s.")
+            except Exception as e: # Le thread ne doit pas mourir : l'index resterait figé
+                print(f"[Index spatial] ⚠️ Synchronisation en échec ({type(e).__name__}: {e}), "
+                      f"nouvel essai dans {self.periode}s.")
+
+
+def _epoch(date):
+    """updatedAt (datetime UTC naïf, cf. livreur_mongo.publier_position) -> s depuis l'epoch."""
+    return date.replace(tzinfo=timezone.utc).timestamp() if date else 0.0
+
+
+class SourceMongo:
+    """Chargement par curseur projeté, puis change stream sur la collection 'couriers'."""
+
+    PIPELINE = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete", "drop"]}}},
+        {"$project": {"operationType": 1, "documentKey": 1, "fullDocument.location": 1,
+                      "fullDocument.status": 1, "fullDocument.updatedAt": 1}},
+    ]
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.stream = None
+
+    def maintenant(self):
+        return time.time()
+
+    def abonner(self):
+        self.stream = self.collection.watch(self.PIPELINE, full_document="updateLookup")
+
+    def _ajouter(self, index, courier_id, doc):
+        coordonnees = (doc.get("location") or {}).get("coordinates")
+        if coordonnees:
+            index.maj(courier_id, *coordonnees, _epoch(doc.get("updatedAt")), doc.get("status") == "available")
+
+    def charger(self, index):
+        for doc in self.collection.find({}, {"location": 1, "status": 1, "updatedAt": 1}):
+            self._ajouter(index, doc["_id"], doc)
+
+    def _appliquer(self, index, change):
+        operation = change["operationType"]
+        if operation == "drop":
+            index.vider()
+        elif operation == "delete":
+            index.retirer(change["documentKey"]["_id"])
+        elif change.get("fullDocument") is not None:
+            # fullDocument est projeté sans _id : l'identifiant vient de documentKey
+            self._ajouter(index, change["documentKey"]["_id"], change["fullDocument"])
+
+    def suivre(self, index):
+        from pymongo.errors import PyMongoError
+        jeton = None
+        while True:
+            try:
+                if self.stream is None: # Réouverture après une interruption
+                    self.stream = self.collection.watch(self.PIPELINE, full_document="updateLookup",
+                                                        resume_after=jeton)
+                with self.stream:
+                    for change in self.stream:
+                        try:
+                            self._appliquer(index, change)
+                        except Exception as e: # Changement inattendu : sauté, le flux continue
+                            print(f"[Index spatial] ⚠️ Changement ignoré ({type(e).__name__}: {e}).")
+                        jeton = self.stream.resume_token
+                jeton = None # Flux invalidé (collection supprimée) : on repart de maintenant
+            except PyMongoError as e:
+                print(f"[Index spatial] ⚠️ Flux interrompu ({e}), reprise dans 1s...")
+                time.sleep(1)
+            except Exception as e: # Le thread ne doit pas mourir : l'index resterait figé
+                print(f"[Index spatial] ⚠️ Flux en échec ({type(e).__name__}: {e}), reprise dans 1s...")
+                time.sleep(1)
+            self.stream = None
@@ -0,0 +1,139 @@
+# ingestion_positions.py
+# Ingestion GPS par lots : on ne garde que la DERNIÈRE position de chaque livreur et on
+# l'écrit en GEOADD multi-membres (Redis) ou en bulk_write non ordonné (Mongo), quand le
+# tampon atteint 'taille_max' positions ou toutes les 'intervalle' secondes.
+import time
+from collections import deque
+from datetime import datetime
+from threading import Thread, Lock, Event
+
+
+class TamponPositions:
+    """Tampon de positions avec fusion par livreur et vidage sur taille ou sur délai."""
+
+    def __init__(self, ecrire, taille_max=1000, intervalle=0.5, nom="positions"):
+        self.ecrire = ecrire # fonction(liste de (courier_id, lon, lat))
+        self.taille_max = taille_max
+        self.intervalle = intervalle
+        self.nom = nom
+        self.en_attente = {} # courier_id -> (lon, lat, instant de réception)
+        self.verrou = Lock()
+        self.reveil = Event()
+        self.actif = False
+        self.thread = None
+        self.debut = time.monotonic()
+        self.stats = {"recues": 0, "fusionnees": 0, "ecrites": 0, "lots": 0, "erreurs": 0}
+        self.fraicheur = deque(maxlen=10000) # Âge (s) des positions au moment de leur écriture
+
+    def ajouter(self, courier_id, lon, lat):
+        """Non bloquant : remplace la position en attente du livreur s'il y en a une."""
+        with self.verrou:
+            if courier_id in self.en_attente:
+                self.stats["fusionnees"] += 1
+            self.en_attente[courier_id] = (lon, lat, time.monotonic())
+            self.stats["recues"] += 1
+            plein = len(self.en_attente) >= self.taille_max
+        if plein:
+            self.reveil.set()
+
+    def vider(self):
+        """Écrit tout ce qui est en attente ; retourne le nombre de positions écrites."""
+        with self.verrou:
+            lot, self.en_attente = self.en_attente, {}
+        if not lot:
+            return 0
+        try:
+            self.ecrire([(courier_id, lon, lat) for courier_id, (lon, lat, _) in lot.items()])
+        except Exception as e:
+            self.stats["erreurs"] += 1
+            print(f"[Ingestion {self.nom}] ⚠️ Échec d'écriture de {len(lot)} positions ({e}), nouvel essai au prochain lot.")
+            with self.verrou:
+                # On ne remet que les positions qui n'ont pas été remplacées entre-temps
+                for courier_id, position in lot.items():
+                    self.en_attente.setdefault(courier_id, position)
+            return 0
+        maintenant = time.monotonic()
+        self.fraicheur.extend(maintenant - recu for _, _, recu in lot.values())
+        self.stats["ecrites"] += len(lot)
+        self.stats["lots"] += 1
+        return len(lot)
+
+    def _boucle(self):
+        while self.actif:
+            self.reveil.wait(self.intervalle)
+            self.reveil.clear()
+            self.vider()
+
+    def demarrer(self):
+        self.actif = True
+        self.debut = time.monotonic()
+        self.thread = Thread(target=self._boucle, daemon=True)
+        self.thread.start()
+
+    def arreter(self):
+        self.actif = False
+        self.reveil.set()
+        if self.thread:
+            self.thread.join()
+        self.vider()
+
+    def rapport(self):
+        """Débit (positions/s reçues et écrites), taux de fusion et fraîcheur des écritures."""
+        duree = max(time.monotonic() - self.debut, 1e-9)
+        ages = sorted(self.fraicheur)
+        return {
+            "recues_s": self.stats["recues"] / duree,
+            "ecrites_s": self.stats["ecrites"] / duree,
+            "lots_s": self.stats["lots"] / duree,
+            "taux_fusion": self.stats["fusionnees"] / self.stats["recues"] if self.stats["recues"] else 0.0,
+            "fraicheur_moy": sum(ages) / len(ages) if ages else 0.0,
+            "fraicheur_p95": ages[int(0.95 * (len(ages) - 1))] if ages else 0.0,
+            "fraicheur_max": ages[-1] if ages else 0.0,
+            "erreurs": self.stats["erreurs"],
+        }
+
+    def afficher_rapport(self):
+        r = self.rapport()
+        print(f"[Ingestion {self.nom}] reçues {r['recues_s']:.0f}/s -> écrites {r['ecrites_s']:.0f}/s "
+              f"en {r['lots_s']:.1f} lots/s (fusion {r['taux_fusion']:.0%}) | "
+              f"fraîcheur moy {r['fraicheur_moy'] * 1000:.0f} ms p95 {r['fraicheur_p95'] * 1000:.0f} ms "
+              f"max {r['fraicheur_max'] * 1000:.0f} ms | erreurs {r['erreurs']}")
+
+
+# --- Écrivains par backend ---
+def ecrivain_redis(client, membres_par_commande=None):
+    """Script zones.LUA_POSITIONS (GEOADD multi-membres : un par zone touchée) ; un seul appel par
+    lot tant qu'il tient sous MEMBRES_MAX_POSITIONS livreurs, sinon plusieurs dans un pipeline."""
+    from zones import LUA_POSITIONS, CLES_POSITIONS, MEMBRES_MAX_POSITIONS, args_positions
+    membres_par_commande = min(membres_par_commande or MEMBRES_MAX_POSITIONS, MEMBRES_MAX_POSITIONS)
+    script = client.register_script(LUA_POSITIONS)
+
+    def ecrire(positions):
+        if len(positions) <= membres_par_commande:
+            script(keys=CLES_POSITIONS, args=args_positions(positions))
+            return
+        with client.pipeline(transaction=False) as pipe:
+            for i in range(0, len(positions), membres_par_commande):
+                script(keys=CLES_POSITIONS, args=args_positions(positions[i:i + membres_par_commande]), client=pipe)
+            pipe.execute()
+    return ecrire
+
+
+def ecrivain_mongo(collection):
+    """Upserts en un seul bulk_write non ordonné (même mise à jour que livreur_mongo.publier_position)."""
+    from pymongo import UpdateOne
+
+    def ecrire(positions):
+        maintenant = datetime.utcnow()
+        collection.bulk_write([
+            UpdateOne(
+                {"_id": courier_id},
+                {
+                    "$set": {"location": {"type": "Point", "coordinates": [lon, lat]}, "updatedAt": maintenant},
+                    "$setOnInsert": {"status": "available"}
+                },
+                upsert=True
+            )
+            for courier_id, lon, lat in positions
+        ], ordered=False)
+    return ecrire
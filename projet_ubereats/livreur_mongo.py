@@ -1,15 +1,16 @@
-import sys, os, random, time
+import sys, os, random, time, json, queue, socket
 from datetime import datetime
-from pymongo import MongoClient, GEOSPHERE
+from bson import json_util
+from pymongo import MongoClient
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
 from threading import Thread
+from passerelle_mongo import CHAMPS_OFFRE, CHAMPS_RESULTAT, CHAMPS_ASSIGNATION, projection
+from offres_livreur import OffresEnAttente
+from schema_mongo import creer_index
 
-if len(sys.argv) < 2:
-    print("Usage: python livreur_mongo.py <courier_id>")
-    sys.exit(1)
-
-courier_id = sys.argv[1]
+courier_id = None # Défini dans le main (le module est aussi importé par flotte.py)
+offres = None # Réflexions en cours (OffresEnAttente), créé dans le main
 
 load_dotenv()
 uri = os.getenv("MONGODB_URI")
@@ -20,6 +21,32 @@ bids = db.bids
 # NOUVEAU : Collection pour la position des livreurs
 couriers_coll = db.couriers
 
+# --- Écritures du livreur (partagées avec flotte.py) ---
+def publier_position(courier_id, location):
+    """Met à jour (ou crée) la position du livreur, sans toucher à son statut."""
+    couriers_coll.update_one(
+        {"_id": courier_id},
+        {
+            "$set": {"location": location, "updatedAt": datetime.utcnow()},
+            # Le manager ne contactera que les 'available'
+            "$setOnInsert": {"_id": courier_id, "status": "available"}
+        },
+        upsert=True
+    )
+
+def changer_statut(courier_id, status):
+    couriers_coll.update_one({"_id": courier_id}, {"$set": {"status": status}})
+
+def repondre_offre(offre, accepte=True):
+    """Accepte (ACCEPTED) ou refuse (DECLINED) une offre en changeant le statut du bid.
+    Retourne False si le bid n'est plus OFFERED : réponse arrivée après la clôture (LOST, EXPIRED),
+    qui ne doit pas écraser le résultat."""
+    resultat = bids.update_one(
+        {"_id": offre["_id"], "status": "OFFERED"},
+        {"$set": {"status": "ACCEPTED" if accepte else "DECLINED", "ts": datetime.utcnow()}}
+    )
+    return resultat.modified_count == 1
+
 # NOUVEAU: Fonction pour simuler le déplacement
 def simuler_deplacement():
     """Met à jour la position du livreur toutes les 10s."""
@@ -35,18 +62,8 @@ def simuler_deplacement():
     
     while True:
         # Mettre à jour (ou insérer si non existant)
-        couriers_coll.update_one(
-            {"_id": courier_id},
-            {
-                "$set": {
-                    "location": my_location,
-                    "status": "available", # Le manager ne contactera que les 'available'
-                    "updatedAt": datetime.utcnow()
-                },
-                "$setOnInsert": {"_id": courier_id} # Au cas où il n'existe pas
-            },
-            upsert=True
-        )
+        # Le statut n'est plus écrasé ici : un livreur en livraison reste 'on_delivery'
+        publier_position(courier_id, my_location)
         
         # Simuler un petit déplacement
         my_location["coordinates"][0] += random.uniform(-0.001, 0.001)
@@ -55,6 +72,62 @@ def simuler_deplacement():
         time.sleep(10) # Met à jour la position toutes les 10 secondes
 
 
+# --- Traitement des événements (communs aux change streams et à la passerelle) ---
+def accepter_offre(offre):
+    """Fin de la réflexion (minuteur d'OffresEnAttente) : on accepte, si l'offre est encore ouverte."""
+    if repondre_offre(offre):
+        print(f"[Livreur {courier_id}] ✅ J'accepte la course {offre['job_id']}")
+        return True
+    print(f"[Livreur {courier_id}] ⌛ Course {offre['job_id']} déjà close : acceptation ignorée.")
+    return False
+
+def traiter_offre(offre):
+    """Une offre (bid OFFERED) nous est adressée : réflexion sur un minuteur, puis acceptation."""
+    # Résumé du job recopié dans l'offre ; relecture de 'jobs' seulement pour une offre d'avant ce champ
+    job = offre.get("job") or jobs.find_one({"_id": offre["job_id"]})
+
+    if not job:
+        return
+
+    print(f"[Livreur {courier_id}] 📩 Offre reçue pour {job['pickup']} (à {offre['distance_m']}m)")
+    
+    # Simule une réflexion (1-3s) sans bloquer le flux ; accepter_offre à la fin
+    offres.recevoir(offre["job_id"], offre)
+
+def traiter_resultat(offre_perdue):
+    """Notre offre est perdue (LOST) ou a expiré (EXPIRED)."""
+    job_id = offre_perdue["job_id"]
+    status = offre_perdue["status"]
+    if offres.annuler(job_id):
+        print(f"[Livreur {courier_id}] 🛑 Réflexion sur {job_id} annulée.")
+    
+    if status == "LOST":
+        print(f"[Livreur {courier_id}] ❌ Dommage : Course {job_id} attribuée à un autre livreur.")
+    elif status == "EXPIRED":
+        print(f"[Livreur {courier_id}] ⏳ Course {job_id} a expiré (personne n'a accepté à temps).")
+
+def traiter_assignation(job_updated):
+    """On a gagné la course : livraison simulée puis retour à 'available'."""
+    print(f"\n[Livreur {courier_id}] 🚀🎉 Course {job_updated['_id']} confirmée et assignée !")
+    print(f"    -> De: {job_updated['pickup']}")
+    print(f"    -> À : {job_updated['dropoff']}\n")
+    
+    # 1. Le livreur n'est plus disponible
+    changer_statut(courier_id, "on_delivery")
+
+    # 2. Fonction interne pour simuler la livraison dans un thread
+    def simuler_livraison(job_id_livraison):
+        duree_livraison_sec = random.randint(8, 15) # Simule 8-15 sec de livraison
+        print(f"[Livreur {courier_id}] 🚚 Début de la livraison {job_id_livraison} (durée: {duree_livraison_sec}s)...")
+        time.sleep(duree_livraison_sec)
+        print(f"[Livreur {courier_id}] ✅ Livraison {job_id_livraison} terminée ! De nouveau disponible.")
+        # 3. Le livreur redevient disponible
+        changer_statut(courier_id, "available")
+
+    # 4. Lancer la simulation de livraison dans un thread pour ne pas bloquer
+    Thread(target=simuler_livraison, args=(job_updated['_id'],), daemon=True).start()
+
+
 # MODIFIÉ: Le livreur écoute les 'bids' (offres) qui lui sont envoyées
 def ecouter_offres():
     """Écoute les offres de course (bids) où ce livreur est 'targetCourier'."""
@@ -66,28 +139,13 @@ def ecouter_offres():
             "fullDocument.status": "OFFERED",
             "fullDocument.targetCourier": courier_id
         }
-    }]
-    
+    }, projection(CHAMPS_OFFRE)]
+
     with bids.watch(pipeline) as stream:
         print(f"[Livreur {courier_id}] 📍 En attente d'offres géolocalisées...")
         for change in stream:
-            offre = change["fullDocument"]
-            job = jobs.find_one({"_id": offre["job_id"]}) # Récupère les détails du job
-            
-            if not job:
-                continue
-
-            print(f"[Livreur {courier_id}] 📩 Offre reçue pour {job['pickup']} (à {offre['distance_m']}m)")
-            
-            # Simule une réflexion (1-3s)
-            time.sleep(random.uniform(1, 3))
-
-            # Accepter l'offre en changeant le statut du bid
-            bids.update_one(
-                {"_id": offre["_id"]},
-                {"$set": {"status": "ACCEPTED", "ts": datetime.utcnow()}}
-            )
-            print(f"[Livreur {courier_id}] ✅ J'accepte la course {job['_id']}")
+            with offres.traitement():
+                traiter_offre(change["fullDocument"])
 
 # --- NOUVELLE FONCTION: Pour écouter les résultats (perdu/expiré) ---
 def ecouter_resultats_offres():
@@ -98,19 +156,13 @@ def ecouter_resultats_offres():
             "fullDocument.targetCourier": courier_id,
             "fullDocument.status": {"$in": ["LOST", "EXPIRED"]}
         }
-    }]
-    
+    }, projection(CHAMPS_RESULTAT)]
+
     # On a besoin du document complet pour lire le statut
     with bids.watch(pipeline, full_document='updateLookup') as stream:
         for change in stream:
-            offre_perdue = change["fullDocument"]
-            job_id = offre_perdue["job_id"]
-            status = offre_perdue["status"]
-            
-            if status == "LOST":
-                print(f"[Livreur {courier_id}] ❌ Dommage : Course {job_id} attribuée à un autre livreur.")
-            elif status == "EXPIRED":
-                print(f"[Livreur {courier_id}] ⏳ Course {job_id} a expiré (personne n'a accepté à temps).")
+            with offres.traitement():
+                traiter_resultat(change["fullDocument"])
 # --- FIN DE LA NOUVELLE FONCTION ---
 
 # --- MODIFICATION PRINCIPALE ICI ---
@@ -120,47 +172,79 @@ def ecouter_assignations():
         "operationType": "update",
         "fullDocument.status": "ASSIGNED",
         "fullDocument.selectedCourier": courier_id
-    }}]
-    
+    }}, projection(CHAMPS_ASSIGNATION)]
+
     with jobs.watch(pipeline, full_document='updateLookup') as stream:
         for change in stream:
-            job_updated = change["fullDocument"]
-            print(f"\n[Livreur {courier_id}] 🚀🎉 Course {job_updated['_id']} confirmée et assignée !")
-            print(f"    -> De: {job_updated['pickup']}")
-            print(f"    -> À : {job_updated['dropoff']}\n")
-            
-            # 1. Le livreur n'est plus disponible
-            couriers_coll.update_one({"_id": courier_id}, {"$set": {"status": "on_delivery"}})
-
-            # 2. Fonction interne pour simuler la livraison dans un thread
-            def simuler_livraison(job_id_livraison):
-                duree_livraison_sec = random.randint(8, 15) # Simule 8-15 sec de livraison
-                print(f"[Livreur {courier_id}] 🚚 Début de la livraison {job_id_livraison} (durée: {duree_livraison_sec}s)...")
-                time.sleep(duree_livraison_sec)
-                print(f"[Livreur {courier_id}] ✅ Livraison {job_id_livraison} terminée ! De nouveau disponible.")
-                # 3. Le livreur redevient disponible
-                couriers_coll.update_one({"_id": courier_id}, {"$set": {"status": "available"}})
-
-            # 4. Lancer la simulation de livraison dans un thread pour ne pas bloquer
-            Thread(target=simuler_livraison, args=(job_updated['_id'],), daemon=True).start()
+            traiter_assignation(change["fullDocument"])
 # --- FIN DE LA MODIFICATION ---
 
+# --- Mode passerelle : les 3 flux arrivent par passerelle_mongo.py (aucun change stream ouvert ici) ---
+def ecouter_passerelle(hote="127.0.0.1", port=7070):
+    """Reçoit offres, résultats et assignations depuis la passerelle partagée."""
+    # Les offres restent traitées dans leur propre thread, comme avec le flux dédié : une relecture
+    # de 'jobs' (ou la réflexion en mode --bloquant) ne retarde pas résultats et assignations
+    a_traiter = queue.Queue()
+    def traiter_offres():
+        while True:
+            offre = a_traiter.get()
+            with offres.traitement():
+                traiter_offre(offre)
+    Thread(target=traiter_offres, daemon=True).start()
+
+    while True:
+        try:
+            with socket.create_connection((hote, port)) as sock:
+                sock.sendall((json.dumps({"courier_id": courier_id}) + "\n").encode("utf-8"))
+                print(f"[Livreur {courier_id}] 📍 Connecté à la passerelle {hote}:{port}, en attente d'offres...")
+                for ligne in sock.makefile("r", encoding="utf-8"):
+                    message = json_util.loads(ligne)
+                    if message["type"] == "offre":
+                        a_traiter.put(message["doc"])
+                    elif message["type"] == "resultat":
+                        with offres.traitement():
+                            traiter_resultat(message["doc"])
+                    elif message["type"] == "assignation":
+                        traiter_assignation(message["doc"])
+            print(f"[Livreur {courier_id}] ⚠️ Passerelle fermée, reconnexion dans 1s...")
+        except OSError as e:
+            print(f"[Livreur {courier_id}] ⚠️ Passerelle injoignable ({e}), reconnexion dans 1s...")
+        time.sleep(1)
+
 
 if __name__ == "__main__":
-    # NOUVEAU: Créer l'index 2dsphere au démarrage si besoin
-    try:
-        couriers_coll.create_index([("location", GEOSPHERE)])
-    except Exception as e:
-        print(f"Erreur index: {e}")
+    if len(sys.argv) < 2:
+        print("Usage: python livreur_mongo.py <courier_id> [--passerelle [hote:port]] [--bloquant]")
+        sys.exit(1)
+
+    courier_id = sys.argv[1]
+    # --bloquant : ancienne réflexion dans la boucle du flux d'offres (comparaison)
+    offres = OffresEnAttente(accepter_offre, reflexion=(1, 3), bloquant="--bloquant" in sys.argv)
+
+    # Index manquants (sans effet s'ils existent) : un livreur lancé seul trouve une base utilisable
+    creer_index(db)
+    # Au démarrage, le livreur est disponible (même si un ancien processus était en livraison) ;
+    # s'il n'existe pas encore, simuler_deplacement le crée directement en 'available'
+    changer_statut(courier_id, "available")
 
     # NOUVEAU: Lancer le thread de simulation de déplacement
     Thread(target=simuler_deplacement, daemon=True).start()
-    
-    # Thread pour écouter les NOUVELLES offres
-    Thread(target=ecouter_offres, daemon=True).start()
-    
-    # --- AJOUT: Thread pour écouter les RÉSULTATS (perdu/expiré) ---
-    Thread(target=ecouter_resultats_offres, daemon=True).start()
-    
-    # Boucle principale pour écouter les VICTOIRES (assignations)
-    ecouter_assignations()
+
+    try:
+        if "--passerelle" in sys.argv:
+            index = sys.argv.index("--passerelle")
+            suivant = sys.argv[index + 1] if len(sys.argv) > index + 1 else ""
+            adresse = suivant if suivant and not suivant.startswith("--") else "127.0.0.1:7070"
+            hote, port = adresse.rsplit(":", 1)
+            ecouter_passerelle(hote, int(port))
+        else:
+            # Thread pour écouter les NOUVELLES offres
+            Thread(target=ecouter_offres, daemon=True).start()
+
+            # --- AJOUT: Thread pour écouter les RÉSULTATS (perdu/expiré) ---
+            Thread(target=ecouter_resultats_offres, daemon=True).start()
+
+            # Boucle principale pour écouter les VICTOIRES (assignations)
+            ecouter_assignations()
+    except KeyboardInterrupt:
+        print(f"\n[Livreur {courier_id}] Arrêt manuel. Offres : {offres.bilan()}")
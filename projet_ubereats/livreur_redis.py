@@ -1,12 +1,18 @@
-import redis, json, sys, time, random
+import redis, sys, time, random
 from threading import Thread
+from transport_redis import TRANSPORTS, TRANSPORT_DEFAUT, ecouter_livreur, repondre
+from zones import LUA_POSITIONS, CLES_POSITIONS, DISPONIBLE, EN_LIVRAISON, args_positions, retirer_livreurs, changer_statut
+from codec import encoder_reponse
+from offres_livreur import OffresEnAttente
 
-if len(sys.argv) < 2:
-    print("Usage: python livreur_redis.py <courier_id>")
-    sys.exit(1)
-
-courier_id = sys.argv[1]
 r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+courier_id = None # Défini dans le main (le module est aussi importé par flotte.py)
+script_positions = r.register_script(LUA_POSITIONS) # Index global + index de la zone (zones.py)
+
+def reponse_offre(courier_id, data, accepte=True):
+    """Canal et message de réponse à une offre NEW_JOB_OFFER (acceptation ou refus)."""
+    job_id = data["annonce"]["job_id"]
+    return f"jobs:{job_id}:accepts", encoder_reponse(courier_id, job_id, data["distance"], accepte)
 
 # NOUVEAU: Fonction pour simuler le déplacement
 def simuler_deplacement():
@@ -18,11 +24,8 @@ def simuler_deplacement():
     
     while True:
         try:
-            # --- CORRECTION ---
-            # On passe les valeurs (lon, lat, member) comme UN SEUL TUPLE
-            # pour éviter l'ambiguïté avec les arguments nx/xx
-            r.geoadd("couriers:locations", (lon, lat, courier_id))
-            # --- FIN CORRECTION ---
+            # GEOADD dans {couriers}:locations et dans la zone courante (retrait de l'ancienne zone)
+            script_positions(keys=CLES_POSITIONS, args=args_positions([(courier_id, lon, lat)]))
             
             # Simuler un petit déplacement
             lon += random.uniform(-0.001, 0.001)
@@ -33,51 +36,70 @@ def simuler_deplacement():
             print(f"[Livreur {courier_id}] Erreur dans le thread de déplacement: {e}")
             time.sleep(10)
 
+def simuler_livraison(job_id):
+    """Réservé par le manager ('reserved'), puis 'on_delivery' : plus aucune offre jusqu'au retour."""
+    changer_statut(r, courier_id, EN_LIVRAISON)
+    duree_livraison_sec = random.randint(8, 15) # Simule 8-15 sec de livraison
+    print(f"[Livreur {courier_id}] 🚚 Début de la livraison {job_id} (durée: {duree_livraison_sec}s)...")
+    time.sleep(duree_livraison_sec)
+    changer_statut(r, courier_id, DISPONIBLE)
+    print(f"[Livreur {courier_id}] ✅ Livraison {job_id} terminée ! De nouveau disponible.")
+
 # MODIFIÉ: Le livreur n'écoute plus 'jobs:new'
-def ecouter():
-    pubsub = r.pubsub()
-    # Il écoute SEULEMENT son canal personnel
-    pubsub.subscribe(f"courier:{courier_id}:notify")
-    print(f"[Livreur {courier_id}] 📍 en attente d'offres géolocalisées...")
+# Il écoute SEULEMENT son canal personnel (Pub/Sub) ou sa boîte (Streams, messages acquittés)
+# La réflexion tourne sur un minuteur (offres_livreur.py) : la boucle ne s'arrête jamais dessus
+def ecouter(offres, transport=TRANSPORT_DEFAUT):
+    print(f"[Livreur {courier_id}] 📍 en attente d'offres géolocalisées ({transport})...")
 
-    for msg in pubsub.listen():
-        if msg["type"] != "message":
-            continue
-            
-        canal = msg["channel"]
-        data = json.loads(msg["data"])
+    for data in ecouter_livreur(r, courier_id, transport):
+        with offres.traitement():
+            # Si on reçoit une nouvelle offre de job
+            if data.get("type") == "NEW_JOB_OFFER":
+                annonce = data["annonce"]
+                distance = data["distance"]
 
-        # Si on reçoit une nouvelle offre de job
-        if data.get("type") == "NEW_JOB_OFFER":
-            annonce = data["annonce"]
-            distance = data["distance"]
-            
-            print(
-                f"[Livreur {courier_id}] 📩 Offre reçue (à {distance}m): {annonce['restaurant']} / {annonce['menu_item']} "
-                f"({annonce['reward']}€) [Durée estimée: {annonce['estimated_time']}]"
-            )
+                print(
+                    f"[Livreur {courier_id}] 📩 Offre reçue (à {distance}m): {annonce['restaurant']} / {annonce['menu_item']} "
+                    f"({annonce['reward']}€) [Durée estimée: {annonce['estimated_time']}]"
+                )
 
-            # Simule une réflexion aléatoire
-            time.sleep(random.uniform(0.5, 2.0))
+                # Réflexion aléatoire (0.5-2s) puis acceptation dans la fenêtre annoncée, sans bloquer l'écoute
+                offres.recevoir(annonce["job_id"], data, data.get("fenetre"))
 
-            # Envoie l'acceptation
-            r.publish(f"jobs:{annonce['job_id']}:accepts",
-                        json.dumps({"courier_id": courier_id, "job_id": annonce["job_id"], "distance": distance}))
-            print(f"[Livreur {courier_id}] ✅ a accepté la course {annonce['job_id']}")
+            # Si on reçoit la confirmation d'assignation
+            elif data.get("type") == "ASSIGNED":
+                print(f"[Livreur {courier_id}] 🎉 Confirmation : Course {data['job_id']} attribuée !")
+                offres.attribuee(data["job_id"])
+                Thread(target=simuler_livraison, args=(data["job_id"],), daemon=True).start()
 
-        # Si on reçoit la confirmation d'assignation
-        elif data.get("type") == "ASSIGNED":
-            print(f"[Livreur {courier_id}] 🎉 Confirmation : Course {data['job_id']} attribuée !")
-            
-        # --- AJOUT : Gérer le cas où on a perdu l'offre ---
-        elif data.get("type") == "JOB_LOST":
-            print(f"[Livreur {courier_id}] ❌ Dommage : Course {data.get('job_id', 'unknown')} attribuée à un autre livreur ou expirée.")
-        # --- FIN AJOUT ---
+            # --- AJOUT : Gérer le cas où on a perdu l'offre ---
+            elif data.get("type") == "JOB_LOST":
+                job_id = data.get("job_id", "unknown")
+                annulee = " (réflexion annulée)" if offres.annuler(job_id) else ""
+                print(f"[Livreur {courier_id}] ❌ Dommage : Course {job_id} attribuée à un autre livreur ou expirée{annulee}.")
+            # --- FIN AJOUT ---
 
 if __name__ == "__main__":
+    bloquant = "--bloquant" in sys.argv # Ancienne réflexion dans la boucle d'écoute (comparaison)
+    argv = [a for a in sys.argv if a != "--bloquant"]
+    if len(argv) < 2 or (len(argv) > 2 and argv[2] not in TRANSPORTS):
+        print(f"Usage: python livreur_redis.py <courier_id> [{'|'.join(TRANSPORTS)}] [--bloquant]")
+        sys.exit(1)
+
+    courier_id = argv[1]
+    transport = argv[2] if len(argv) > 2 else TRANSPORT_DEFAUT
+
+    def accepter(data):
+        repondre(r, *reponse_offre(courier_id, data), transport)
+        print(f"[Livreur {courier_id}] ✅ a accepté la course {data['annonce']['job_id']}")
+
+    offres = OffresEnAttente(accepter, reflexion=(0.5, 2.0), bloquant=bloquant)
+    # Au démarrage, le livreur est disponible (même si un ancien processus était en livraison)
+    changer_statut(r, courier_id, DISPONIBLE)
     try:
         # NOUVEAU: Lancer le thread de simulation
         Thread(target=simuler_deplacement, daemon=True).start()
-        ecouter()
+        ecouter(offres, transport)
     except KeyboardInterrupt:
-        print(f"\n[Livreur {courier_id}] Arrêt manuel.")
+        retirer_livreurs(r, [courier_id]) # Ne plus être candidat (sinon retiré par le balayeur)
+        print(f"\n[Livreur {courier_id}] Arrêt manuel. Offres : {offres.bilan()}")
@@ -1,8 +1,19 @@
-import uuid, time, os, random
+import uuid, time, os, random, sys, queue
+from collections import OrderedDict
 from datetime import datetime
-from pymongo import MongoClient
+from threading import Thread, Lock, Event
+from bson import json_util
+from pymongo import MongoClient, UpdateMany
+from pymongo.errors import PyMongoError, OperationFailure
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
+from passerelle_mongo import JETON_PERIME
+from politiques import ResolutionAcceptation, POLITIQUE_DEFAUT, POLITIQUES, afficher_metriques
+from catalogue import Catalogue, CatalogueVide, SourceMongo
+from vivacite import BalayeurMongo, limite_mongo
+from schema_mongo import creer_index, exiger_plans_indexes
+import metriques
+from metriques import etape, chronometre, compter
 
 load_dotenv()
 uri = os.getenv("MONGODB_URI")
@@ -14,24 +25,37 @@ restaurants_coll = db.restaurants
 menus_coll = db.menus
 couriers_coll = db.couriers # NOUVEAU
 
-# ... (fonction choisir_restaurant_et_menu reste identique) ...
+NB_CANDIDATS = 5 # Nombre de livreurs à qui la course est offerte
+
+# Écritures job + offres (et résolution) dans une transaction : MONGO_TRANSACTIONS=1 dans le .env
+# (nécessite un replica set, c'est le cas sur Atlas)
+TRANSACTIONS = os.getenv("MONGO_TRANSACTIONS", "0") == "1"
+
+def _ecrire(operations):
+    """Exécute operations(session), dans une transaction si TRANSACTIONS est activé."""
+    if not TRANSACTIONS:
+        return operations(None)
+    with client.start_session() as session:
+        return session.with_transaction(operations)
+
+# Catalogue en cache (catalogue.py) : plus de $sample par course, ni de ré-essai sur
+# un restaurant sans menu ; chargé au premier appel puis suivi par change stream
+catalogue = None
+
+@chronometre("catalogue")
 def choisir_restaurant_et_menu():
-    # ... (code identique) ...
-    random_restaurant_cursor = restaurants_coll.aggregate([{"$sample": {"size": 1}}])
+    global catalogue
+    if catalogue is None:
+        catalogue = Catalogue(SourceMongo(db)).demarrer()
     try:
-        restaurant = next(random_restaurant_cursor)
-    except StopIteration:
-        raise Exception("⚠️ Aucun restaurant trouvé. Exécutez d'abord populate_mongo.py")
-    random_menu_cursor = menus_coll.aggregate([
-        {"$match": {"restaurant_id": restaurant["_id"]}},
-        {"$sample": {"size": 1}}
-    ])
-    try:
-        menu = next(random_menu_cursor)
-    except StopIteration:
-        print(f"Avertissement: Restaurant {restaurant['_id']} n'a pas de menu, ré-essai...")
-        return choisir_restaurant_et_menu() 
-    return restaurant, menu
+        return catalogue.choisir()
+    except CatalogueVide as e:
+        raise CatalogueVide("⚠️ Aucun restaurant trouvé. Exécutez d'abord populate_mongo.py") from e
+
+
+def resume_job(job):
+    """Résumé compact du job recopié dans chaque offre (ce qu'affiche le livreur)."""
+    return {"pickup": job["pickup"], "dropoff": job["dropoff"], "reward": job["reward"], "menu_item": job["menu_item"]}
 
 
 # MODIFIÉ: Ne publie plus, mais "offre" la course aux livreurs proches
@@ -40,7 +64,7 @@ def offrir_course_aux_livreurs_proches(restaurant, menu):
     # 1. Récupérer la localisation du restaurant
     restaurant_loc = restaurant["location"] # [lon, lat]
     
-    # 2. Trouver les 5 livreurs 'available' les plus proches
+    # 2. Trouver les NB_CANDIDATS livreurs 'available' les plus proches
     # --- MODIFICATION: Suppression de maxDistance ---
     # On cherche les 5 plus proches, quelle que soit leur distance.
     pipeline = [
@@ -48,21 +72,25 @@ def offrir_course_aux_livreurs_proches(restaurant, menu):
             "$geoNear": {
                 "near": restaurant_loc,
                 "distanceField": "distance_m", # Nom du champ qui contiendra la distance
-                "query": {"status": "available"}, # Ne chercher que les livreurs dispo
+                # Ne chercher que les livreurs dispo ET vivants (position reçue depuis moins de TTL_VIVANT s)
+                "query": {"status": "available", "updatedAt": limite_mongo()},
                 "spherical": True
                 # "maxDistance" a été supprimé
             }
         },
         {
-            "$limit": 5 # On prend les 5 plus proches
+            "$limit": NB_CANDIDATS # On prend les k plus proches
         }
     ]
     # --- FIN DE LA MODIFICATION ---
     
-    livreurs_proches = list(couriers_coll.aggregate(pipeline))
+    compter("courses")
+    with etape("geo"):
+        livreurs_proches = list(couriers_coll.aggregate(pipeline))
     
     if not livreurs_proches:
         print("[Manager] ❌ Aucun livreur disponible (la collection 'couriers' est vide ou aucun n'est 'available').")
+        compter("sans_livreur")
         return None, [], [] # Retourne None (pas de job) et listes vides
 
     # 3. Créer le Job
@@ -77,107 +105,253 @@ def offrir_course_aux_livreurs_proches(restaurant, menu):
         "status": "PENDING", # Le job n'est pas "OPEN", il est "en attente d'acceptation"
         "selectedCourier": None, "createdAt": datetime.utcnow()
     }
-    jobs.insert_one(job)
-    print(f"[Manager] Annonce {job_id} ({pickup}) créée.")
 
-    # 4. Envoyer les offres (via la collection 'bids')
-    offres_envoyees_ids = []
-    targeted_courier_ids = [] # --- AJOUT ---
-    print(f"[Manager] 📡 Envoi d'offres à {len(livreurs_proches)} livreur(s) proche(s)...")
-    
+    # 4. Préparer les offres (via la collection 'bids')
+    # Chaque offre porte un résumé du job : le livreur n'a plus à relire 'jobs' pour la lire
+    resume = resume_job(job)
+    offres = []
     for livreur in livreurs_proches:
-        offre = {
+        offres.append({
             "_id": str(uuid.uuid4()),
             "job_id": job_id,
             "targetCourier": livreur["_id"],
             "status": "OFFERED", # Le livreur écoute ce statut
             "distance_m": round(livreur["distance_m"], 2),
+            "job": resume,
             "ts_offer": datetime.utcnow()
-        }
-        bids.insert_one(offre)
-        offres_envoyees_ids.append(offre["_id"])
-        targeted_courier_ids.append(livreur["_id"]) # --- AJOUT ---
-        print(f"    -> Offre envoyée à {livreur['_id']} (à {offre['distance_m']}m)")
+        })
+
+    # 5. Job puis toutes les offres en un seul lot (2 allers-retours au lieu de 1 + k)
+    # Le job est écrit d'abord : après un arrêt entre les deux écritures, aucune offre ne reste sans
+    # job PENDING (reprendre_courses_en_attente part des jobs). Le livreur, lui, ne relit plus le job.
+    # En transaction, les deux étapes n'incluent pas le commit
+    def operations(session):
+        with etape("ecriture_job"):
+            jobs.insert_one(job, session=session)
+        with etape("offres"):
+            bids.insert_many(offres, ordered=False, session=session)
+    _ecrire(operations)
+    compter("offres", len(offres))
+
+    print(f"[Manager] Annonce {job_id} ({pickup}) créée.")
+    print(f"[Manager] 📡 Offres envoyées à {len(offres)} livreur(s) proche(s) :")
+    offres_envoyees_ids = [offre["_id"] for offre in offres]
+    targeted_courier_ids = [offre["targetCourier"] for offre in offres]
+    for offre in offres:
+        print(f"    -> {offre['targetCourier']} (à {offre['distance_m']}m)")
         
     return job_id, offres_envoyees_ids, targeted_courier_ids # --- MODIFIÉ ---
 
-# MODIFIÉ: N'attend plus les 'insert', mais les 'update' sur les offres envoyées
-def attendre_acceptations(job_id, offres_ids, duree=10):
-    
-    pipeline = [{
-        "$match": {
-            "operationType": "update",
-            "fullDocument.status": "ACCEPTED",
-            "fullDocument.job_id": job_id,
-            "fullDocument._id": {"$in": offres_ids} # N'écoute que les offres qu'on a envoyées
-        }
-    }]
-    
-    candidats = []
-    with bids.watch(pipeline, full_document='updateLookup') as stream:
-        print(f"[Manager] En attente d'acceptations pour {job_id} (pendant {duree}s)...")
-        start = time.time()
-        
-        while time.time() - start < duree:
-            change = stream.try_next() 
-            if change is None:
-                time.sleep(0.1) 
-                continue 
+# --- UN change stream d'acceptations pour tout le manager ---
+# Au lieu d'un bids.watch() par course (nouveau curseur + try_next/sleep(0.1)), un flux unique
+# attend côté serveur (max_await_time_ms) et route chaque réponse vers l'attente de son job_id.
+# Son jeton de reprise est sauvegardé : un manager relancé reprend le flux là où il s'était arrêté.
+FICHIER_JETON = ".manager_mongo_jeton.json"
+
+class FluxAcceptations:
+    PIPELINE = [{"$match": {"operationType": "update", "fullDocument.status": {"$in": ["ACCEPTED", "DECLINED"]}}}]
+
+    def __init__(self, collection, fichier_jeton=FICHIER_JETON, attente_max_ms=1000, max_orphelins=10000):
+        self.collection = collection
+        self.fichier_jeton = fichier_jeton
+        self.attente_max_ms = attente_max_ms
+        self.max_orphelins = max_orphelins
+        self.attentes = {} # job_id -> queue.Queue des offres répondues
+        # Réponses arrivées avant l'inscription de leur job (offres déjà insérées) ou après sa fin
+        self.orphelins = OrderedDict() # job_id -> [offre, ...], les plus anciens évincés d'abord
+        self.verrou = Lock()
+        self.ouvert = Event()
+        self.jeton = self._charger_jeton()
+        self.derniere_sauvegarde = 0.0
+
+    def _charger_jeton(self):
+        if not os.path.exists(self.fichier_jeton):
+            return None
+        with open(self.fichier_jeton, encoding="utf-8") as f:
+            return json_util.loads(f.read())
+
+    def sauver_jeton(self, force=False):
+        # Au plus une écriture par seconde, comme la passerelle
+        if self.jeton is None or (not force and time.time() - self.derniere_sauvegarde < 1.0):
+            return
+        self.derniere_sauvegarde = time.time()
+        with open(self.fichier_jeton, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps(self.jeton))
+
+    def inscrire(self, job_id):
+        file = queue.Queue()
+        with self.verrou:
+            self.attentes[job_id] = file
+            for offre in self.orphelins.pop(job_id, []):
+                file.put(offre)
+        return file
+
+    def desinscrire(self, job_id):
+        with self.verrou:
+            self.attentes.pop(job_id, None)
+
+    def _router(self, offre):
+        with self.verrou:
+            file = self.attentes.get(offre["job_id"])
+            if file is None:
+                self.orphelins.setdefault(offre["job_id"], []).append(offre)
+                self.orphelins.move_to_end(offre["job_id"])
+                while len(self.orphelins) > self.max_orphelins:
+                    self.orphelins.popitem(last=False)
+                return
+        file.put(offre)
+
+    def _boucle(self):
+        while True:
+            try:
+                with self.collection.watch(self.PIPELINE, full_document="updateLookup",
+                                           max_await_time_ms=self.attente_max_ms, resume_after=self.jeton) as stream:
+                    self.ouvert.set()
+                    while True:
+                        change = stream.try_next() # Bloque au plus attente_max_ms côté serveur
+                        if change is not None and change["fullDocument"] is not None:
+                            self._router(change["fullDocument"])
+                        self.jeton = stream.resume_token
+                        self.sauver_jeton()
+            except OperationFailure as e:
+                if e.code in JETON_PERIME:
+                    print("[Manager] ⚠️ Jeton de reprise périmé, reprise du flux à partir de maintenant.")
+                    self.jeton = None
+                else:
+                    print(f"[Manager] ⚠️ Flux d'acceptations en erreur ({e}), reprise dans 1s...")
+                    time.sleep(1)
+            except PyMongoError as e:
+                print(f"[Manager] ⚠️ Flux d'acceptations interrompu ({e}), reprise dans 1s...")
+                time.sleep(1)
+
+    def demarrer(self, attente_ouverture=10):
+        Thread(target=self._boucle, daemon=True).start()
+        # Le flux doit être ouvert avant la 1re offre, sinon ses réponses seraient manquées
+        self.ouvert.wait(attente_ouverture)
+        return self
+
+flux_acceptations = None
+verrou_flux = Lock()
+
+def _flux():
+    global flux_acceptations
+    with verrou_flux: # Plusieurs courses peuvent attendre en parallèle (bench_dispatch.py)
+        if flux_acceptations is None:
+            flux_acceptations = FluxAcceptations(bids).demarrer()
+    return flux_acceptations
+
+# MODIFIÉ: Les 'update' des offres envoyées arrivent par le flux partagé
+# 'targeted_courier_ids' est trié du plus proche au plus lointain (ordre du $geoNear)
+@chronometre("attente_acceptation")
+def attendre_acceptations(job_id, offres_ids, targeted_courier_ids, duree=10, politique=POLITIQUE_DEFAUT):
+    offres_ids = set(offres_ids) # N'écoute que les offres qu'on a envoyées
+    file = _flux().inscrire(job_id)
+    resolution = ResolutionAcceptation(targeted_courier_ids, politique, duree)
+    candidats = {} # courier_id -> {courier_id, distance, bid_id}
+    print(f"[Manager] En attente d'acceptations pour {job_id} (politique '{politique}', max {duree}s)...")
+
+    try:
+        while not resolution.decide and resolution.temps_restant() > 0:
+            try:
+                offre = file.get(timeout=resolution.temps_restant())
+            except queue.Empty:
+                break
+            if offre["_id"] not in offres_ids:
+                continue
+
+            if offre["status"] == "DECLINED":
+                print(f"[Manager] 👎 Refus de {offre['targetCourier']}")
+                resolution.refuser(offre["targetCourier"])
+                continue
 
-            offre_acceptee = change["fullDocument"]
             candidat = {
-                "courier_id": offre_acceptee["targetCourier"],
-                "distance": offre_acceptee["distance_m"],
-                "bid_id": offre_acceptee["_id"]
+                "courier_id": offre["targetCourier"],
+                "distance": offre["distance_m"],
+                "bid_id": offre["_id"]
             }
             print(f"[Manager] 👍 Acceptation de {candidat['courier_id']} (distance {candidat['distance']})")
-            candidats.append(candidat)
-            
-            # On continue de collecter pour laisser les autres accepter
-        
-        print("[Manager] Temps d'attente écoulé.")
-        
-        if candidats:
-             candidats_tries = sorted(candidats, key=lambda x: x['distance'])
-             print(f"[Manager] Le plus proche des acceptants est {candidats_tries[0]['courier_id']}.")
-             return candidats_tries[0] # On retourne le meilleur
-        return None
+            candidats[candidat["courier_id"]] = candidat
+            resolution.accepter(candidat["courier_id"])
+    finally:
+        flux_acceptations.desinscrire(job_id)
+
+    gagnant = resolution.cloturer()
+    compter("attribuees" if gagnant else "sans_acceptation")
+    print(f"[Manager] Fenêtre fermée après {time.monotonic() - resolution.debut:.2f}s.")
+
+    if gagnant:
+        print(f"[Manager] Gagnant retenu : {gagnant}.")
+        return candidats[gagnant]
+    return None
 
 # --- MODIFICATION: Ajout de 'all_targeted_ids' ---
+# Sans gagnant, le job passe à EXPIRED et tous les bids prennent 'status_echec'
+@chronometre("notification")
 def notifier_selection(job_id, courier_id_gagnant, all_targeted_ids, status_echec="LOST"):
     
-    # S'il y a un gagnant
+    # Statut du job : ASSIGNED s'il y a un gagnant, sinon EXPIRED
     if courier_id_gagnant:
-        # On met le job à ASSIGNED
-        jobs.update_one(
-            {"_id": job_id}, 
-            {"$set":{"status":"ASSIGNED","selectedCourier": courier_id_gagnant}}
-        )
-        # On met le bid gagnant à "WON"
-        bids.update_many(
+        maj_job = {"$set": {"status": "ASSIGNED", "selectedCourier": courier_id_gagnant}}
+    else:
+        maj_job = {"$set": {"status": "EXPIRED"}}
+
+    # Gagnant -> "WON", les autres -> "LOST" ou "EXPIRED" (le livreur écoutera ce changement),
+    # dans un seul bulk_write ordonné
+    operations_bids = []
+    if courier_id_gagnant:
+        operations_bids.append(UpdateMany(
             {"job_id": job_id, "targetCourier": courier_id_gagnant},
             {"$set": {"status": "WON"}}
-        )
+        ))
+    operations_bids.append(UpdateMany(
+        {"job_id": job_id, "targetCourier": {"$in": all_targeted_ids, "$ne": courier_id_gagnant}},
+        {"$set": {"status": status_echec}}
+    ))
+
+    def operations(session):
+        jobs.update_one({"_id": job_id}, maj_job, session=session)
+        return bids.bulk_write(operations_bids, ordered=True, session=session)
+    result = _ecrire(operations)
+
+    if courier_id_gagnant:
         print(f"[Manager] ✅ Course {job_id} attribuée au plus proche: {courier_id_gagnant}")
-    
-    # On met les autres bids (ceux qui ne sont pas le gagnant) à "LOST" ou "EXPIRED"
-    # Le livreur écoutera ce changement
-    query_perdants = {
-        "job_id": job_id, 
-        "targetCourier": {"$in": all_targeted_ids, "$ne": courier_id_gagnant}
-    }
-    update_perdants = {"$set": {"status": status_echec}}
-    
-    result = bids.update_many(query_perdants, update_perdants)
-    
-    if result.modified_count > 0:
-        print(f"[Manager] 🔔 Notifié les {result.modified_count} autres livreurs (statut {status_echec}).")
+    perdants = result.modified_count - (1 if courier_id_gagnant else 0)
+    if perdants > 0:
+        print(f"[Manager] 🔔 Notifié les {perdants} autres livreurs (statut {status_echec}).")
+
+# Au démarrage : les courses restées PENDING (manager arrêté pendant la fenêtre) sont résolues
+# d'après l'état des 'bids' : le plus proche des livreurs ayant accepté, sinon EXPIRED.
+# Suppose un seul manager à la fois sur la base.
+def reprendre_courses_en_attente():
+    reprises = 0
+    for job in jobs.find({"status": "PENDING"}, {"_id": 1}):
+        offres = list(bids.find({"job_id": job["_id"]}, {"targetCourier": 1, "status": 1, "distance_m": 1})
+                      .sort("distance_m", 1))
+        cibles = [offre["targetCourier"] for offre in offres]
+        acceptees = [offre for offre in offres if offre["status"] == "ACCEPTED"]
+        if acceptees:
+            notifier_selection(job["_id"], acceptees[0]["targetCourier"], cibles)
+        else:
+            notifier_selection(job["_id"], None, cibles, status_echec="EXPIRED")
+        reprises += 1
+    if reprises:
+        print(f"[Manager] ♻️ {reprises} course(s) PENDING d'une exécution précédente résolue(s).")
 
 # --- MAIN MODIFIÉ ---
 if __name__ == "__main__":
     MAX_COURSES = 5
+    politique = sys.argv[1] if len(sys.argv) > 1 else POLITIQUE_DEFAUT
+    if politique not in POLITIQUES:
+        print(f"Usage: python manager_mongo.py [{'|'.join(POLITIQUES)}]")
+        sys.exit(1)
     print("[Manager] Lancement du cycle de 5 courses GÉO...")
-    
+    creer_index(db) # Index manquants (notamment le (status, location) du $geoNear)
+    exiger_plans_indexes(db) # $geoNear, acceptations, notifications : aucun COLLSCAN, sinon arrêt
+    _flux() # Flux ouvert (ou repris depuis le jeton sauvegardé) avant la 1re offre
+    reprendre_courses_en_attente()
+    balayeur = BalayeurMongo(couriers_coll).demarrer() # Livreurs morts retirés de 'couriers'
+    metriques.demarrer(nom_processus="Manager") # Si METRIQUES=1 : /metrics + résumé périodique
+
     try:
         for i in range(MAX_COURSES):
             print(f"\n=== [Manager] 🚀 Course {i+1}/{MAX_COURSES} ===")
@@ -190,14 +364,13 @@ if __name__ == "__main__":
                 time.sleep(2)
                 continue # Passe à la course suivante si aucun livreur trouvé
 
-            candidat_gagnant = attendre_acceptations(job_id, offres_envoyees_ids, duree=10)
+            candidat_gagnant = attendre_acceptations(job_id, offres_envoyees_ids, targeted_courier_ids, duree=10, politique=politique)
             
             if candidat_gagnant:
                 # --- MODIFIÉ: On passe la liste des livreurs contactés ---
                 notifier_selection(job_id, candidat_gagnant["courier_id"], targeted_courier_ids)
             else:
                 print("[Manager] ❌ Aucun livreur n'a accepté cette course à temps.")
-                jobs.update_one({"_id": job_id}, {"$set":{"status":"EXPIRED"}})
                 # --- MODIFIÉ: On notifie tout le monde de l'échec ---
                 notifier_selection(job_id, None, targeted_courier_ids, status_echec="EXPIRED")
 
@@ -206,3 +379,8 @@ if __name__ == "__main__":
         print("\n[Manager] ✅ Fin du cycle de courses.")
     except KeyboardInterrupt:
         print("\n[Manager] Arrêt manuel.")
+    flux_acceptations.sauver_jeton(force=True)
+    balayeur.arreter()
+    afficher_metriques()
+    if metriques.ACTIF:
+        metriques.afficher_resume("Manager")
@@ -1,30 +1,293 @@
-import redis, json, time, uuid, random
+import redis, time, uuid, random, sys
+from politiques import ResolutionAcceptation, POLITIQUE_DEFAUT, POLITIQUES, afficher_metriques
+from catalogue import Catalogue, CatalogueVide, SourceRedis
+from cycle_jobs import Archiveur, enregistrer_job, terminer_job
+from vivacite import BalayeurRedis
+import metriques
+from metriques import etape, chronometre, compter
+from transport_redis import (STREAMS, TRANSPORTS, TRANSPORT_DEFAUT, RETARD_MAX,
+                             envoyer, ouvrir_acceptations)
+from zones import CLE_GLOBALE, CLE_BATTEMENTS, CLE_STATUTS, TTL_VIVANT, DISPONIBLE, RESERVE, voisinage
+from codec import gabarit_offre, encoder_offre, encoder_assignation, encoder_perte
 
 r = redis.Redis(host="localhost", port=6379, decode_responses=True)
 
-# ... (fonction choisir_restaurant_et_menu reste identique) ...
+# Catalogue en cache (catalogue.py) : tirage en O(1) sans aller-retour Redis,
+# chargé au premier appel puis tenu à jour par les notifications keyspace
+catalogue = None
+
+@chronometre("catalogue")
 def choisir_restaurant_et_menu():
-    rest_key = r.srandmember("restaurants:index")
-    if not rest_key:
-        raise Exception("⚠️ Aucun restaurant trouvé. Exécute d'abord populate_redis.py")
-    restaurant = r.hgetall(rest_key)
-    menus_key = f"{rest_key}:menus"
-    menu_key = r.srandmember(menus_key)
-    menu = r.hgetall(menu_key)
-    return restaurant, menu
-
-# MODIFIÉ: Ne publie plus globalement, mais cible les livreurs
-def publier_annonce_geo():
-    job_id = str(uuid.uuid4())
+    global catalogue
+    if catalogue is None:
+        catalogue = Catalogue(SourceRedis(r)).demarrer()
+    try:
+        return catalogue.choisir()
+    except CatalogueVide as e:
+        raise CatalogueVide("⚠️ Aucun restaurant trouvé. Exécute d'abord populate_redis.py") from e
+
+# --- Recherche adaptative (GEOSEARCH ... BYRADIUS) ---
+# On commence petit et on double le rayon jusqu'à trouver k livreurs : dans une zone
+# dense, Redis n'examine que les quelques livreurs du voisinage au lieu de 1000 km.
+RAYON_MIN_KM = 0.5
+RAYON_MAX_KM = 1000 # Même garantie qu'avant : les k plus proches dans 1000 km
+NB_CANDIDATS = 5
+duree_fenetre = 10 # s : fenêtre d'acceptation, annoncée aux livreurs dans chaque offre (codec)
+PAS_ZONE = 0.01 # ~1 km : granularité de la mémoire des rayons
+
+rayons_par_zone = {} # (lon, lat) arrondis -> dernier rayon qui a suffi
+
+def _zone(lon, lat):
+    return (round(lon / PAS_ZONE), round(lat / PAS_ZONE))
+
+def rayon_initial(lon, lat):
+    return rayons_par_zone.get(_zone(lon, lat), RAYON_MIN_KM)
+
+def memoriser_rayon(lon, lat, rayon_depart, rayon_utilise):
+    if rayon_utilise > rayon_depart:
+        rayons_par_zone[_zone(lon, lat)] = rayon_utilise # Il a fallu élargir
+    else:
+        # Assez large du premier coup : on resserre doucement pour suivre la densité
+        rayons_par_zone[_zone(lon, lat)] = max(RAYON_MIN_KM, rayon_utilise * 0.75)
+
+# KEYS[1] = index de toute la ville, KEYS[2] = {couriers}:heartbeat, KEYS[3] = {couriers}:status,
+# KEYS[4..] = les zones voisines du point (zones.py) : elles suffisent tant que le rayon reste sous
+# 'couverture' km, sinon index global. Toutes ces clés sont dans le slot {couriers} (Redis Cluster).
+# Les livreurs sans battement récent (morts, pas encore balayés) et ceux qui ne sont pas disponibles
+# (réservés, en livraison : {couriers}:status) sont sautés. GEOSEARCH renvoie d'abord 2k membres ;
+# s'il en reste moins de k après filtrage, on double COUNT au même rayon tant que le rayon n'est pas
+# épuisé, puis seulement on élargit. Le rayon retourné (mémorisé par zone) est celui où la géométrie
+# seule donnait k livreurs : un rayon atteint à cause du filtrage n'est pas retenu.
+# Un livreur sans battement du tout (clé de banc d'essai) compte comme vivant.
+LUA_RECHERCHE = f"""
+local TTL_VIVANT, DISPONIBLE = {TTL_VIVANT}, '{DISPONIBLE}'
+""" + """
+local CLE_BATTEMENTS, CLE_STATUTS = KEYS[2], KEYS[3]
+local limite_vivant = tonumber(redis.call('TIME')[1]) - TTL_VIVANT
+
+local function geosearch(cle, lon, lat, rayon, compte)
+    return redis.call('GEOSEARCH', cle, 'FROMLONLAT', lon, lat, 'BYRADIUS', rayon, 'km',
+                      'ASC', 'COUNT', compte, 'WITHDIST')
+end
+
+-- Les 'compte' plus proches dans le rayon (zones voisines fusionnées, ou index global) ;
+-- epuise = vrai si le rayon ne contient pas d'autres membres
+local function proches_dans(lon, lat, rayon, compte, couverture)
+    if rayon > couverture then
+        local items = geosearch(KEYS[1], lon, lat, rayon, compte)
+        return items, #items < compte
+    end
+    local items, epuise = {}, true
+    for i = 4, #KEYS do
+        local trouves = geosearch(KEYS[i], lon, lat, rayon, compte)
+        if #trouves >= compte then
+            epuise = false
+        end
+        for _, item in ipairs(trouves) do
+            items[#items + 1] = item
+        end
+    end
+    table.sort(items, function(a, b) return tonumber(a[2]) < tonumber(b[2]) end)
+    if not epuise then
+        -- Au-delà des 'compte' premiers, une zone tronquée peut cacher plus proche
+        for i = #items, compte + 1, -1 do
+            items[i] = nil
+        end
+    end
+    return items, epuise
+end
+
+-- Verdict par livreur, gardé d'une itération à l'autre : quand la plupart des proches sont pris,
+-- chaque COUNT ou rayon plus grand ne relit que les nouveaux membres
+local verdicts = {}
+
+local function disponibles(items, k)
+    local gardes = {}
+    for _, item in ipairs(items) do
+        local libre = verdicts[item[1]]
+        if libre == nil then
+            local vu = redis.call('ZSCORE', CLE_BATTEMENTS, item[1])
+            local statut = redis.call('HGET', CLE_STATUTS, item[1])
+            libre = (not vu or tonumber(vu) >= limite_vivant) and (not statut or statut == DISPONIBLE)
+            verdicts[item[1]] = libre
+        end
+        if libre then
+            gardes[#gardes + 1] = item
+            if #gardes >= k then
+                break
+            end
+        end
+    end
+    return gardes
+end
+
+local function recherche(lon, lat, rayon, rayon_max, k, couverture)
+    local compte, rayon_geo = 2 * k, nil
+    while true do
+        local items, epuise = proches_dans(lon, lat, rayon, compte, couverture)
+        if not rayon_geo and #items >= k then
+            rayon_geo = rayon
+        end
+        local proches = disponibles(items, k)
+        if #proches >= k or (epuise and rayon >= rayon_max) then
+            return proches, rayon_geo or rayon
+        end
+        if epuise then
+            rayon = math.min(rayon * 2, rayon_max)
+        else
+            compte = compte * 2
+        end
+    end
+end
+"""
+
+# Recherche seule : ARGV = lon, lat, rayon_depart, rayon_max, k, couverture
+LUA_CHERCHER = LUA_RECHERCHE + """
+local proches, rayon = recherche(ARGV[1], ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6]))
+local resultat = {tostring(rayon)}
+for _, item in ipairs(proches) do
+    resultat[#resultat + 1] = item[1]
+    resultat[#resultat + 1] = tostring(math.floor(tonumber(item[2]) * 100000 + 0.5) / 100)
+end
+return resultat
+"""
+
+# --- Recherche + offres Pub/Sub dans le script (les canaux ne sont pas des clés) ---
+# ARGV = lon, lat, rayon_depart, rayon_max, k, offre avant/après la distance (codec.gabarit_offre), couverture
+# Le job (job:{id}, hors du slot {couriers}) est écrit juste avant, dans le même pipeline.
+LUA_PUBLIER = LUA_RECHERCHE + """
+local proches, rayon = recherche(ARGV[1], ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[8]))
+local resultat = {tostring(rayon)}
+for _, item in ipairs(proches) do
+    local courier_id = item[1]
+    local distance_m = tostring(math.floor(tonumber(item[2]) * 100000 + 0.5) / 100)
+    redis.call('PUBLISH', 'courier:' .. courier_id .. ':notify', ARGV[6] .. distance_m .. ARGV[7])
+    resultat[#resultat + 1] = courier_id
+    resultat[#resultat + 1] = distance_m
+end
+return resultat
+"""
+script_chercher = r.register_script(LUA_CHERCHER)
+script_publier = r.register_script(LUA_PUBLIER)
+lua_disponible = True # Passe à False si le serveur refuse les scripts (repli sur pipeline)
+
+def _lire_resultat(resultat):
+    """[rayon, id1, dist1, id2, dist2, ...] -> ({courier_id: distance_m}, rayon_km)"""
+    candidats = {resultat[i]: float(resultat[i + 1]) for i in range(1, len(resultat), 2)}
+    return candidats, float(resultat[0])
+
+def ecrire_job(pipe, job_id, annonce):
+    """Hash job:{id} avec son TTL de sécurité (cycle_jobs.py) ; 'pipe' peut être un pipeline redis.asyncio."""
+    pipe.hset(f"job:{job_id}", mapping=annonce)
+    enregistrer_job(pipe, job_id)
+
+def cles_recherche(lon, lat, cle=CLE_GLOBALE):
+    """KEYS des scripts de recherche et couverture des zones voisines.
+    Les zones ne sont utilisées que pour l'index des livreurs (une autre clé n'en a pas)."""
+    cles_zones, couverture = voisinage(lon, lat) if cle == CLE_GLOBALE else ([], 0)
+    return [cle, CLE_BATTEMENTS, CLE_STATUTS, *cles_zones], couverture
+
+def chercher_livreurs_proches(lon, lat, rayon_depart=RAYON_MIN_KM, k=NB_CANDIDATS, cle=CLE_GLOBALE):
+    """Recherche adaptative seule, sans créer de job (benchmark, outils)."""
+    keys, couverture = cles_recherche(lon, lat, cle)
+    return _lire_resultat(script_chercher(keys=keys, args=[lon, lat, rayon_depart, RAYON_MAX_KM, k, couverture]))
+
+@chronometre("publication_lua") # Écriture du job + recherche géo + offres Pub/Sub, en un aller-retour
+def _publier_lua(job_id, lon, lat, annonce, rayon_depart, transport):
+    keys, couverture = cles_recherche(lon, lat)
+    with r.pipeline(transaction=False) as pipe:
+        ecrire_job(pipe, job_id, annonce)
+        if transport == STREAMS:
+            # Boîtes courier:{id}:inbox hors du slot {couriers} : 2k candidats, offres en Python
+            script_chercher(keys=keys, args=[lon, lat, rayon_depart, RAYON_MAX_KM, 2 * NB_CANDIDATS, couverture],
+                            client=pipe)
+        else:
+            script_publier(keys=keys, args=[lon, lat, rayon_depart, RAYON_MAX_KM, NB_CANDIDATS,
+                                            *gabarit_offre(annonce, fenetre=duree_fenetre), couverture], client=pipe)
+        candidats, rayon = _lire_resultat(pipe.execute()[-1])
+    if transport == STREAMS:
+        candidats = _envoyer_offres(candidats, annonce, transport)
+    return candidats, rayon
+
+def filtrer_vivants(livreurs_proches, verdicts=None):
+    """Même filtre que le script Lua : battement récent (ou aucun battement connu) et disponible
+    (aucun statut, ou 'available'). 'livreurs_proches' : [(courier_id, ...), ...] comme GEOSEARCH.
+    'verdicts' ({courier_id: bool}, complété ici) évite de relire les livreurs déjà examinés."""
+    if verdicts is None:
+        verdicts = {}
+    ids = [courier_id for courier_id, _ in livreurs_proches if courier_id not in verdicts]
+    if ids:
+        with r.pipeline(transaction=False) as pipe:
+            pipe.time()
+            pipe.zmscore(CLE_BATTEMENTS, ids)
+            pipe.hmget(CLE_STATUTS, ids)
+            (secondes, _), vus, statuts = pipe.execute()
+        limite = secondes - TTL_VIVANT
+        for courier_id, vu, statut in zip(ids, vus, statuts):
+            verdicts[courier_id] = (vu is None or vu >= limite) and statut in (None, DISPONIBLE)
+    return [l for l in livreurs_proches if verdicts[l[0]]]
+
+def _publier_pipeline(job_id, lon, lat, annonce, rayon_depart, transport):
+    """Repli sans Lua : écriture + 1re recherche, élargissements éventuels, puis toutes les offres.
+    La recherche se fait sur l'index global (pas de fusion des zones sans script)."""
+    rayon = rayon_depart
+    nb_cherches = 2 * NB_CANDIDATS if transport == STREAMS else NB_CANDIDATS # Marge pour la backpressure
+    with etape("ecriture_job_geo"), r.pipeline(transaction=False) as pipe:
+        ecrire_job(pipe, job_id, annonce)
+        pipe.geosearch(CLE_GLOBALE, longitude=lon, latitude=lat, radius=rayon, unit="km",
+                       sort="ASC", count=2 * nb_cherches, withdist=True)
+        _, _, livreurs_proches = pipe.execute()
+    with etape("geo"):
+        livreurs_proches, rayon = _elargir(lon, lat, rayon, nb_cherches, livreurs_proches)
+
+    candidats = {courier_id: round(distance_km * 1000, 2) for courier_id, distance_km in livreurs_proches}
+    return _envoyer_offres(candidats, annonce, transport), rayon
+
+def _elargir(lon, lat, rayon, k, bruts):
+    """Même boucle que recherche() dans LUA_RECHERCHE, sur l'index global : 'bruts' est le premier
+    GEOSEARCH (COUNT 2k) ; COUNT double tant que le rayon n'est pas épuisé, puis le rayon double.
+    Retourne (les k premiers disponibles, rayon à mémoriser)."""
+    compte, rayon_geo, verdicts = 2 * k, None, {}
+    while True:
+        if rayon_geo is None and len(bruts) >= k:
+            rayon_geo = rayon
+        proches = filtrer_vivants(bruts, verdicts)[:k]
+        epuise = len(bruts) < compte
+        if len(proches) >= k or (epuise and rayon >= RAYON_MAX_KM):
+            return proches, rayon_geo or rayon
+        if epuise:
+            rayon = min(rayon * 2, RAYON_MAX_KM)
+        else:
+            compte *= 2
+        bruts = r.geosearch(CLE_GLOBALE, longitude=lon, latitude=lat, radius=rayon, unit="km",
+                            sort="ASC", count=compte, withdist=True)
+
+def _envoyer_offres(candidats, annonce, transport):
+    """{courier_id: distance_m} par distance croissante -> les NB_CANDIDATS premiers notifiés.
+    Backpressure (streams) : on saute les livreurs dont la boîte a RETARD_MAX messages non traités ou plus."""
+    if transport == STREAMS and candidats:
+        with r.pipeline(transaction=False) as pipe:
+            for courier_id in candidats:
+                pipe.xlen(f"courier:{courier_id}:inbox")
+            retards = pipe.execute()
+        candidats = dict([c for c, retard in zip(candidats.items(), retards) if retard < RETARD_MAX][:NB_CANDIDATS])
+    if candidats:
+        gabarit = gabarit_offre(annonce, fenetre=duree_fenetre) # Corps encodé une fois, distance ajoutée par livreur
+        with etape("offres"), r.pipeline(transaction=False) as pipe:
+            for courier_id, distance_m in candidats.items():
+                envoyer(pipe, courier_id, encoder_offre(gabarit, distance_m), transport)
+            pipe.execute()
+    return candidats
+
+def creer_annonce(job_id):
+    """Tire un restaurant et un plat : (annonce, lon, lat), ou None si le restaurant n'a pas de position."""
     restaurant, menu = choisir_restaurant_et_menu()
-    
-    # 1. Récupérer la localisation du restaurant
     try:
         lon = float(restaurant["lon"])
         lat = float(restaurant["lat"])
     except (KeyError, ValueError):
         print(f"Erreur: Coordonnées manquantes/invalides pour {restaurant.get('name')}")
-        return None, [] # Annule cette course
+        return None
 
     annonce = {
         # ... (le dictionnaire 'annonce' reste identique) ...
@@ -35,128 +298,200 @@ def publier_annonce_geo():
         "reward": round(5 + random.random()*10, 2),
         "estimated_time": f"{random.randint(10,40)} min"
     }
-    r.hset(f"job:{job_id}", mapping=annonce)
-    print(f"[Manager] 📢 Annonce créée: {annonce['restaurant']} - {annonce['menu_item']}")
+    return annonce, lon, lat
+
+# MODIFIÉ: Écriture du job, recherche des livreurs et envoi des offres en un seul aller-retour
+def publier_annonce_geo(job_id=None, transport=TRANSPORT_DEFAUT):
+    global lua_disponible
+    # Le dispatcher asynchrone fournit son propre job_id pour inscrire
+    # l'attente d'acceptation AVANT l'envoi des offres
+    job_id = job_id or str(uuid.uuid4())
+    compter("courses")
 
-    # 2. --- MODIFICATION PRINCIPALE ICI ---
-    # Au lieu de chercher dans un rayon de 5km, on cherche
-    # les 5 livreurs les plus proches dans un rayon GÉANT de 1000km.
+    # 1. Restaurant, plat et localisation du restaurant
+    tirage = creer_annonce(job_id)
+    if tirage is None:
+        return None, [] # Annule cette course
+    annonce, lon, lat = tirage
+
+    # 2. Job + 5 plus proches + offres privées, en un pipeline (script de recherche)
+    rayon_depart = rayon_initial(lon, lat)
     try:
-        livreurs_proches = r.georadius(
-            "couriers:locations", 
-            lon, lat, 
-            1000, unit="km",  # 1. Rayon de recherche immense (1000 km)
-            withdist=True,    # 2. On veut la distance
-            sort="ASC",       # 3. On trie par distance (le plus proche en premier)
-            count=5           # 4. On ne prend que les 5 meilleurs
-        )
+        if lua_disponible:
+            try:
+                candidats_potentiels, rayon = _publier_lua(job_id, lon, lat, annonce, rayon_depart, transport)
+            except redis.exceptions.ResponseError as e:
+                print(f"[Manager] ⚠️ Script Lua indisponible ({e}), repli sur pipeline.")
+                lua_disponible = False
+        if not lua_disponible:
+            candidats_potentiels, rayon = _publier_pipeline(job_id, lon, lat, annonce, rayon_depart, transport)
     except redis.exceptions.ResponseError:
-        print("[Manager] ❌ Aucun livreur n'a encore transmis sa position (key 'couriers:locations' vide).")
+        print(f"[Manager] ❌ Aucun livreur n'a encore transmis sa position (key '{CLE_GLOBALE}' vide).")
         return job_id, []
-    # --- FIN DE LA MODIFICATION ---
+    memoriser_rayon(lon, lat, rayon_depart, rayon)
+
+    print(f"[Manager] 📢 Annonce créée: {annonce['restaurant']} - {annonce['menu_item']}")
         
-    if not livreurs_proches:
+    if not candidats_potentiels:
         # Cette erreur ne devrait (presque) plus jamais arriver, 
         # sauf si aucun livreur n'est lancé.
-        print("[Manager] ❌ Aucun livreur trouvé (la base 'couriers:locations' est vide ?).")
+        print(f"[Manager] ❌ Aucun livreur trouvé (la base '{CLE_GLOBALE}' est vide ?).")
+        compter("sans_livreur")
         return job_id, []
+    compter("offres", len(candidats_potentiels))
 
-    # 3. Publier l'offre en privé à chaque livreur
-    print(f"[Manager] 📡 Envoi d'offres à {len(livreurs_proches)} livreur(s) proche(s)...")
-    candidats_potentiels = {} # stocke {courier_id: distance}
-    
-    for item in livreurs_proches:
-        courier_id = item[0]
-        distance_km = item[1]
-        distance_m = round(distance_km * 1000, 2)
-        candidats_potentiels[courier_id] = distance_m
-        
-        # Le paquet de données envoyé au canal privé du livreur
-        payload = {
-            "type": "NEW_JOB_OFFER",
-            "distance": distance_m,
-            "annonce": annonce
-        }
-        
-        r.publish(f"courier:{courier_id}:notify", json.dumps(payload))
-        print(f"    -> Offre envoyée à {courier_id} (à {distance_m}m)")
+    print(f"[Manager] 📡 Offres envoyées à {len(candidats_potentiels)} livreur(s) proche(s) (rayon {rayon:g} km) :")
+    for courier_id, distance_m in candidats_potentiels.items():
+        print(f"    -> {courier_id} (à {distance_m}m)")
         
     return job_id, candidats_potentiels
 
-# MODIFIÉ: Attend les acceptations et choisit le plus proche
-def attendre_acceptation(job_id, candidats_potentiels, duree=10):
-    pubsub = r.pubsub()
-    pubsub.subscribe(f"jobs:{job_id}:accepts")
-    print(f"[Manager] En attente d'acceptations pour {job_id}...")
+@chronometre("offres")
+def publier_offres_ciblees(job_id, annonce, candidats, transport=TRANSPORT_DEFAUT):
+    """Écrit le job et envoie l'offre aux seuls livreurs désignés ({courier_id: distance_m}),
+    sans recherche géo : utilisé par le mode lots (dispatch_lots_redis.py)."""
+    with r.pipeline(transaction=False) as pipe:
+        preparer_offres_ciblees(pipe, job_id, annonce, candidats, transport)
+        pipe.execute()
+    compter("offres", len(candidats))
 
-    livreurs_acceptes = [] # Liste des {courier_id, distance}
-    start = time.time()
+def preparer_offres_ciblees(pipe, job_id, annonce, candidats, transport=TRANSPORT_DEFAUT):
+    """Met en pipeline (synchrone ou redis.asyncio) l'écriture du job et les offres ciblées."""
+    ecrire_job(pipe, job_id, annonce)
+    gabarit = gabarit_offre(annonce, fenetre=duree_fenetre)
+    for courier_id, distance_m in candidats.items():
+        envoyer(pipe, courier_id, encoder_offre(gabarit, distance_m), transport)
 
-    while time.time() - start < duree:
-        msg = pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
-        if msg is None:
+# MODIFIÉ: Attend les acceptations et ferme la fenêtre dès que le gagnant est connu
+# En transport "streams", les acceptations arrivées avant cet appel ne sont pas perdues
+@chronometre("attente_acceptation")
+def attendre_acceptation(job_id, candidats_potentiels, duree=10, politique=POLITIQUE_DEFAUT, transport=TRANSPORT_DEFAUT):
+    acceptations = ouvrir_acceptations(r, job_id, transport)
+    print(f"[Manager] En attente d'acceptations pour {job_id} (politique '{politique}', {transport})...")
+
+    resolution = ResolutionAcceptation(candidats_potentiels, politique, duree)
+
+    while not resolution.decide and resolution.temps_restant() > 0:
+        data = acceptations.lire(timeout=min(0.1, resolution.temps_restant()))
+        if data is None:
             continue
-            
-        data = json.loads(msg["data"])
+
         courier_id = data["courier_id"]
         
         # Vérifier si ce livreur était bien sur notre liste
         if courier_id in candidats_potentiels:
             distance = candidats_potentiels[courier_id] # On récupère la distance qu'on avait calculée
-            print(f"[Manager] 👍 Le livreur {courier_id} (à {distance}m) a accepté.")
-            livreurs_acceptes.append({"courier_id": courier_id, "distance": distance})
+            if data.get("status") == "DECLINED":
+                print(f"[Manager] 👎 Le livreur {courier_id} (à {distance}m) a refusé.")
+                resolution.refuser(courier_id)
+            else:
+                print(f"[Manager] 👍 Le livreur {courier_id} (à {distance}m) a accepté.")
+                resolution.accepter(courier_id)
         else:
              print(f"[Manager] ⚠️ {courier_id} a accepté, mais n'était pas ciblé. Ignoré.")
     
-    pubsub.close()
+    acceptations.fermer()
 
-    if not livreurs_acceptes:
+    gagnant = resolution.cloturer()
+    compter("attribuees" if gagnant else "sans_acceptation")
+    if gagnant is None:
         return None # Personne n'a accepté
 
-    # Tri des livreurs qui ont accepté par distance
-    livreurs_acceptes.sort(key=lambda x: x['distance'])
-    gagnant = livreurs_acceptes[0] # Le gagnant est le plus proche
-    
-    print(f"[Manager] Le plus proche des acceptants est {gagnant['courier_id']}.")
-    return gagnant["courier_id"]
+    print(f"[Manager] Gagnant retenu : {gagnant} (après {time.monotonic() - resolution.debut:.2f}s).")
+    return gagnant
+
 
+# --- Réservation atomique du gagnant ---
+# Plusieurs managers peuvent retenir le même livreur (il a accepté deux offres) : seul le premier
+# le fait passer de 'available' (aucun statut) à 'reserved'. KEYS[1] = {couriers}:status, ARGV[1] = id
+LUA_RESERVER = f"""
+local statut = redis.call('HGET', KEYS[1], ARGV[1])
+if statut and statut ~= '{DISPONIBLE}' then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], '{RESERVE}')
+return 1
+"""
+script_reserver = r.register_script(LUA_RESERVER)
+
+def reserver_livreur(courier_id):
+    """True si le livreur était disponible et vient d'être réservé, False s'il est déjà pris."""
+    if lua_disponible:
+        try:
+            return script_reserver(keys=[CLE_STATUTS], args=[courier_id]) == 1
+        except redis.exceptions.ResponseError as e:
+            print(f"[Manager] ⚠️ Script Lua indisponible ({e}), réservation en transaction.")
+    def reserver(pipe): # Repli sans Lua : WATCH/MULTI, rejoué si un statut change entre-temps
+        statut = pipe.hget(CLE_STATUTS, courier_id)
+        pipe.multi()
+        if statut not in (None, DISPONIBLE):
+            return False
+        pipe.hset(CLE_STATUTS, courier_id, RESERVE)
+        return True
+    return r.transaction(reserver, CLE_STATUTS, value_from_callable=True)
 
 # --- MODIFICATION: notifier_selection gère les gagnants et les perdants ---
 # On ajoute 'all_candidates_ids' (une liste des IDs de tous ceux qui ont reçu l'offre)
-def notifier_selection(job_id, courier_id, all_candidates_ids):
+# Sans gagnant, le job passe à EXPIRED. Dans les deux cas il reçoit un TTL court et part à l'archivage.
+# Le gagnant est d'abord réservé (reserver_livreur) : s'il est déjà pris par une autre course,
+# le job expire comme sans gagnant. Retourne le livreur assigné, ou None.
+def preparer_selection(pipe, job_id, courier_id, all_candidates_ids, transport=TRANSPORT_DEFAUT):
+    """Met en pipeline la fin du job et les messages (aussi pour un pipeline redis.asyncio) ;
+    retourne le nombre de perdants notifiés."""
     losers_notified = 0
-    
     # S'il y a un gagnant (courier_id n'est pas None)
     if courier_id:
         # 1. Notifier le GAGNANT
-        r.hset(f"job:{job_id}", mapping={"status":"ASSIGNED", "selected_courier": courier_id})
-        r.publish(f"courier:{courier_id}:notify", json.dumps({"type":"ASSIGNED", "job_id": job_id}))
-        print(f"[Manager] ✅ Course {job_id} attribuée à {courier_id}")
+        terminer_job(pipe, job_id, "ASSIGNED", courier_id)
+        envoyer(pipe, courier_id, encoder_assignation(job_id), transport)
+    else:
+        terminer_job(pipe, job_id, "EXPIRED")
 
-    # 2. Notifier les PERDANTS
+    # 2. Notifier les PERDANTS (même message pour tous : encodé une fois)
+    perte = encoder_perte(job_id)
     for candidate_id in all_candidates_ids:
         # Si ce n'est pas le gagnant (ou s'il n'y a pas de gagnant, on notifie tout le monde)
-        if candidate_id != courier_id: 
-            r.publish(
-                f"courier:{candidate_id}:notify", 
-                json.dumps({"type": "JOB_LOST", "job_id": job_id})
-            )
+        if candidate_id != courier_id:
+            envoyer(pipe, candidate_id, perte, transport)
             losers_notified += 1
-            
+    return losers_notified
+
+@chronometre("notification")
+def notifier_selection(job_id, courier_id, all_candidates_ids, transport=TRANSPORT_DEFAUT):
+    if courier_id and not reserver_livreur(courier_id):
+        print(f"[Manager] ⚠️ {courier_id} n'est plus disponible (déjà réservé) : course {job_id} expirée.")
+        compter("reservations_refusees")
+        courier_id = None
+
+    with r.pipeline(transaction=False) as pipe:
+        losers_notified = preparer_selection(pipe, job_id, courier_id, all_candidates_ids, transport)
+        pipe.execute()
+
+    if courier_id:
+        print(f"[Manager] ✅ Course {job_id} attribuée à {courier_id}")
     if losers_notified > 0:
         print(f"[Manager] 🔔 Notifié les {losers_notified} autres livreurs.")
+    return courier_id
 # --- FIN MODIFICATION ---
 
 
 # --- MAIN MODIFIÉ ---
 if __name__ == "__main__":
     MAX_COURSES = 5
+    politique = sys.argv[1] if len(sys.argv) > 1 else POLITIQUE_DEFAUT
+    transport = sys.argv[2] if len(sys.argv) > 2 else TRANSPORT_DEFAUT
+    if politique not in POLITIQUES or transport not in TRANSPORTS:
+        print(f"Usage: python manager_redis.py [{'|'.join(POLITIQUES)}] [{'|'.join(TRANSPORTS)}]")
+        sys.exit(1)
+    archiveur = Archiveur(r).demarrer() # Jobs terminés -> archives/jobs.jsonl.gz
+    balayeur = BalayeurRedis(r).demarrer() # Livreurs sans position récente -> retirés des index
+    metriques.demarrer(nom_processus="Manager") # Si METRIQUES=1 : /metrics + résumé périodique
     try:
         for i in range(MAX_COURSES):
             print(f"\n=== [Manager] 🚀 Course {i+1}/{MAX_COURSES} ===")
             
             # 'candidats_potentiels' est un dict {id: distance}
-            job_id, candidats_potentiels = publier_annonce_geo()
+            job_id, candidats_potentiels = publier_annonce_geo(transport=transport)
             
             if not candidats_potentiels:
                 print("[Manager] ❌ Échec de la création de course (pas de livreurs).")
@@ -164,22 +499,27 @@ if __name__ == "__main__":
                 continue
 
             # 'courier' est l'ID du gagnant (ou None)
-            courier = attendre_acceptation(job_id, candidats_potentiels, duree=10)
+            courier = attendre_acceptation(job_id, candidats_potentiels, duree=duree_fenetre, politique=politique, transport=transport)
             
             # --- MODIFICATION: On appelle notifier_selection dans tous les cas ---
             if courier:
                 # Cas 1: Il y a un gagnant
                 # On passe le gagnant et la liste de tous les IDs contactés
-                notifier_selection(job_id, courier, candidats_potentiels.keys())
+                notifier_selection(job_id, courier, candidats_potentiels.keys(), transport)
             else:
                 # Cas 2: Personne n'a accepté
                 print("[Manager] ❌ Aucun livreur n'a accepté cette course.")
-                r.hset(f"job:{job_id}", "status", "EXPIRED")
                 # On passe None comme gagnant, et la liste de tous les IDs contactés
-                notifier_selection(job_id, None, candidats_potentiels.keys())
+                notifier_selection(job_id, None, candidats_potentiels.keys(), transport)
             # --- FIN MODIFICATION ---
                 
             time.sleep(2) 
         print("\n[Manager] ✅ Fin du cycle de courses.")
     except KeyboardInterrupt:
         print("\n[Manager] Arrêt manuel.")
+    balayeur.arreter()
+    archiveur.arreter()
+    archiveur.afficher_rapport()
+    afficher_metriques()
+    if metriques.ACTIF:
+        metriques.afficher_resume("Manager")
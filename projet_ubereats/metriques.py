@@ -0,0 +1,205 @@
+# metriques.py
+# Chronométrage des étapes d'une course (catalogue, recherche géo, écriture du job, envoi des
+# offres, attente des acceptations, notification) et compteurs, dans des histogrammes à seaux
+# fixes (coût constant, mémoire bornée). Exposés en texte Prometheus (/metrics) et en JSON
+# (/metrics.json) sur un port local, et résumés périodiquement dans le log.
+# Désactivé par défaut : 'etape()' renvoie alors un contexte vide partagé et 'compter()' ne fait
+# rien. Activation : METRIQUES=1 (port METRIQUES_PORT, résumé toutes les METRIQUES_PERIODE s).
+#   curl -s localhost:9108/metrics
+import os, json, time, functools
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+ACTIF = os.getenv("METRIQUES", "0") == "1"
+PORT_DEFAUT = int(os.getenv("METRIQUES_PORT", "9108"))
+PERIODE_DEFAUT = float(os.getenv("METRIQUES_PERIODE", "30"))
+PREFIXE = "ubereats"
+
+# Bornes supérieures des seaux (s) : de 0,25 ms à 30 s, puis +Inf
+SEAUX = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogramme:
+    def __init__(self):
+        self.comptes = [0] * (len(SEAUX) + 1) # Dernier seau : au-delà de SEAUX[-1]
+        self.somme = 0.0
+        self.nombre = 0
+        self.verrou = Lock()
+
+    def observer(self, valeur):
+        i = bisect_left(SEAUX, valeur)
+        with self.verrou:
+            self.comptes[i] += 1
+            self.somme += valeur
+            self.nombre += 1
+
+    def quantile(self, q):
+        """Estimation par la borne supérieure du seau qui contient le q-ième quantile."""
+        rang = q * self.nombre
+        cumul = 0
+        for i, compte in enumerate(self.comptes):
+            cumul += compte
+            if compte and cumul >= rang:
+                return SEAUX[i] if i < len(SEAUX) else float("inf")
+        return 0.0
+
+    def resume(self):
+        with self.verrou:
+            return {
+                "nombre": self.nombre,
+                "somme_s": self.somme,
+                "moy_ms": self.somme / self.nombre * 1000 if self.nombre else 0.0,
+                "p50_ms": self.quantile(0.50) * 1000,
+                "p95_ms": self.quantile(0.95) * 1000,
+                "p99_ms": self.quantile(0.99) * 1000,
+            }
+
+
+_histogrammes = {} # étape -> Histogramme
+_compteurs = {} # nom -> entier
+_verrou = Lock()
+
+
+def observer(nom, secondes):
+    if not ACTIF:
+        return
+    histogramme = _histogrammes.get(nom)
+    if histogramme is None:
+        with _verrou:
+            histogramme = _histogrammes.setdefault(nom, Histogramme())
+    histogramme.observer(secondes)
+
+
+def compter(nom, n=1):
+    if not ACTIF:
+        return
+    with _verrou:
+        _compteurs[nom] = _compteurs.get(nom, 0) + n
+
+
+class _Chrono:
+    __slots__ = ("nom", "debut")
+
+    def __init__(self, nom):
+        self.nom = nom
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observer(self.nom, time.perf_counter() - self.debut)
+        return False
+
+
+class _Nul:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NUL = _Nul()
+
+
+def etape(nom):
+    """with etape("geo"): ... -> durée ajoutée à l'histogramme de l'étape (si activé)."""
+    return _Chrono(nom) if ACTIF else _NUL
+
+
+def chronometre(nom):
+    """Décorateur : durée de chaque appel dans l'étape 'nom'. Désactivé : fonction d'origine, sans enveloppe."""
+    def decorer(fonction):
+        if not ACTIF:
+            return fonction
+        @functools.wraps(fonction)
+        def chronometree(*args, **kwargs):
+            debut = time.perf_counter()
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                observer(nom, time.perf_counter() - debut)
+        return chronometree
+    return decorer
+
+
+# --- Export ---
+def instantane():
+    with _verrou:
+        histogrammes = dict(_histogrammes)
+        compteurs = dict(_compteurs)
+    return {"etapes": {nom: h.resume() for nom, h in sorted(histogrammes.items())}, "compteurs": compteurs}
+
+
+def texte_prometheus():
+    lignes = [f"# TYPE {PREFIXE}_etape_secondes histogram"]
+    with _verrou:
+        histogrammes = sorted(_histogrammes.items())
+        compteurs = sorted(_compteurs.items())
+    for nom, h in histogrammes:
+        with h.verrou:
+            comptes, somme, nombre = list(h.comptes), h.somme, h.nombre
+        cumul = 0
+        for borne, compte in zip((*SEAUX, "+Inf"), comptes):
+            cumul += compte
+            lignes.append(f'{PREFIXE}_etape_secondes_bucket{{etape="{nom}",le="{borne}"}} {cumul}')
+        lignes.append(f'{PREFIXE}_etape_secondes_sum{{etape="{nom}"}} {somme}')
+        lignes.append(f'{PREFIXE}_etape_secondes_count{{etape="{nom}"}} {nombre}')
+    for nom, valeur in compteurs:
+        lignes.append(f"# TYPE {PREFIXE}_{nom}_total counter")
+        lignes.append(f"{PREFIXE}_{nom}_total {valeur}")
+    return "\n".join(lignes) + "\n"
+
+
+class _Gestionnaire(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            corps, type_contenu = texte_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            corps, type_contenu = json.dumps(instantane()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        donnees = corps.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", type_contenu)
+        self.send_header("Content-Length", str(len(donnees)))
+        self.end_headers()
+        self.wfile.write(donnees)
+
+    def log_message(self, *args):
+        pass # Pas une ligne de log par requête de scraping
+
+
+def afficher_resume(nom_processus="Métriques"):
+    etat = instantane()
+    for nom, h in etat["etapes"].items():
+        print(f"[{nom_processus}] {nom:<20} n={h['nombre']:<7} moy {h['moy_ms']:8.2f} ms | "
+              f"p50 ≤{h['p50_ms']:.1f} p95 ≤{h['p95_ms']:.1f} p99 ≤{h['p99_ms']:.1f} ms")
+    if etat["compteurs"]:
+        print(f"[{nom_processus}] compteurs {etat['compteurs']}")
+
+
+def demarrer(port=PORT_DEFAUT, periode=PERIODE_DEFAUT, nom_processus="Métriques"):
+    """Serveur HTTP local et résumé périodique (threads démons) ; sans effet si désactivé."""
+    if not ACTIF:
+        return
+    try:
+        serveur = ThreadingHTTPServer(("127.0.0.1", port), _Gestionnaire)
+    except OSError as e:
+        print(f"[{nom_processus}] ⚠️ Port {port} indisponible ({e}), pas d'endpoint HTTP.")
+    else:
+        serveur.daemon_threads = True
+        Thread(target=serveur.serve_forever, daemon=True).start()
+        print(f"[{nom_processus}] 📈 http://127.0.0.1:{port}/metrics (et /metrics.json)")
+
+    def boucle():
+        while True:
+            time.sleep(periode)
+            afficher_resume(nom_processus)
+    if periode:
+        Thread(target=boucle, daemon=True).start()
@@ -0,0 +1,114 @@
+# offres_livreur.py
+# Offres côté livreur (livreur_redis.py, livreur_mongo.py) traitées sans bloquer l'écoute : chaque
+# offre reçoit un minuteur de réflexion et la boucle repart aussitôt lire les messages suivants
+# (autres offres, ASSIGNED, JOB_LOST / LOST / EXPIRED).
+#   - une réflexion en cours est annulée quand le résultat de la course arrive avant elle ;
+#   - une acceptation prête après la fenêtre de l'offre (annoncée par le manager, sinon
+#     FENETRE_OFFRE), comptée depuis la réception, n'est pas envoyée.
+# Bilan : acceptations gaspillées (refusées par le serveur, envoyées hors fenêtre en mode bloquant
+# ou, sans réponse du serveur comme en Redis, suivies de JOB_LOST), offres annulées / abandonnées,
+# et retard d'écoute (temps passé par la boucle sur un message, que subissent tous les messages
+# suivants). --bloquant sur les livreurs revient à l'ancienne réflexion dans la boucle, pour comparer.
+import random, threading, time
+from collections import Counter
+from contextlib import contextmanager
+
+FENETRE_OFFRE = 10 # s : fenêtre par défaut, pour une offre qui n'annonce pas la sienne (manager d'avant)
+
+
+class OffresEnAttente:
+    """'repondre(offre)' envoie l'acceptation ; elle peut retourner False si le serveur
+    la rejette (offre déjà close), ce qui compte une acceptation gaspillée. Si elle ne retourne
+    rien (pas de verdict : Pub/Sub, streams), l'acceptation est gaspillée quand annuler() suit."""
+
+    def __init__(self, repondre, reflexion=(0.5, 2.0), fenetre=FENETRE_OFFRE, bloquant=False):
+        self.repondre = repondre
+        self.reflexion = reflexion
+        self.fenetre = fenetre
+        self.bloquant = bloquant
+        self.verrou = threading.Lock()
+        self.minuteurs = {} # job_id -> threading.Timer de la réflexion en cours
+        self.sans_verdict = set() # Acceptations envoyées sans réponse du serveur, en attente du résultat
+        self.stats = Counter()
+        self.retard_total = 0.0
+        self.retard_max = 0.0
+
+    def _compter(self, cle):
+        with self.verrou:
+            self.stats[cle] += 1
+
+    def recevoir(self, job_id, offre, fenetre=None):
+        """Nouvelle offre : décision dans 'reflexion' s (dans la boucle en mode bloquant).
+        'fenetre' : celle annoncée par le manager dans l'offre, à défaut self.fenetre."""
+        self._compter("offres")
+        recue = time.monotonic()
+        fenetre = self.fenetre if fenetre is None else fenetre
+        delai = random.uniform(*self.reflexion)
+        if self.bloquant:
+            time.sleep(delai) # Ancien comportement : rien n'est lu pendant la réflexion
+            self._decider(job_id, offre, recue, fenetre)
+            return
+        minuteur = threading.Timer(delai, self._decider, (job_id, offre, recue, fenetre))
+        minuteur.daemon = True
+        with self.verrou:
+            self.minuteurs[job_id] = minuteur
+        minuteur.start()
+
+    def _decider(self, job_id, offre, recue, fenetre):
+        hors_fenetre = time.monotonic() - recue > fenetre
+        with self.verrou:
+            if not self.bloquant and self.minuteurs.pop(job_id, None) is None:
+                return # Annulée par annuler() pendant la réflexion
+            if not hors_fenetre:
+                # Avant l'envoi : un JOB_LOST lu pendant repondre() doit la trouver
+                self.sans_verdict.add(job_id)
+        if hors_fenetre and not self.bloquant:
+            self._compter("abandonnees")
+            print(f"[Offres] ⌛ Offre {job_id} abandonnée : fenêtre d'acceptation dépassée.")
+            return
+        self._compter("acceptations")
+        verdict = self.repondre(offre)
+        if verdict is not None:
+            with self.verrou:
+                self.sans_verdict.discard(job_id)
+        if verdict is False or hors_fenetre:
+            self._compter("gaspillees")
+
+    def annuler(self, job_id):
+        """Résultat reçu (JOB_LOST, LOST, EXPIRED) : abandonne la réflexion en cours, s'il y en a une.
+        Une acceptation déjà envoyée sans verdict du serveur n'a servi à rien : gaspillée."""
+        with self.verrou:
+            minuteur = self.minuteurs.pop(job_id, None)
+            envoyee = job_id in self.sans_verdict
+            self.sans_verdict.discard(job_id)
+        if envoyee:
+            self._compter("gaspillees")
+        if minuteur is None:
+            return False
+        minuteur.cancel()
+        self._compter("annulees")
+        return True
+
+    def attribuee(self, job_id):
+        """ASSIGNED reçu : l'acceptation envoyée pour ce job n'attend plus de résultat."""
+        with self.verrou:
+            self.sans_verdict.discard(job_id)
+
+    @contextmanager
+    def traitement(self):
+        """À placer autour du traitement de chaque message dans la boucle d'écoute."""
+        debut = time.monotonic()
+        try:
+            yield
+        finally:
+            duree = time.monotonic() - debut
+            with self.verrou:
+                self.stats["messages"] += 1
+                self.retard_total += duree
+                self.retard_max = max(self.retard_max, duree)
+
+    def bilan(self):
+        with self.verrou:
+            stats = dict(self.stats)
+            moyen = self.retard_total / max(1, self.stats["messages"])
+            return f"{stats} | retard d'écoute moyen {moyen * 1000:.1f}ms, max {self.retard_max * 1000:.1f}ms"
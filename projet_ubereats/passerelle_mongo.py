@@ -0,0 +1,211 @@
+# passerelle_mongo.py
+# Passerelle de change streams partagée : UN flux par collection (bids, jobs) pour tous
+# les livreurs, au lieu de 3 flux filtrés par livreur (3N curseurs côté serveur).
+# Les événements sont routés par targetCourier / selectedCourier vers des files en mémoire
+# (livreurs dans le même processus) ou vers une socket locale (livreur_mongo.py --passerelle).
+import os, json, time, queue, socketserver, argparse
+from threading import Thread, Lock
+from bson import json_util
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError, OperationFailure
+from pymongo.server_api import ServerApi
+from dotenv import load_dotenv
+
+PORT_DEFAUT = 7070
+FICHIER_JETONS = ".passerelle_jetons.json"
+
+# Codes Mongo quand le jeton de reprise n'est plus dans l'oplog
+JETON_PERIME = (260, 280, 286)
+
+# Champs réellement lus par les livreurs (livreur_mongo.py, flotte.py) : le $project final des
+# flux évite d'envoyer le reste du document (et les métadonnées du change stream)
+CHAMPS_OFFRE = ["_id", "job_id", "targetCourier", "status", "distance_m", "job"]
+CHAMPS_RESULTAT = ["_id", "job_id", "targetCourier", "status"]
+CHAMPS_ASSIGNATION = ["_id", "pickup", "dropoff", "selectedCourier", "status"]
+
+def projection(champs):
+    """$project d'un change stream : operationType + les champs utiles de fullDocument.
+    L'_id de l'événement (jeton de reprise) est conservé par défaut."""
+    return {"$project": {"operationType": 1, **{f"fullDocument.{champ}": 1 for champ in champs}}}
+
+# Les 2 anciens flux 'bids' d'un livreur (offres + résultats) fusionnés en un seul
+PIPELINE_BIDS = [
+    {"$match": {"$or": [
+        {"operationType": "insert", "fullDocument.status": "OFFERED"},
+        {"operationType": "update", "fullDocument.status": {"$in": ["LOST", "EXPIRED"]}},
+    ]}},
+    projection(sorted(set(CHAMPS_OFFRE) | set(CHAMPS_RESULTAT))),
+]
+PIPELINE_JOBS = [
+    {"$match": {"operationType": "update", "fullDocument.status": "ASSIGNED"}},
+    projection(CHAMPS_ASSIGNATION),
+]
+
+
+class Passerelle:
+    def __init__(self, db, fichier_jetons=FICHIER_JETONS):
+        self.db = db
+        self.abonnes = {} # courier_id -> [queue.Queue, ...]
+        self.verrou = Lock()
+        self.fichier_jetons = fichier_jetons
+        self.jetons = self._charger_jetons()
+        self.derniere_sauvegarde = 0.0
+        self.actif = False
+        self.threads = []
+        self.stats = {"evenements": 0, "livres": 0, "sans_abonne": 0, "reprises": 0}
+
+    # --- Abonnements ---
+    def abonner(self, courier_id, file=None):
+        """Retourne la file où arriveront les tuples (type, document) du livreur."""
+        file = file if file is not None else queue.Queue()
+        with self.verrou:
+            self.abonnes.setdefault(courier_id, []).append(file)
+        return file
+
+    def desabonner(self, courier_id, file):
+        with self.verrou:
+            files = self.abonnes.get(courier_id, [])
+            if file in files:
+                files.remove(file)
+            if not files:
+                self.abonnes.pop(courier_id, None)
+
+    def _livrer(self, courier_id, type_evt, doc):
+        self.stats["evenements"] += 1
+        with self.verrou:
+            files = list(self.abonnes.get(courier_id, ()))
+        if not files:
+            self.stats["sans_abonne"] += 1
+            return
+        for file in files:
+            file.put((type_evt, doc))
+        self.stats["livres"] += 1
+
+    # --- Routage ---
+    def _router_bids(self, change):
+        doc = change["fullDocument"]
+        if doc is None: # Document supprimé entre-temps
+            return
+        type_evt = "offre" if change["operationType"] == "insert" else "resultat"
+        self._livrer(doc["targetCourier"], type_evt, doc)
+
+    def _router_jobs(self, change):
+        doc = change["fullDocument"]
+        if doc is None:
+            return
+        self._livrer(doc["selectedCourier"], "assignation", doc)
+
+    # --- Jetons de reprise ---
+    def _charger_jetons(self):
+        if not self.fichier_jetons or not os.path.exists(self.fichier_jetons):
+            return {}
+        with open(self.fichier_jetons, encoding="utf-8") as f:
+            return json_util.loads(f.read())
+
+    def sauver_jetons(self, force=False):
+        # Au plus une écriture par seconde : le jeton en mémoire suffit pour une reprise à chaud
+        if not self.fichier_jetons or (not force and time.time() - self.derniere_sauvegarde < 1.0):
+            return
+        self.derniere_sauvegarde = time.time()
+        with open(self.fichier_jetons, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps(self.jetons))
+
+    def _surveiller(self, nom, collection, pipeline, router):
+        while self.actif:
+            try:
+                # max_await_time_ms : le flux rend la main régulièrement pour voir arreter()
+                with collection.watch(pipeline, full_document="updateLookup", max_await_time_ms=500,
+                                      resume_after=self.jetons.get(nom)) as stream:
+                    print(f"[Passerelle] 📡 Flux '{nom}' ouvert.")
+                    while self.actif:
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        router(change)
+                        self.jetons[nom] = stream.resume_token
+                        self.sauver_jetons()
+            except OperationFailure as e:
+                if e.code in JETON_PERIME:
+                    print(f"[Passerelle] ⚠️ Jeton de reprise '{nom}' périmé, reprise à partir de maintenant.")
+                    self.jetons.pop(nom, None)
+                else:
+                    print(f"[Passerelle] ⚠️ Flux '{nom}' en erreur ({e}), reprise dans 1s...")
+                    time.sleep(1)
+            except PyMongoError as e:
+                print(f"[Passerelle] ⚠️ Flux '{nom}' interrompu ({e}), reprise dans 1s...")
+                time.sleep(1)
+            else:
+                continue # Arrêt demandé
+            self.stats["reprises"] += 1
+
+    def demarrer(self):
+        self.actif = True
+        self.threads = [
+            Thread(target=self._surveiller, args=("bids", self.db.bids, PIPELINE_BIDS, self._router_bids), daemon=True),
+            Thread(target=self._surveiller, args=("jobs", self.db.jobs, PIPELINE_JOBS, self._router_jobs), daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def arreter(self):
+        """Ferme les deux flux (au plus max_await_time_ms d'attente) et sauve les jetons."""
+        self.actif = False
+        for thread in self.threads:
+            thread.join()
+        self.sauver_jetons(force=True)
+
+
+# --- Mode socket : un livreur_mongo.py par connexion ---
+class GestionnaireLivreur(socketserver.StreamRequestHandler):
+    """Protocole : le livreur envoie {"courier_id": ...}, puis reçoit une ligne JSON par événement."""
+
+    def handle(self):
+        try:
+            courier_id = json.loads(self.rfile.readline())["courier_id"]
+        except (ValueError, KeyError):
+            return
+        passerelle = self.server.passerelle
+        file = passerelle.abonner(courier_id)
+        print(f"[Passerelle] 🔌 Livreur {courier_id} connecté.")
+        try:
+            while True:
+                type_evt, doc = file.get()
+                self.wfile.write((json_util.dumps({"type": type_evt, "doc": doc}) + "\n").encode("utf-8"))
+        except OSError:
+            pass
+        finally:
+            passerelle.desabonner(courier_id, file)
+            print(f"[Passerelle] Livreur {courier_id} déconnecté.")
+
+
+class ServeurPasserelle(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, adresse, passerelle):
+        super().__init__(adresse, GestionnaireLivreur)
+        self.passerelle = passerelle
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Passerelle de change streams partagée pour les livreurs Mongo")
+    parser.add_argument("--port", type=int, default=PORT_DEFAUT)
+    parser.add_argument("--jetons", default=FICHIER_JETONS, help="Fichier des jetons de reprise")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1'))
+    passerelle = Passerelle(client.UberEats, args.jetons)
+    passerelle.demarrer()
+
+    serveur = ServeurPasserelle(("127.0.0.1", args.port), passerelle)
+    Thread(target=serveur.serve_forever, daemon=True).start()
+    print(f"[Passerelle] En écoute sur 127.0.0.1:{args.port}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[Passerelle] {len(passerelle.abonnes)} livreur(s) | {passerelle.stats}")
+    except KeyboardInterrupt:
+        passerelle.arreter()
+        print("\n[Passerelle] Arrêt manuel.")
@@ -0,0 +1,155 @@
+# politiques.py
+# Règles de clôture de la fenêtre d'acceptation, partagées par les managers Redis et Mongo.
+import time
+from collections import defaultdict, deque
+from threading import Lock
+
+PREMIER_ACCEPTE = "premier"    # Le premier qui accepte gagne
+PLUS_PROCHE = "plus_proche"    # Le mieux classé gagne dès que tous les plus proches ont refusé / expiré
+FENETRE_COMPLETE = "fenetre"   # Ancien comportement : le plus proche des acceptants en fin de fenêtre
+POLITIQUES = (PREMIER_ACCEPTE, PLUS_PROCHE, FENETRE_COMPLETE)
+
+# PLUS_PROCHE donne le même gagnant que FENETRE_COMPLETE, mais ferme la fenêtre plus tôt
+POLITIQUE_DEFAUT = PLUS_PROCHE
+
+
+class ResolutionAcceptation:
+    """Suit les réponses des livreurs ciblés et décide dès que le résultat est connu.
+
+    'candidats' est soit un dict {courier_id: distance}, soit une liste d'ids
+    déjà triée du plus proche au plus lointain. 'horloge' : horloge virtuelle du simulateur
+    (simulateur.py), sinon time.monotonic.
+    """
+
+    def __init__(self, candidats, politique=POLITIQUE_DEFAUT, duree=10, horloge=time.monotonic):
+        if politique not in POLITIQUES:
+            raise ValueError(f"Politique inconnue '{politique}' (choix: {', '.join(POLITIQUES)})")
+        if isinstance(candidats, dict):
+            self.rangs = sorted(candidats, key=candidats.get)
+        else:
+            self.rangs = list(candidats)
+        self.politique = politique
+        self.horloge = horloge
+        self.debut = horloge()
+        self.fin = self.debut + duree
+        self.acceptes = []   # Dans l'ordre d'arrivée
+        self.refus = set()
+        self.decide = False
+        self.gagnant = None
+        self._enregistre = False
+
+    def temps_restant(self):
+        return max(0.0, self.fin - self.horloge())
+
+    def accepter(self, courier_id):
+        if self.decide or courier_id not in self.rangs or courier_id in self.acceptes:
+            return False
+        self.acceptes.append(courier_id)
+        self._evaluer()
+        return True
+
+    def refuser(self, courier_id):
+        if self.decide or courier_id not in self.rangs:
+            return False
+        self.refus.add(courier_id)
+        self._evaluer()
+        return True
+
+    def _plus_proche_acceptant(self):
+        for courier_id in self.rangs:
+            if courier_id in self.acceptes:
+                return courier_id
+        return None
+
+    def _evaluer(self):
+        if self.politique == PREMIER_ACCEPTE and self.acceptes:
+            self._decider(self.acceptes[0])
+            return
+
+        if self.politique == PLUS_PROCHE:
+            for courier_id in self.rangs:
+                if courier_id in self.acceptes:
+                    self._decider(courier_id)
+                    return
+                if courier_id not in self.refus:
+                    break  # Un livreur plus proche n'a pas encore répondu
+
+        # Quelle que soit la politique : tout le monde a répondu, inutile d'attendre
+        if len(self.acceptes) + len(self.refus) >= len(self.rangs):
+            self._decider(self._plus_proche_acceptant())
+
+    def _decider(self, courier_id):
+        self.decide = True
+        self.gagnant = courier_id
+
+    def cloturer(self):
+        """Fin de fenêtre (ou décision anticipée) : retourne le gagnant ou None."""
+        if not self.decide:
+            # Les livreurs sans réponse sont considérés comme expirés
+            self._decider(self._plus_proche_acceptant())
+        if not self._enregistre:
+            self._enregistre = True
+            enregistrer_metrique(
+                self.politique,
+                self.horloge() - self.debut,
+                self.gagnant,
+                self.rangs[0] if self.rangs else None
+            )
+        return self.gagnant
+
+
+# --- Métriques par politique ---
+_verrou = Lock()
+_metriques = defaultdict(lambda: {
+    "courses": 0,
+    "attribuees": 0,
+    "plus_proche": 0,               # Le gagnant est le livreur ciblé le plus proche
+    "latences": deque(maxlen=10000) # Latence d'attribution (s), fenêtre glissante
+})
+
+
+def enregistrer_metrique(politique, latence, gagnant, plus_proche_cible):
+    with _verrou:
+        m = _metriques[politique]
+        m["courses"] += 1
+        if gagnant is not None:
+            m["attribuees"] += 1
+            m["latences"].append(latence)
+            if gagnant == plus_proche_cible:
+                m["plus_proche"] += 1
+
+
+def reinitialiser_metriques():
+    with _verrou:
+        _metriques.clear()
+
+
+def _percentile(valeurs_triees, p):
+    if not valeurs_triees:
+        return 0.0
+    index = min(len(valeurs_triees) - 1, int(round(p / 100 * (len(valeurs_triees) - 1))))
+    return valeurs_triees[index]
+
+
+def resume_metriques():
+    """Retourne {politique: {...}} avec latences (s) et taux de sélection du plus proche."""
+    resume = {}
+    with _verrou:
+        for politique, m in _metriques.items():
+            latences = sorted(m["latences"])
+            resume[politique] = {
+                "courses": m["courses"],
+                "attribuees": m["attribuees"],
+                "taux_plus_proche": m["plus_proche"] / m["attribuees"] if m["attribuees"] else 0.0,
+                "latence_moy": sum(latences) / len(latences) if latences else 0.0,
+                "latence_p50": _percentile(latences, 50),
+                "latence_p95": _percentile(latences, 95),
+            }
+    return resume
+
+
+def afficher_metriques():
+    for politique, m in resume_metriques().items():
+        print(f"[Métriques] Politique '{politique}': {m['attribuees']}/{m['courses']} attribuées | "
+              f"plus proche choisi {m['taux_plus_proche']:.0%} | "
+              f"latence moy {m['latence_moy']:.2f}s p50 {m['latence_p50']:.2f}s p95 {m['latence_p95']:.2f}s")
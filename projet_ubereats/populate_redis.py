@@ -1,87 +1,82 @@
 # populate_redis.py
-import os, csv, uuid, re
+# Chargement par lots : une seule lecture du CSV en continu (chargement_catalogue.lire_lots)
+# et un pipeline Redis par lot au lieu d'un aller-retour par commande.
+import os, sys, time
 import redis
-import random # --- AJOUT ---
+from catalogue import publier_invalidation, TOUT
+from chargement_catalogue import lire_lots, CSV_FILE, TAILLE_LOT
 
 r = redis.Redis(host="localhost", port=6379, decode_responses=True)
 
-CSV_FILE = "data/ubereats.csv"   # ton fichier Kaggle
-
-def _clean_price(raw):
-    """Transforme '15.99 USD' -> 15.99"""
-    if not raw:
-        return 0.0
-    s = str(raw)
-    match = re.findall(r"[0-9]+(?:[.,][0-9]+)?", s)
-    if not match:
-        return 0.0
-    return float(match[0].replace(",", "."))
-
-def populate(csv_file=CSV_FILE, limit=None):
-    if not os.path.exists(csv_file):
-        raise FileNotFoundError(f"{csv_file} introuvable")
 
+def preparer():
     # --- AJOUT: Nettoyage de la base Redis ---
     print("Nettoyage de la base Redis (FLUSHDB)...")
     r.flushdb()
-    # --- FIN AJOUT ---
 
-    with open(csv_file, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        count_rest = 0
-        count_menu = 0
-        
-        print(f"Début du chargement depuis {csv_file}...")
-        
-        for row in reader:
-            if limit and count_menu >= limit:
-                break
-            rid = row.get("restaurant_id")
-            if not rid:
-                continue
-                
-            rest_key = f"restaurant:{rid}"
 
-            # --- AJOUT: Insérer le restaurant (si nouveau) ---
-            if not r.exists(rest_key):
-                # --- AJOUT: Coordonnées Géo ---
-                lat = round(random.uniform(48.80, 48.90), 6)
-                lon = round(random.uniform(2.25, 2.45), 6)
-                # --- FIN AJOUT ---
-                
-                # Stocker restaurant minimal
-                r.hset(rest_key, mapping={
-                    "id": rid,
-                    "name": f"Restaurant {rid}",   # pas de vrai nom dispo
-                    "city": "Unknown",
-                    "cuisine": row.get("category", "General"),
-                    "lon": lon, # --- AJOUT ---
-                    "lat": lat  # --- AJOUT ---
-                })
-                r.sadd("restaurants:index", rest_key)
-                count_rest += 1
-            # --- FIN AJOUT ---
+def ecrire_lot(lot):
+    """Écrit un lot de restaurants et de menus en un seul aller-retour."""
+    with r.pipeline(transaction=False) as pipe:
+        for rest in lot["restaurants"]:
+            # Stocker restaurant minimal
+            pipe.hset(f"restaurant:{rest['id']}", mapping={
+                "id": rest["id"],
+                "name": f"Restaurant {rest['id']}",   # pas de vrai nom dispo
+                "city": "Unknown",
+                "cuisine": rest["cuisine"],
+                "lon": rest["lon"],
+                "lat": rest["lat"]
+            })
+        if lot["restaurants"]:
+            pipe.sadd("restaurants:index", *(f"restaurant:{rest['id']}" for rest in lot["restaurants"]))
 
-            # Créer un menu
-            menu_id = str(uuid.uuid4())
-            menu_key = f"menu:{menu_id}"
-            r.hset(menu_key, mapping={
-                "restaurant_id": rid,
-                "item": row.get("name", "Unknown"),
-                "category": row.get("category", "General"),
-                "description": row.get("description", ""),
-                "price": _clean_price(row.get("price")),
+        menus_par_restaurant = {}
+        for menu in lot["menus"]:
+            menu_key = f"menu:{menu['id']}"
+            pipe.hset(menu_key, mapping={
+                "restaurant_id": menu["restaurant_id"],
+                "item": menu["item"],
+                "category": menu["category"],
+                "description": menu["description"],
+                "price": menu["price"],
                 "currency": "USD"
             })
+            menus_par_restaurant.setdefault(menu["restaurant_id"], []).append(menu_key)
+
+        # Lier menus au restaurant : un SADD multi-membres par restaurant
+        for rid, menu_keys in menus_par_restaurant.items():
+            pipe.sadd(f"restaurant:{rid}:menus", *menu_keys)
+        pipe.execute()
+
+
+def finaliser():
+    # Pas d'index secondaire côté Redis. Les managers en cours rechargent le catalogue une seule
+    # fois, à la fin (un message par lot les ferait relire chaque restaurant et chaque menu écrit)
+    publier_invalidation(r, TOUT)
+
+
+def populate(csv_file=CSV_FILE, limit=None, taille_lot=TAILLE_LOT):
+    if not os.path.exists(csv_file):
+        raise FileNotFoundError(f"{csv_file} introuvable")
+
+    preparer()
+    print(f"Début du chargement depuis {csv_file}...")
+    debut = time.perf_counter()
+    count_rest = 0
+    count_menu = 0
+    for lot in lire_lots(csv_file, taille_lot, limit):
+        ecrire_lot(lot)
+        count_rest += len(lot["restaurants"])
+        count_menu += len(lot["menus"])
+        print(f"... {count_menu} menus insérés.")
+    finaliser()
+    duree = time.perf_counter() - debut
 
-            # Lier menu au restaurant
-            r.sadd(f"{rest_key}:menus", menu_key)
-            count_menu += 1
-            
-            if count_menu % 100 == 0:
-                print(f"... {count_menu} menus insérés.")
+    print(f"✅ Terminé. {count_rest} restaurants et {count_menu} menus insérés dans Redis "
+          f"en {duree:.1f}s ({count_menu / max(duree, 1e-9):.0f} lignes/s).")
 
-    print(f"✅ Terminé. {count_rest} restaurants et {count_menu} menus insérés dans Redis.")
 
 if __name__ == "__main__":
-    populate(limit=500)   # limite pour tester
+    # Tout le fichier par défaut ; 'python populate_redis.py 500' pour un test rapide
+    populate(limit=int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,130 @@
+# schema_mongo.py
+# Index de la base UberEats, créés en un seul endroit (au lancement du manager, après un
+# populate_mongo.py, ou à la main), et garde-fou sur les plans d'exécution des requêtes chaudes.
+#   - couriers : (status, location 2dsphere, updatedAt) pour le $geoNear "disponibles et vivants"
+#                du manager, qui remplace l'ancien index location_2dsphere (un $geoNear refuse de
+#                choisir entre deux index 2dsphere) ; updatedAt seul pour le balayeur (vivacite.py)
+#   - bids     : (job_id, targetCourier) pour les UpdateMany de notifier_selection et la reprise
+#   - jobs     : status pour la reprise des courses PENDING au démarrage du manager
+# Les change streams des livreurs (jobs.selectedCourier, bids.targetCourier) filtrent l'oplog :
+# aucun index de collection ne les accélère, on n'en crée donc pas pour eux.
+# creer_index est sans effet si les index existent : chaque point d'entrée Mongo (manager, livreur,
+# flotte, bancs d'essai) l'appelle au démarrage. Le manager refuse ensuite de démarrer si une requête
+# chaude fait un COLLSCAN (exiger_plans_indexes).
+#   python schema_mongo.py              # crée les index manquants
+#   python schema_mongo.py --verifier   # explain() de chaque requête chaude, échec sur COLLSCAN
+import os, sys
+from datetime import datetime
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
+
+INDEX = {
+    "couriers": [
+        IndexModel([("status", ASCENDING), ("location", GEOSPHERE), ("updatedAt", ASCENDING)]),
+        IndexModel([("updatedAt", ASCENDING)]),
+    ],
+    "bids": [IndexModel([("job_id", ASCENDING), ("targetCourier", ASCENDING)])],
+    "jobs": [IndexModel([("status", ASCENDING)])],
+    "restaurants": [IndexModel([("location", GEOSPHERE)])],
+    "menus": [IndexModel([("restaurant_id", ASCENDING)])],
+}
+
+# Index remplacés : supprimés s'ils existent encore (créés par d'anciennes versions)
+OBSOLETES = {"couriers": ["location_2dsphere"]}
+
+
+def creer_index(db, collections=None):
+    """Crée les index manquants (sans effet s'ils existent déjà) ; 'collections' restreint la liste."""
+    for nom in collections or INDEX:
+        collection = db[nom]
+        existants = collection.index_information()
+        for obsolete in OBSOLETES.get(nom, []):
+            if obsolete in existants:
+                collection.drop_index(obsolete)
+                print(f"[Schéma] Index {nom}.{obsolete} remplacé.")
+        collection.create_indexes(INDEX[nom])
+
+
+# --- Requêtes chaudes : mêmes filtres que manager_mongo, livreur_mongo et vivacite ---
+def _requetes_chaudes(db):
+    maintenant = datetime.utcnow()
+    job_id, courier_id = "job-explain", "c-explain"
+    return {
+        "couriers $geoNear disponibles": lambda: db.command("aggregate", "couriers", explain=True, pipeline=[
+            {"$geoNear": {"near": {"type": "Point", "coordinates": [2.35, 48.85]}, "distanceField": "distance_m",
+                          "query": {"status": "available", "updatedAt": {"$gte": maintenant}}, "spherical": True}},
+            {"$limit": 5},
+        ]),
+        "couriers balayage": lambda: db.command("explain", {"delete": "couriers", "deletes": [
+            {"q": {"updatedAt": {"$lt": maintenant}}, "limit": 0}]}, verbosity="queryPlanner"),
+        "bids notifier_selection": lambda: db.command("explain", {"update": "bids", "updates": [
+            {"q": {"job_id": job_id, "targetCourier": {"$in": [courier_id], "$ne": None}},
+             "u": {"$set": {"status": "LOST"}}, "multi": True}]}, verbosity="queryPlanner"),
+        "bids acceptation": lambda: db.command("explain", {"update": "bids", "updates": [
+            {"q": {"_id": job_id, "status": "OFFERED"}, "u": {"$set": {"status": "ACCEPTED"}}}]},
+            verbosity="queryPlanner"),
+        "bids reprise": lambda: db.bids.find({"job_id": job_id}, {"targetCourier": 1, "status": 1, "distance_m": 1})
+                                       .sort("distance_m", 1).explain(),
+        "jobs reprise": lambda: db.jobs.find({"status": "PENDING"}, {"_id": 1}).explain(),
+        "jobs notifier_selection": lambda: db.command("explain", {"update": "jobs", "updates": [
+            {"q": {"_id": job_id}, "u": {"$set": {"status": "EXPIRED"}}}]}, verbosity="queryPlanner"),
+    }
+
+
+def _etapes(plan):
+    """Toutes les valeurs 'stage' d'un plan (arbre de dicts et de listes)."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for valeur in plan.values():
+            yield from _etapes(valeur)
+    elif isinstance(plan, list):
+        for valeur in plan:
+            yield from _etapes(valeur)
+
+
+def _plans_retenus(explication):
+    """Sous-arbres 'winningPlan' (les plans rejetés peuvent contenir un COLLSCAN sans conséquence)."""
+    if isinstance(explication, dict):
+        for cle, valeur in explication.items():
+            if cle == "winningPlan":
+                yield valeur
+            else:
+                yield from _plans_retenus(valeur)
+    elif isinstance(explication, list):
+        for valeur in explication:
+            yield from _plans_retenus(valeur)
+
+
+def verifier_plans(db):
+    """explain() de chaque requête chaude ; retourne les noms de celles qui font un COLLSCAN."""
+    en_echec = []
+    for nom, expliquer in _requetes_chaudes(db).items():
+        etapes = [etape for plan in _plans_retenus(expliquer()) for etape in _etapes(plan)]
+        collscan = "COLLSCAN" in etapes
+        if collscan:
+            en_echec.append(nom)
+        print(f"[Schéma] {'❌' if collscan else '✅'} {nom:<28} {' > '.join(etapes) or '?'}")
+    return en_echec
+
+
+def exiger_plans_indexes(db):
+    """Échec immédiat (RuntimeError) si une requête chaude parcourt toute sa collection."""
+    en_echec = verifier_plans(db)
+    if en_echec:
+        raise RuntimeError(f"COLLSCAN sur : {', '.join(en_echec)} (index manquants ? cf. schema_mongo.INDEX)")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from pymongo.server_api import ServerApi
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1')).UberEats
+    creer_index(db)
+    print("[Schéma] Index en place.")
+    if "--verifier" in sys.argv:
+        en_echec = verifier_plans(db)
+        if en_echec:
+            print(f"[Schéma] ❌ COLLSCAN sur : {', '.join(en_echec)}")
+            sys.exit(1)
+        print("[Schéma] ✅ Aucune requête chaude ne parcourt toute sa collection.")
@@ -0,0 +1,319 @@
+# simulateur.py
+# Simulation à événements discrets du dispatch, sur une horloge virtuelle : une heure de trafic
+# se rejoue en quelques secondes, sans Redis ni MongoDB, pour dimensionner une flotte.
+# On garde la logique des managers et de la flotte :
+#   - les NB_CANDIDATS livreurs disponibles les plus proches (index_spatial.IndexSpatial en mémoire,
+#     à la place de GEOSEARCH / $geoNear) reçoivent l'offre ;
+#   - clôture de la fenêtre par politiques.ResolutionAcceptation (horloge virtuelle) ;
+#   - JOB_LOST aux perdants, livraison puis retour en 'available' du gagnant ;
+#   - mêmes réflexes que flotte.py (acceptation, refus, silence, refus si déjà en livraison).
+# Les événements d'entrée (livreurs en ligne, courses) viennent d'un journal JSONL, rejoué tel quel
+# (--journal) ou synthétique (arrivées de Poisson). Même graine => mêmes résultats.
+# --ecoute bloquante : chaque livreur traite ses messages un par un et réfléchit dans sa boucle
+# d'écoute (anciens livreur_*.py) ; concurrente : minuteurs, réflexion annulée par JOB_LOST et
+# acceptation hors fenêtre abandonnée (offres_livreur.py). Le bilan compte les acceptations
+# gaspillées (arrivées après la clôture) et le retard d'écoute des messages.
+#   python simulateur.py --livreurs 100 200 400 --debit 60 --duree 3600 [--ecoute bloquante concurrente]
+import argparse, gzip, heapq, itertools, json, random, time
+from collections import Counter
+
+from flotte import LivreurSimule
+from index_spatial import IndexSpatial
+from politiques import ResolutionAcceptation, POLITIQUE_DEFAUT, POLITIQUES, resume_metriques, reinitialiser_metriques
+
+NB_CANDIDATS = 5 # Comme manager_redis / manager_mongo
+LATENCE_RESEAU = 0.005 # s par message (offre, réponse, assignation, perte)
+ECOUTES = ("concurrente", "bloquante")
+
+
+class Horloge:
+    """Échéancier : tas de (instant, numéro, action, args) ; le temps saute d'un événement au suivant."""
+
+    def __init__(self):
+        self.instant = 0.0
+        self.tas = []
+        self.numeros = itertools.count() # Départage les événements simultanés : ordre de planification
+
+    def maintenant(self):
+        return self.instant
+
+    def planifier_a(self, instant, action, *args):
+        heapq.heappush(self.tas, (instant, next(self.numeros), action, args))
+
+    def planifier(self, delai, action, *args):
+        self.planifier_a(self.instant + delai, action, *args)
+
+    def executer(self, fin):
+        """Déroule les événements jusqu'à l'instant 'fin' ; retourne leur nombre."""
+        nombre = 0
+        while self.tas and self.tas[0][0] <= fin:
+            self.instant, _, action, args = heapq.heappop(self.tas)
+            action(*args)
+            nombre += 1
+        self.instant = fin
+        return nombre
+
+
+# --- Journaux d'événements (un document JSON par ligne, gzip si le nom finit par .gz) ---
+#   {"t": 0.0, "evt": "livreur", "courier_id": "sim0", "lon": 2.31, "lat": 48.85}
+#   {"t": 12.5, "evt": "course", "lon": 2.35, "lat": 48.86}
+def _ouvrir(fichier, mode):
+    return gzip.open(fichier, mode + "t", encoding="utf-8") if fichier.endswith(".gz") else open(fichier, mode, encoding="utf-8")
+
+
+def lire_journal(fichier):
+    with _ouvrir(fichier, "r") as f:
+        for ligne in f:
+            if ligne.strip():
+                yield json.loads(ligne)
+
+
+def ecrire_journal(fichier, evenements):
+    with _ouvrir(fichier, "w") as f:
+        for evt in evenements:
+            f.write(json.dumps(evt) + "\n")
+
+
+def journal_synthetique(nb_livreurs, debit, duree, graine=0, prefixe="sim"):
+    """Livreurs en ligne à t=0 puis courses en arrivées de Poisson ('debit' courses/min), autour de Paris."""
+    alea = random.Random(graine)
+    for i in range(nb_livreurs):
+        yield {"t": 0.0, "evt": "livreur", "courier_id": f"{prefixe}{i}",
+               "lon": round(alea.uniform(2.25, 2.45), 6), "lat": round(alea.uniform(48.80, 48.90), 6)}
+    t = alea.expovariate(debit / 60)
+    while t < duree:
+        yield {"t": round(t, 3), "evt": "course",
+               "lon": round(alea.uniform(2.25, 2.45), 6), "lat": round(alea.uniform(48.80, 48.90), 6)}
+        t += alea.expovariate(debit / 60)
+
+
+class Simulation:
+    def __init__(self, politique=POLITIQUE_DEFAUT, duree_fenetre=10, k=NB_CANDIDATS, p_accept=0.9, p_refus=0.05,
+                 reflexion=(0.5, 2.0), livraison=(8, 15), intervalle_gps=10, pas=0.001, latence=LATENCE_RESEAU,
+                 ecoute="concurrente", graine=0):
+        random.seed(graine) # LivreurSimule et les tirages ci-dessous utilisent le module random
+        self.horloge = Horloge()
+        self.index = IndexSpatial(source=self.horloge) # Vivacité jugée sur l'horloge virtuelle
+        self.politique = politique
+        self.duree_fenetre = duree_fenetre
+        self.k = k
+        self.p_accept = p_accept
+        self.p_refus = p_refus
+        self.reflexion = reflexion
+        self.livraison = livraison
+        self.intervalle_gps = intervalle_gps
+        self.pas = pas
+        self.latence = latence
+        self.ecoute = ecoute
+        self.livreurs = {}
+        self.libre_a = {} # Écoute bloquante : instant où chaque livreur relit ses messages
+        self.reflexions = set() # (courier_id, job_id) en cours de réflexion
+        self.retards_ecoute = [] # Attente de chaque message avant son traitement
+        self.courses = {} # job_id -> ResolutionAcceptation, tant que la fenêtre est ouverte
+        self.numeros = itertools.count()
+        self.occupation = [] # Part des livreurs en livraison, à chaque tick GPS
+        self.stats = Counter(dict.fromkeys(["courses", "attribuees", "expirees", "sans_livreur", "offres", "acceptations",
+                                            "refus", "ignorees", "reponses_tardives", "gaspillees", "annulees",
+                                            "abandonnees", "job_lost", "doubles_assignations", "livraisons"], 0))
+
+    def charger(self, evenements):
+        for evt in evenements:
+            if evt["evt"] == "livreur":
+                self.horloge.planifier_a(evt["t"], self._livreur_en_ligne, evt["courier_id"], evt["lon"], evt["lat"])
+            elif evt["evt"] == "course":
+                self.horloge.planifier_a(evt["t"], self._nouvelle_course, evt["lon"], evt["lat"])
+
+    # --- Livreurs ---
+    def _publier(self, livreur):
+        self.index.maj(livreur.id, livreur.lon, livreur.lat, self.horloge.maintenant(), not livreur.occupe)
+
+    def _livreur_en_ligne(self, courier_id, lon, lat):
+        livreur = LivreurSimule(courier_id)
+        livreur.lon, livreur.lat = lon, lat
+        self.livreurs[courier_id] = livreur
+        self._publier(livreur)
+
+    def _tick_gps(self):
+        for livreur in self.livreurs.values():
+            livreur.deplacer(self.pas)
+            self._publier(livreur)
+        if self.livreurs:
+            self.occupation.append(sum(l.occupe for l in self.livreurs.values()) / len(self.livreurs))
+        self.horloge.planifier(self.intervalle_gps, self._tick_gps)
+
+    def _decision(self, livreur):
+        """Même règle que Flotte.decision : 'accepte', 'refuse' ou None (offre laissée expirer)."""
+        if livreur.occupe:
+            return "refuse"
+        tirage = random.random()
+        if tirage < self.p_accept:
+            return "accepte"
+        if tirage < self.p_accept + self.p_refus:
+            return "refuse"
+        return None
+
+    def _livrer(self, livreur, traitement, action, *args):
+        """Message arrivé chez le livreur ; 'action' s'exécute après 'traitement' s. En écoute bloquante,
+        le message attend que les précédents soient traités et bloque les suivants pendant 'traitement'."""
+        arrivee = self.horloge.maintenant()
+        debut = arrivee
+        if self.ecoute == "bloquante":
+            debut = max(arrivee, self.libre_a.get(livreur.id, 0.0))
+            self.libre_a[livreur.id] = debut + traitement
+        self.retards_ecoute.append(debut - arrivee)
+        self.horloge.planifier_a(debut + traitement, action, *args)
+
+    def _offre_recue(self, livreur, job_id):
+        self.stats["offres"] += 1
+        self.reflexions.add((livreur.id, job_id))
+        self._livrer(livreur, random.uniform(*self.reflexion), self._reflexion_terminee,
+                     livreur, job_id, self.horloge.maintenant())
+
+    def _perte_recue(self, livreur, job_id):
+        self._livrer(livreur, 0.0, self._perte_traitee, livreur, job_id)
+
+    def _perte_traitee(self, livreur, job_id):
+        """JOB_LOST / EXPIRED lu : la réflexion en cours est annulée (écoute concurrente)."""
+        if self.ecoute == "concurrente" and (livreur.id, job_id) in self.reflexions:
+            self.reflexions.discard((livreur.id, job_id))
+            self.stats["annulees"] += 1
+
+    def _reflexion_terminee(self, livreur, job_id, recue):
+        if (livreur.id, job_id) not in self.reflexions:
+            return # Annulée par JOB_LOST
+        self.reflexions.discard((livreur.id, job_id))
+        if self.ecoute == "concurrente" and self.horloge.maintenant() - recue > self.duree_fenetre:
+            self.stats["abandonnees"] += 1
+            return
+        decision = self._decision(livreur)
+        if decision is None:
+            self.stats["ignorees"] += 1
+            return
+        self.stats["acceptations" if decision == "accepte" else "refus"] += 1
+        self.horloge.planifier(self.latence, self._reponse, job_id, livreur.id, decision == "accepte")
+
+    def _assignation(self, courier_id):
+        livreur = self.livreurs[courier_id]
+        if livreur.occupe: # A accepté deux offres et gagné les deux : la seconde course est perdue
+            self.stats["doubles_assignations"] += 1
+            return
+        livreur.occupe = True
+        self._publier(livreur) # 'on_delivery' : plus candidat
+        self.horloge.planifier(random.uniform(*self.livraison), self._fin_livraison, livreur)
+
+    def _fin_livraison(self, livreur):
+        livreur.occupe = False
+        self.stats["livraisons"] += 1
+        self._publier(livreur) # De nouveau 'available'
+
+    # --- Manager ---
+    def _nouvelle_course(self, lon, lat):
+        self.stats["courses"] += 1
+        candidats = dict(self.index.k_plus_proches([(lon, lat)], self.k)[0])
+        if not candidats:
+            self.stats["sans_livreur"] += 1
+            return
+        job_id = f"job{next(self.numeros)}"
+        self.courses[job_id] = ResolutionAcceptation(candidats, self.politique, self.duree_fenetre,
+                                                     horloge=self.horloge.maintenant)
+        for courier_id in candidats:
+            self.horloge.planifier(self.latence, self._offre_recue, self.livreurs[courier_id], job_id)
+        self.horloge.planifier(self.duree_fenetre, self._fin_fenetre, job_id)
+
+    def _reponse(self, job_id, courier_id, accepte):
+        resolution = self.courses.get(job_id)
+        if resolution is None:
+            self.stats["reponses_tardives"] += 1 # Fenêtre déjà close
+            if accepte:
+                self.stats["gaspillees"] += 1
+            return
+        if accepte:
+            resolution.accepter(courier_id)
+        else:
+            resolution.refuser(courier_id)
+        if resolution.decide:
+            self._clore(job_id)
+
+    def _fin_fenetre(self, job_id):
+        if job_id in self.courses:
+            self._clore(job_id)
+
+    def _clore(self, job_id):
+        """Même issue que notifier_selection : ASSIGNED au gagnant, JOB_LOST aux autres, ou EXPIRED."""
+        resolution = self.courses.pop(job_id)
+        gagnant = resolution.cloturer()
+        if gagnant:
+            self.stats["attribuees"] += 1
+            livreur = self.livreurs[gagnant]
+            self.horloge.planifier(self.latence, self._livrer, livreur, 0.0, self._assignation, gagnant)
+        else:
+            self.stats["expirees"] += 1
+        for courier_id in resolution.rangs:
+            if courier_id != gagnant:
+                self.stats["job_lost"] += 1
+                self.horloge.planifier(self.latence, self._perte_recue, self.livreurs[courier_id], job_id)
+
+    def executer(self, duree):
+        """Rejoue les événements chargés jusqu'à 'duree' s virtuelles ; retourne le bilan."""
+        reinitialiser_metriques()
+        self.horloge.planifier(self.intervalle_gps, self._tick_gps)
+        debut = time.perf_counter()
+        evenements = self.horloge.executer(duree)
+        mur = time.perf_counter() - debut
+        latences = resume_metriques().get(self.politique, {})
+        retards = sorted(self.retards_ecoute) or [0.0]
+        return {
+            "ecoute": self.ecoute,
+            "livreurs": len(self.livreurs),
+            "evenements": evenements,
+            "duree_mur_s": mur,
+            "acceleration": duree / mur if mur else float("inf"),
+            "occupation_moy": sum(self.occupation) / len(self.occupation) if self.occupation else 0.0,
+            "latence_p50": latences.get("latence_p50", 0.0),
+            "latence_p95": latences.get("latence_p95", 0.0),
+            "retard_ecoute_p95": retards[int(0.95 * (len(retards) - 1))],
+            "retard_ecoute_max": retards[-1],
+            **self.stats,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation accélérée du dispatch (horloge virtuelle, sans serveur)")
+    parser.add_argument("--livreurs", type=int, nargs="+", default=[200], help="Taille(s) de flotte à simuler")
+    parser.add_argument("--debit", type=float, default=60, help="Courses par minute (journal synthétique)")
+    parser.add_argument("--duree", type=float, default=3600, help="Durée simulée (s)")
+    parser.add_argument("--journal", help="Journal JSONL à rejouer (au lieu du journal synthétique)")
+    parser.add_argument("--enregistrer", help="Écrit le journal synthétique (pour le rejouer ensuite)")
+    parser.add_argument("--politique", choices=POLITIQUES, default=POLITIQUE_DEFAUT)
+    parser.add_argument("--fenetre", type=float, default=10, help="Fenêtre d'acceptation (s)")
+    parser.add_argument("--p-accept", type=float, default=0.9)
+    parser.add_argument("--p-refus", type=float, default=0.05)
+    parser.add_argument("--reflexion", type=float, nargs=2, default=(0.5, 2.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--livraison", type=float, nargs=2, default=(8, 15), metavar=("MIN", "MAX"))
+    parser.add_argument("--ecoute", choices=ECOUTES, nargs="+", default=["concurrente"],
+                        help="Écoute des livreurs (les deux : comparaison sur le même journal)")
+    parser.add_argument("--graine", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'livreurs':>8} | {'écoute':<11} | {'courses':>7} | {'attrib.':>7} | {'expir.':>6} | {'sans liv.':>9} | "
+          f"{'doubles':>7} | {'gasp.':>6} | {'p50 s':>5} | {'p95 s':>5} | {'retard p95':>10} | {'occup.':>6} | "
+          f"{'événements':>10} | {'accél.':>8}")
+    print("-" * 150)
+    for nb_livreurs in args.livreurs:
+        if args.journal:
+            evenements = list(lire_journal(args.journal))
+        else:
+            evenements = list(journal_synthetique(nb_livreurs, args.debit, args.duree, args.graine))
+            if args.enregistrer:
+                ecrire_journal(args.enregistrer, evenements)
+        for ecoute in args.ecoute:
+            simulation = Simulation(args.politique, args.fenetre, p_accept=args.p_accept, p_refus=args.p_refus,
+                                    reflexion=args.reflexion, livraison=args.livraison, ecoute=ecoute, graine=args.graine)
+            simulation.charger(evenements)
+            b = simulation.executer(args.duree)
+            print(f"{b['livreurs']:>8} | {ecoute:<11} | {b['courses']:>7} | {b['attribuees']:>7} | {b['expirees']:>6} | "
+                  f"{b['sans_livreur']:>9} | {b['doubles_assignations']:>7} | {b['gaspillees']:>6} | "
+                  f"{b['latence_p50']:>5.2f} | {b['latence_p95']:>5.2f} | {b['retard_ecoute_p95']:>9.2f}s | "
+                  f"{b['occupation_moy']:>6.0%} | {b['evenements']:>10} | {b['acceleration']:>7.0f}x")
+        if args.journal:
+            break # Le journal fixe la flotte : une seule taille
@@ -0,0 +1,147 @@
+# transport_redis.py
+# Deux transports pour les messages livreur <-> manager, au choix (REDIS_TRANSPORT dans le .env
+# ou en variable d'environnement) :
+#   - "pubsub"  : courier:{id}:notify et jobs:{id}:accepts en Pub/Sub (fire-and-forget),
+#   - "streams" : boîte courier:{id}:inbox lue en groupe de consommateurs (XREADGROUP COUNT/BLOCK,
+#                 XACK + XDEL), bornée par MAXLEN ; jobs:{id}:accepts devient un stream lu par
+#                 XREAD depuis le début, donc aucune acceptation n'est perdue avant la lecture.
+# Un livreur qui se reconnecte retrouve ses messages non acquittés ; un livreur dont la boîte
+# dépasse RETARD_MAX messages non traités ne reçoit plus de nouvelles offres (backpressure).
+import os
+import redis
+from codec import decoder
+
+PUBSUB = "pubsub"
+STREAMS = "streams"
+TRANSPORTS = (PUBSUB, STREAMS)
+TRANSPORT_DEFAUT = os.getenv("REDIS_TRANSPORT", PUBSUB)
+
+GROUPE = "livreur"
+MAXLEN_BOITE = 100 # Messages gardés par boîte (trim approximatif, O(1) amorti)
+RETARD_MAX = 20 # Messages non traités au-delà desquels un livreur ne reçoit plus d'offres
+TTL_ACCEPTS = 600 # s : le stream d'acceptations d'un job disparaît de lui-même
+
+
+def canal_livreur(courier_id):
+    return f"courier:{courier_id}:notify"
+
+
+def boite_livreur(courier_id):
+    return f"courier:{courier_id}:inbox"
+
+
+def canal_acceptations(job_id):
+    return f"jobs:{job_id}:accepts"
+
+
+def envoyer(client, courier_id, message, transport=TRANSPORT_DEFAUT):
+    """Message encodé (str, cf. codec.py) vers un livreur ; 'client' peut être un pipeline."""
+    if transport == STREAMS:
+        client.xadd(boite_livreur(courier_id), {"data": message}, maxlen=MAXLEN_BOITE, approximate=True)
+    else:
+        client.publish(canal_livreur(courier_id), message)
+
+
+def repondre(client, canal, message, transport=TRANSPORT_DEFAUT):
+    """Réponse d'un livreur (cf. livreur_redis.reponse_offre) ; 'client' peut être un pipeline."""
+    if transport == STREAMS:
+        client.xadd(canal, {"data": message})
+        client.expire(canal, TTL_ACCEPTS)
+    else:
+        client.publish(canal, message)
+
+
+def _decoder(data, origine):
+    """Message décodé, ou None si mal formé (journalisé puis ignoré, comme une trame perdue)."""
+    try:
+        return decoder(data)
+    except ValueError as e:
+        print(f"[Transport] ⚠️ Message illisible sur {origine} ({e}). Ignoré.")
+        return None
+
+
+def ecouter_livreur(client, courier_id, transport=TRANSPORT_DEFAUT, count=10, block_ms=5000):
+    """Génère les messages (dict, cf. codec.decoder) d'un livreur.
+
+    En mode streams, un message n'est acquitté (XACK) et supprimé (XDEL) qu'une fois traité,
+    c.-à-d. quand la boucle de l'appelant revient chercher le suivant.
+    """
+    if transport != STREAMS:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(canal_livreur(courier_id))
+        for msg in pubsub.listen():
+            if msg["type"] == "message":
+                message = _decoder(msg["data"], msg["channel"])
+                if message is not None:
+                    yield message
+        return
+
+    boite = boite_livreur(courier_id)
+    try:
+        # Depuis "0" : ce qui a été envoyé avant la création du groupe est aussi livré
+        client.xgroup_create(boite, GROUPE, id="0", mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    dernier = "0" # D'abord les messages reçus mais pas acquittés (reconnexion), puis les nouveaux
+    while True:
+        reponse = client.xreadgroup(GROUPE, courier_id, {boite: dernier}, count=count, block=block_ms)
+        messages = reponse[0][1] if reponse else []
+        if dernier == "0" and not messages:
+            dernier = ">"
+            continue
+        for message_id, champs in messages:
+            message = _decoder(champs["data"], boite)
+            if message is not None:
+                yield message
+            # Acquitté même s'il est illisible : sinon il serait relivré à chaque reconnexion
+            with client.pipeline(transaction=False) as pipe:
+                pipe.xack(boite, GROUPE, message_id)
+                pipe.xdel(boite, message_id) # XLEN = retard du livreur (lu par la backpressure)
+                pipe.execute()
+
+
+class AcceptationsPubSub:
+    """Abonnement au canal d'acceptations d'un job, ouvert pour la durée de la fenêtre."""
+
+    def __init__(self, client, job_id):
+        self.pubsub = client.pubsub()
+        self.pubsub.subscribe(canal_acceptations(job_id))
+
+    def lire(self, timeout):
+        msg = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return _decoder(msg["data"], msg["channel"]) if msg else None
+
+    def fermer(self):
+        self.pubsub.close()
+
+
+class AcceptationsStreams:
+    """Lecture du stream d'acceptations d'un job depuis le début : pas d'abonnement à créer."""
+
+    def __init__(self, client, job_id, count=10):
+        self.client = client
+        self.cle = canal_acceptations(job_id)
+        self.count = count
+        self.dernier = "0"
+        self.en_attente = []
+
+    def lire(self, timeout):
+        if not self.en_attente:
+            reponse = self.client.xread({self.cle: self.dernier}, count=self.count,
+                                        block=max(1, int(timeout * 1000)))
+            if not reponse:
+                return None
+            self.en_attente = reponse[0][1]
+            self.dernier = self.en_attente[-1][0]
+        _, champs = self.en_attente.pop(0)
+        return _decoder(champs["data"], self.cle)
+
+    def fermer(self):
+        self.client.delete(self.cle) # Une acceptation tardive le recrée, avec TTL_ACCEPTS
+
+
+def ouvrir_acceptations(client, job_id, transport=TRANSPORT_DEFAUT):
+    if transport == STREAMS:
+        return AcceptationsStreams(client, job_id)
+    return AcceptationsPubSub(client, job_id)
@@ -0,0 +1,118 @@
+# vivacite.py
+# Balayage des livreurs morts (processus arrêté sans se désinscrire) :
+#   - Redis : les livreurs dont le dernier battement ({couriers}:heartbeat, écrit avec chaque
+#     position par zones.LUA_POSITIONS) date de plus de TTL_VIVANT s sont retirés de l'index
+#     global, de leur zone, des battements et des statuts (script zones.LUA_BALAYER, par lots) ;
+#   - Mongo : les documents 'couriers' dont 'updatedAt' date de plus de TTL_VIVANT s sont
+#     supprimés (le prochain publier_position d'un livreur revenu le recrée en 'available').
+# Entre deux passages, les recherches des managers ignorent déjà ces livreurs : le balayeur
+# ne fait que libérer la place dans les index.
+#   python vivacite.py redis|mongo      # balayeur seul, en processus séparé
+import sys, time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from threading import Thread, Event
+
+from zones import LUA_BALAYER, CLES_POSITIONS, TTL_VIVANT
+
+PERIODE_BALAYAGE = 5 # s
+
+
+def limite_mongo(ttl=TTL_VIVANT):
+    """Filtre 'updatedAt' des livreurs vivants (mêmes horloges que livreur_mongo.publier_position)."""
+    return {"$gte": datetime.utcnow() - timedelta(seconds=ttl)}
+
+
+class Balayeur(ABC):
+    """Thread qui appelle 'balayer()' toutes les 'periode' secondes (cf. cycle_jobs.Archiveur)."""
+
+    nom = "Balayeur"
+
+    def __init__(self, ttl=TTL_VIVANT, periode=PERIODE_BALAYAGE):
+        self.ttl = ttl
+        self.periode = periode
+        self.fin = Event()
+        self.thread = None
+        self.stats = {"retires": 0, "passages": 0, "erreurs": 0}
+
+    @abstractmethod
+    def balayer(self):
+        """Retire les livreurs morts ; retourne leur nombre."""
+
+    def _boucle(self):
+        while not self.fin.wait(self.periode):
+            try:
+                retires = self.balayer()
+            except Exception as e:
+                self.stats["erreurs"] += 1
+                print(f"[{self.nom}] ⚠️ {e}")
+                continue
+            self.stats["passages"] += 1
+            if retires:
+                self.stats["retires"] += retires
+                print(f"[{self.nom}] 🧹 {retires} livreur(s) sans position depuis {self.ttl}s retiré(s).")
+
+    def demarrer(self):
+        self.thread = Thread(target=self._boucle, daemon=True)
+        self.thread.start()
+        return self
+
+    def arreter(self):
+        self.fin.set()
+        if self.thread:
+            self.thread.join()
+
+
+class BalayeurRedis(Balayeur):
+    nom = "Balayeur Redis"
+
+    def __init__(self, client, taille_lot=1000, **kwargs):
+        super().__init__(**kwargs)
+        self.script = client.register_script(LUA_BALAYER)
+        self.taille_lot = taille_lot
+
+    def balayer(self):
+        total = 0
+        while True: # Par lots : le script ne bloque jamais Redis longtemps
+            morts = self.script(keys=CLES_POSITIONS, args=[self.ttl, self.taille_lot])
+            total += len(morts)
+            if len(morts) < self.taille_lot:
+                return total
+
+
+class BalayeurMongo(Balayeur):
+    nom = "Balayeur Mongo"
+
+    def __init__(self, collection, **kwargs):
+        super().__init__(**kwargs)
+        self.collection = collection # Index updatedAt : schema_mongo.py (le balayage ne lit que les périmés)
+
+    def balayer(self):
+        limite = datetime.utcnow() - timedelta(seconds=self.ttl)
+        return self.collection.delete_many({"updatedAt": {"$lt": limite}}).deleted_count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("redis", "mongo"):
+        print("Usage: python vivacite.py redis|mongo")
+        sys.exit(1)
+    if sys.argv[1] == "redis":
+        import redis
+        balayeur = BalayeurRedis(redis.Redis(host="localhost", port=6379, decode_responses=True))
+    else:
+        import os
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+        from pymongo.server_api import ServerApi
+        load_dotenv()
+        client = MongoClient(os.getenv("MONGODB_URI"), server_api=ServerApi('1'))
+        balayeur = BalayeurMongo(client.UberEats.couriers)
+    balayeur.demarrer()
+    print(f"[{balayeur.nom}] Livreurs sans position depuis {TTL_VIVANT}s retirés toutes les {PERIODE_BALAYAGE}s...")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"[{balayeur.nom}] {balayeur.stats}")
+    except KeyboardInterrupt:
+        balayeur.arreter()
+        print(f"\n[{balayeur.nom}] Arrêt manuel. {balayeur.stats}")
@@ -0,0 +1,164 @@
+# zones.py
+# Découpage de la ville en zones (grille de TAILLE_ZONE degrés) pour le dispatch multi-workers.
+# Chaque zone a son propre index GEO Redis ({couriers}:locations:{ix}:{iy}) en plus de l'index
+# global {couriers}:locations : une recherche près d'un restaurant n'interroge que les 9 zones
+# qui l'entourent tant que le rayon reste dans ce bloc, puis retombe sur l'index global.
+# Chaque écriture de position sert aussi de battement de cœur ({couriers}:heartbeat) : un livreur
+# sans position depuis TTL_VIVANT secondes est ignoré par la recherche, puis retiré de tous les
+# index par le balayeur (vivacite.py).
+# Statut des livreurs ({couriers}:status) : seuls les livreurs pris y figurent, 'reserved' (réservé
+# par un manager, cf. manager_redis.notifier_selection) puis 'on_delivery' ; un livreur absent
+# du hash est 'available'. Les recherches ne proposent des courses qu'aux livreurs disponibles.
+# Redis Cluster : toutes ces clés portent l'étiquette {couriers} et tombent dans le même slot. Les
+# scripts reçoivent les clés fixes dans KEYS ; les clés de zone en découlent (l'ancienne zone d'un
+# livreur n'est connue qu'en lisant {couriers}:zone dans le script) et restent dans ce slot.
+import math
+
+ETIQUETTE = "{couriers}" # Hash tag Redis Cluster commun à l'état des livreurs
+TAILLE_ZONE = 0.05 # degrés : ~5,5 km nord-sud, ~3,7 km est-ouest à Paris
+CLE_GLOBALE = f"{ETIQUETTE}:locations"
+CLE_ZONES_LIVREURS = f"{ETIQUETTE}:zone" # courier_id -> zone courante (pour le retirer de l'ancienne)
+CLE_BATTEMENTS = f"{ETIQUETTE}:heartbeat" # courier_id -> dernière position reçue (s, horloge Redis)
+TTL_VIVANT = 30 # s sans position avant qu'un livreur soit considéré mort (3 ticks GPS de 10 s)
+CLE_STATUTS = f"{ETIQUETTE}:status" # courier_id -> 'reserved' | 'on_delivery' (absent = 'available')
+DISPONIBLE, RESERVE, EN_LIVRAISON = "available", "reserved", "on_delivery"
+MARGE = 0.95 # Écart entre la distance calculée ici et celle de GEOSEARCH (sphère de Redis)
+KM_PAR_DEGRE = 111.0
+
+
+def zone_de(lon, lat):
+    return (math.floor(float(lon) / TAILLE_ZONE), math.floor(float(lat) / TAILLE_ZONE))
+
+
+def nom_zone(zone):
+    return f"{zone[0]}:{zone[1]}"
+
+
+def cle_zone(zone):
+    return f"{CLE_GLOBALE}:{nom_zone(zone)}"
+
+
+def voisinage(lon, lat):
+    """Clés des 9 zones autour du point et rayon (km) jusqu'auquel elles suffisent :
+    au-delà, un livreur plus proche pourrait se trouver hors du bloc."""
+    lon, lat = float(lon), float(lat)
+    ix, iy = zone_de(lon, lat)
+    cles = [cle_zone((ix + dx, iy + dy)) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    ouest, est = (ix - 1) * TAILLE_ZONE, (ix + 2) * TAILLE_ZONE
+    sud, nord = (iy - 1) * TAILLE_ZONE, (iy + 2) * TAILLE_ZONE
+    km_lon = KM_PAR_DEGRE * math.cos(math.radians(min(89.0, max(abs(sud), abs(nord)))))
+    couverture = min((lon - ouest) * km_lon, (est - lon) * km_lon,
+                     (lat - sud) * KM_PAR_DEGRE, (nord - lat) * KM_PAR_DEGRE)
+    return cles, round(couverture * MARGE, 3)
+
+
+# --- Écriture des positions : index global + index de zone + battement, en un seul appel ---
+# KEYS[1] = {couriers}:locations (et préfixe des zones), KEYS[2] = {couriers}:zone,
+# KEYS[3] = {couriers}:heartbeat (KEYS[4] = {couriers}:status, inutilisé ici : mêmes clés que LUA_BALAYER)
+# ARGV = id, lon, lat, zone, id, lon, lat, zone, ... (un livreur au plus une fois par appel)
+# Commandes multi-membres : un HMGET des anciennes zones, un GEOADD global, un GEOADD par zone
+# touchée, un ZREM par zone quittée, un HSET et un ZADD pour tout le lot. unpack() de Lua est
+# borné (~8000 valeurs) : au plus MEMBRES_MAX_POSITIONS livreurs par appel.
+MEMBRES_MAX_POSITIONS = 2000
+LUA_POSITIONS = """
+local maintenant = redis.call('TIME')[1]
+local ids, globale, battements, ajouts = {}, {}, {}, {}
+for i = 1, #ARGV, 4 do
+    local courier_id, lon, lat, zone = ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3]
+    ids[#ids + 1] = courier_id
+    local n = #globale
+    globale[n + 1], globale[n + 2], globale[n + 3] = lon, lat, courier_id
+    n = #battements
+    battements[n + 1], battements[n + 2] = maintenant, courier_id
+    local membres = ajouts[zone]
+    if not membres then
+        membres = {}
+        ajouts[zone] = membres
+    end
+    n = #membres
+    membres[n + 1], membres[n + 2], membres[n + 3] = lon, lat, courier_id
+end
+if #ids == 0 then
+    return 0
+end
+local anciennes = redis.call('HMGET', KEYS[2], unpack(ids))
+local retraits, changements = {}, {}
+for j, courier_id in ipairs(ids) do
+    local ancienne, zone = anciennes[j], ARGV[4 * j]
+    if ancienne ~= zone then
+        if ancienne then
+            local quittes = retraits[ancienne]
+            if not quittes then
+                quittes = {}
+                retraits[ancienne] = quittes
+            end
+            quittes[#quittes + 1] = courier_id
+        end
+        changements[#changements + 1] = courier_id
+        changements[#changements + 1] = zone
+    end
+end
+for ancienne, quittes in pairs(retraits) do
+    redis.call('ZREM', KEYS[1] .. ':' .. ancienne, unpack(quittes))
+end
+if #changements > 0 then
+    redis.call('HSET', KEYS[2], unpack(changements))
+end
+redis.call('GEOADD', KEYS[1], unpack(globale))
+for zone, membres in pairs(ajouts) do
+    redis.call('GEOADD', KEYS[1] .. ':' .. zone, unpack(membres))
+end
+redis.call('ZADD', KEYS[3], unpack(battements))
+return #ids
+"""
+CLES_POSITIONS = [CLE_GLOBALE, CLE_ZONES_LIVREURS, CLE_BATTEMENTS, CLE_STATUTS]
+
+# --- Balayage : retire des index les livreurs sans battement depuis ARGV[1] s ---
+# Mêmes KEYS que LUA_POSITIONS ; ARGV[2] = nombre max de livreurs retirés par appel
+LUA_BALAYER = """
+local limite = tonumber(redis.call('TIME')[1]) - tonumber(ARGV[1])
+local morts = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', '(' .. limite, 'LIMIT', 0, tonumber(ARGV[2]))
+for _, courier_id in ipairs(morts) do
+    local zone = redis.call('HGET', KEYS[2], courier_id)
+    if zone then
+        redis.call('ZREM', KEYS[1] .. ':' .. zone, courier_id)
+    end
+    redis.call('ZREM', KEYS[1], courier_id)
+    redis.call('HDEL', KEYS[2], courier_id)
+    redis.call('ZREM', KEYS[3], courier_id)
+    redis.call('HDEL', KEYS[4], courier_id)
+end
+return morts
+"""
+
+
+def args_positions(positions):
+    """[(courier_id, lon, lat), ...] -> ARGV de LUA_POSITIONS"""
+    args = []
+    for courier_id, lon, lat in positions:
+        args += [courier_id, lon, lat, nom_zone(zone_de(lon, lat))]
+    return args
+
+
+def changer_statut(client, courier_id, status):
+    """Statut d'un livreur ; 'client' peut être un pipeline. 'available' efface l'entrée."""
+    if status == DISPONIBLE:
+        return client.hdel(CLE_STATUTS, courier_id)
+    return client.hset(CLE_STATUTS, courier_id, status)
+
+
+def retirer_livreurs(client, courier_ids):
+    """Retire des livreurs de l'index global, de leur zone, des battements et des statuts."""
+    courier_ids = list(courier_ids)
+    if not courier_ids:
+        return
+    zones = client.hmget(CLE_ZONES_LIVREURS, courier_ids)
+    with client.pipeline(transaction=False) as pipe:
+        pipe.zrem(CLE_GLOBALE, *courier_ids)
+        for courier_id, zone in zip(courier_ids, zones):
+            if zone:
+                pipe.zrem(f"{CLE_GLOBALE}:{zone}", courier_id)
+        pipe.hdel(CLE_ZONES_LIVREURS, *courier_ids)
+        pipe.zrem(CLE_BATTEMENTS, *courier_ids)
+        pipe.hdel(CLE_STATUTS, *courier_ids)
+        pipe.execute()